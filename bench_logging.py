@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Замер стоимости логирования на одно сообщение в обработчиках бота.
+
+Воспроизводит записи, которые делает бот на одно сообщение группы (получение,
+постановка в очередь, список сотрудников) и на одно личное сообщение (пересылка):
+  - "до": f-строки на уровне INFO, синхронная запись в файл (logging.basicConfig);
+  - "после": config.log_setup - отладочные записи с ленивыми полями, запись в потоке.
+
+Сравниваются прогоны с одинаковым результатом в логе:
+  - "все записи пишутся": "до" на уровне INFO, "после" на уровне DEBUG;
+  - "записи отключены": "до" на уровне WARNING, "после" на уровне INFO.
+Вызываются только сами записи в лог, без остального кода обработчиков, поэтому
+цифры - стоимость логирования, а не время обработки сообщения.
+Печатает процессорное время потока обработчика и полное время на сообщение.
+
+    python bench_logging.py [--messages 20000] [--employees 30]
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from config.log_setup import setup_logging, stop_logging, fields
+
+logger = logging.getLogger("bot.main")
+forward_logger = logger.getChild("forward")
+
+
+def make_message(index: int) -> SimpleNamespace:
+    user = SimpleNamespace(id=1000 + index % 500, full_name=f"Клиент {index % 500}", username=None)
+    return SimpleNamespace(
+        message_id=index,
+        chat=SimpleNamespace(id=-100123456, title="Группа поддержки", type="supergroup"),
+        from_user=user,
+        text=f"Здравствуйте, подскажите пожалуйста по заказу №{index}" * 3,
+        forward_from=user,
+        forward_from_chat=None,
+        forward_sender_name=None,
+        forward_from_message_id=None,
+        forward_date=None
+    )
+
+
+def legacy_logs(message, members, pending: int):
+    """Записи обработчиков до перехода на config.log_setup"""
+    logger.info(f"📩 Получено сообщение от {message.from_user.full_name} (ID: {message.from_user.id}) в чате {message.chat.id}: '{message.text[:50]}...' ")
+    logger.info(
+        f"Сообщение Telegram.ID {message.message_id} клиента {message.from_user.id} в чате {message.chat.id} поставлено в очередь "
+        f"для {len(members)} сотрудников (в очереди: {pending})"
+    )
+    logger.info(f"📊 Трекаем сообщение для сотрудников: {', '.join(f'{e.full_name} (ID: {e.id})' for e in members)} [реально в группе]")
+    logger.info(f"[FORWARD-DEBUG] message_id={message.message_id}, chat_id={message.chat.id}, text={repr(message.text)}")
+    logger.info(f"[FORWARD-DEBUG] forward_from_chat={getattr(message, 'forward_from_chat', None)}")
+    logger.info(f"[FORWARD-DEBUG] forward_from={getattr(message, 'forward_from', None)}")
+    logger.info(f"[FORWARD-DEBUG] forward_sender_name={getattr(message, 'forward_sender_name', None)}")
+    logger.info(f"[FORWARD-DEBUG] forward_from_message_id={getattr(message, 'forward_from_message_id', None)}")
+    logger.info(f"[FORWARD-DEBUG] forward_date={getattr(message, 'forward_date', None)}")
+
+
+def current_logs(message, members, pending: int):
+    """Те же записи в текущем виде (bot/main.py)"""
+    logger.debug(
+        "📩 Получено сообщение",
+        extra=fields(user_id=message.from_user.id, chat_id=message.chat.id, message_id=message.message_id, text_length=len(message.text))
+    )
+    logger.debug(
+        "Сообщение клиента поставлено в очередь",
+        extra=fields(
+            message_id=message.message_id, client=message.from_user.id, chat_id=message.chat.id,
+            employees=len(members), pending=pending
+        )
+    )
+    logger.debug(
+        "📊 Трекаем сообщение для сотрудников в группе",
+        extra=fields(chat_id=message.chat.id, employee_ids=[employee.id for employee in members])
+    )
+    forward_logger.debug(
+        "[FORWARD] Личное сообщение",
+        extra=fields(
+            message_id=message.message_id,
+            chat_id=message.chat.id,
+            forward_from_chat=message.forward_from_chat.id if message.forward_from_chat else None,
+            forward_from=message.forward_from.id if message.forward_from else None,
+            forward_sender_name=message.forward_sender_name,
+            forward_from_message_id=message.forward_from_message_id,
+            forward_date=message.forward_date
+        )
+    )
+
+
+def measure(log_messages, messages, members) -> tuple:
+    cpu_started = time.thread_time()
+    wall_started = time.perf_counter()
+    for index, message in enumerate(messages):
+        log_messages(message, members, index % 100)
+    cpu = time.thread_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+    return cpu / len(messages) * 1e6, wall / len(messages) * 1e6
+
+
+def measure_legacy(directory: str, level: int, messages, members) -> tuple:
+    """Прогон "до": синхронная запись в файл из потока обработчика"""
+    log_file = os.path.join(directory, f"legacy_{logging.getLevelName(level)}.log")
+    handler = logging.FileHandler(log_file, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    try:
+        timing = measure(legacy_logs, messages, members)
+    finally:
+        root.removeHandler(handler)
+        handler.close()
+    return (*timing, os.path.getsize(log_file))
+
+
+def measure_current(directory: str, level: str, messages, members) -> tuple:
+    """Прогон "после": config.log_setup (размер файла - после того, как поток все дописал)"""
+    log_file = os.path.join(directory, f"current_{level}.log")
+    setup_logging(level=level, category_levels="", sample_rates="", log_file=log_file, console=False)
+    try:
+        timing = measure(current_logs, messages, members)
+    finally:
+        stop_logging()
+    return (*timing, os.path.getsize(log_file))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--employees", type=int, default=30)
+    args = parser.parse_args()
+
+    messages = [make_message(index) for index in range(args.messages)]
+    members = [SimpleNamespace(id=index, full_name=f"Сотрудник {index}") for index in range(args.employees)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        rows = [
+            ("все записи пишутся", "до (INFO, синхронно)",
+             measure_legacy(directory, logging.INFO, messages, members)),
+            ("", "после (DEBUG, очередь)", measure_current(directory, "DEBUG", messages, members)),
+            ("записи отключены", "до (WARNING)", measure_legacy(directory, logging.WARNING, messages, members)),
+            ("", "после (INFO)", measure_current(directory, "INFO", messages, members)),
+        ]
+
+    print(f"Сообщений: {args.messages}, сотрудников в группе: {args.employees}")
+    print(f"{'':<20}{'':<26}{'CPU потока, мкс':>18}{'время, мкс':>14}{'лог, КБ':>10}")
+    for group, name, (cpu, wall, size) in rows:
+        print(f"{group:<20}{name:<26}{cpu:>18.1f}{wall:>14.1f}{size / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
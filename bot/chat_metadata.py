@@ -0,0 +1,202 @@
+"""Кэш метаданных групповых чатов (название, username, invite-ссылка)"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from aiogram import Bot
+from sqlalchemy import select
+
+from config.config import settings
+from database.database import AsyncSessionLocal
+from database.dialect import upsert
+from database.models import Chat
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ChatInfo:
+    """Снимок метаданных чата"""
+    chat_id: int
+    title: Optional[str] = None
+    username: Optional[str] = None
+    chat_type: Optional[str] = None
+    invite_link: Optional[str] = None
+
+    @property
+    def link(self) -> Optional[str]:
+        """Ссылка для перехода в чат: публичная по username, иначе сохраненная invite-ссылка"""
+        if self.username:
+            return f"https://t.me/{self.username}"
+        return self.invite_link
+
+    @classmethod
+    def from_model(cls, chat: Chat) -> "ChatInfo":
+        return cls(
+            chat_id=chat.chat_id,
+            title=chat.title,
+            username=chat.username,
+            chat_type=chat.chat_type,
+            invite_link=chat.invite_link
+        )
+
+
+class ChatMetadataCache:
+    """Метаданные чатов в памяти с TTL, сохраняются в таблицу chats.
+
+    Название и username обновляются бесплатно из апдейтов (сообщения группы,
+    смена названия, chat_member / my_chat_member). К Telegram кэш обращается
+    только для неизвестного чата и раз в ttl_seconds в фоне (устаревшая запись
+    отдается сразу). Invite-ссылка берется из get_chat (основная ссылка чата
+    видна боту-админу); export_chat_invite_link, который отзывает прежнюю
+    основную ссылку, вызывается только если сохраненной ссылки нет.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self._ttl = ttl_seconds
+        self._chats: Dict[int, ChatInfo] = {}
+        self._checked_at: Dict[int, float] = {}  # когда данные чата последний раз запрашивались у Telegram
+        self._inflight: Dict[int, asyncio.Task] = {}
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def start(self):
+        """Загрузить сохраненные метаданные всех чатов"""
+        await self._ensure_loaded()
+
+    async def stop(self):
+        tasks = list(self._background_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def get(self, bot: Bot, chat_id: int) -> ChatInfo:
+        """Метаданные чата; к Telegram обращается только если чат еще неизвестен"""
+        await self._ensure_loaded()
+        info = self._chats.get(chat_id)
+        if info is None:
+            # Параллельные уведомления по одному чату делают один запрос
+            return await self._fetch_once(bot, chat_id)
+        if time.monotonic() - self._checked_at.get(chat_id, 0.0) > self._ttl:
+            self.schedule_refresh(bot, chat_id)
+        return info
+
+    def observe(self, bot: Bot, chat) -> None:
+        """Обновить кэш по объекту чата из апдейта (без обращений к Telegram)"""
+        if chat is None or chat.type not in ("group", "supergroup"):
+            return
+        info = self._chats.get(chat.id)
+        observed = replace(
+            info or ChatInfo(chat_id=chat.id),
+            title=chat.title,
+            username=chat.username,
+            chat_type=chat.type
+        )
+        if observed == info:
+            return
+        self._chats[chat.id] = observed
+        if info is None and not observed.username:
+            # Для приватной группы нужна invite-ссылка - запрашиваем заранее, до первого уведомления
+            self.schedule_refresh(bot, chat.id)
+        else:
+            self._spawn(self._persist(observed))
+        logger.info(f"[CHATS] Метаданные чата {chat.id} обновлены из апдейта: '{observed.title}', username={observed.username}")
+
+    def schedule_refresh(self, bot: Bot, chat_id: int) -> None:
+        """Запросить метаданные чата у Telegram в фоне"""
+        if chat_id not in self._inflight:
+            self._spawn(self._fetch_once(bot, chat_id))
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(Chat))
+                chats = result.scalars().all()
+            now_monotonic = time.monotonic()
+            now = datetime.utcnow()
+            for chat in chats:
+                self._chats.setdefault(chat.chat_id, ChatInfo.from_model(chat))
+                age = (now - chat.updated_at).total_seconds() if chat.updated_at else self._ttl + 1
+                self._checked_at.setdefault(chat.chat_id, now_monotonic - age)
+            self._loaded = True
+        logger.info(f"[CHATS] Загружены метаданные чатов: {len(chats)}")
+
+    async def _fetch_once(self, bot: Bot, chat_id: int) -> ChatInfo:
+        task = self._inflight.get(chat_id)
+        if task is None:
+            task = self._inflight[chat_id] = asyncio.create_task(self._fetch(bot, chat_id))
+            task.add_done_callback(lambda _: self._inflight.pop(chat_id, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, bot: Bot, chat_id: int) -> ChatInfo:
+        info = self._chats.get(chat_id) or ChatInfo(chat_id=chat_id)
+        # Даже при ошибке следующая попытка - не раньше чем через TTL
+        self._checked_at[chat_id] = time.monotonic()
+        try:
+            chat = await bot.get_chat(chat_id)
+        except Exception as e:
+            logger.warning(f"[CHATS] Не удалось получить данные чата {chat_id}: {e}")
+            self._chats.setdefault(chat_id, info)
+            return info
+
+        invite_link = getattr(chat, "invite_link", None) or info.invite_link
+        if not chat.username and not invite_link:
+            try:
+                invite_link = await bot.export_chat_invite_link(chat_id)
+                logger.info(f"[CHATS] Создана invite-ссылка для чата {chat_id}")
+            except Exception as e:
+                logger.warning(f"[CHATS] Не удалось получить invite-ссылку для чата {chat_id}: {e}")
+        info = ChatInfo(
+            chat_id=chat_id,
+            title=chat.title,
+            username=chat.username,
+            chat_type=chat.type,
+            invite_link=invite_link
+        )
+        self._chats[chat_id] = info
+        try:
+            await self._persist(info)
+        except Exception as e:
+            logger.error(f"[CHATS] Ошибка сохранения метаданных чата {chat_id}: {e}")
+        return info
+
+    async def _persist(self, info: ChatInfo):
+        values = {
+            "title": info.title,
+            "username": info.username,
+            "chat_type": info.chat_type,
+            "invite_link": info.invite_link,
+            "updated_at": datetime.utcnow()
+        }
+        statement = upsert(Chat).values(chat_id=info.chat_id, **values)
+        statement = statement.on_conflict_do_update(index_elements=["chat_id"], set_=values)
+        async with AsyncSessionLocal() as session:
+            await session.execute(statement)
+            await session.commit()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(self._run_background(coro))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    @staticmethod
+    async def _run_background(coro):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[CHATS] Ошибка фонового обновления метаданных чата: {e}")
+
+
+# Глобальный экземпляр кэша метаданных чатов
+chat_metadata = ChatMetadataCache(ttl_seconds=settings.chat_metadata_ttl_minutes * 60)
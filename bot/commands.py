@@ -1,12 +1,12 @@
 from aiogram import Bot, Dispatcher
 from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.filters import Command, CommandStart
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
 from database.database import AsyncSessionLocal
-from database.models import Employee
+from .employee_directory import employee_directory
+from .stats_cache import stats_cache
 from web.services.statistics_service import StatisticsService
 
 async def start_command(message: Message, bot: Bot):
@@ -70,10 +70,7 @@ async def stats_command(message: Message):
         return
     async with AsyncSessionLocal() as session:
         # Получаем сотрудника по telegram_id
-        result = await session.execute(
-            select(Employee).where(Employee.telegram_id == message.from_user.id)
-        )
-        employee = result.scalar_one_or_none()
+        employee = await employee_directory.get_by_telegram_id(message.from_user.id)
         if not employee:
             await message.answer("❌ Вы не зарегистрированы в системе")
             return
@@ -81,10 +78,14 @@ async def stats_command(message: Message):
         # Используем единый сервис статистики
         stats_service = StatisticsService(session)
         
-        # Получаем статистику за все периоды
-        today_stats = await stats_service.get_employee_stats(employee.id, period="today")
-        week_stats = await stats_service.get_employee_stats(employee.id, period="week")
-        month_stats = await stats_service.get_employee_stats(employee.id, period="month")
+        # Получаем статистику за все периоды одним проходом (повторные /stats - из кэша)
+        stats_by_period = await stats_cache.get(
+            ("periods", employee.id), employee.id,
+            lambda: stats_service.get_employee_stats_multi(employee.id, periods=["today", "week", "month"])
+        )
+        today_stats = stats_by_period["today"]
+        week_stats = stats_by_period["week"]
+        month_stats = stats_by_period["month"]
         
         # Форматируем время
         now = datetime.utcnow()
@@ -131,31 +132,24 @@ async def test_daily_reports_command(message: Message):
     if message.chat.type != "private":
         return
         
-    async with AsyncSessionLocal() as session:
-        # Проверяем права администратора
-        result = await session.execute(
-            select(Employee).where(
-                Employee.telegram_id == message.from_user.id,
-                Employee.is_admin == True
-            )
-        )
-        admin = result.scalar_one_or_none()
+    # Проверяем права администратора
+    admin = await employee_directory.get_by_telegram_id(message.from_user.id)
         
-        if not admin:
-            await message.answer("❌ У вас нет прав администратора")
-            return
+    if not admin or not admin.is_admin:
+        await message.answer("❌ У вас нет прав администратора")
+        return
         
-        await message.answer("📊 Запускаю отправку ежедневных отчетов...", parse_mode="HTML")
+    await message.answer("📊 Запускаю отправку ежедневных отчетов...", parse_mode="HTML")
         
-        # Импортируем из scheduler
-        from .scheduler import send_daily_reports
-        from ..main import message_tracker
+    # Импортируем из scheduler
+    from .scheduler import send_daily_reports
+    from ..main import message_tracker
         
-        try:
-            await send_daily_reports(message_tracker)
-            await message.answer("✅ Ежедневные отчеты отправлены всем сотрудникам!", parse_mode="HTML")
-        except Exception as e:
-            await message.answer(f"❌ Ошибка при отправке отчетов: {e}", parse_mode="HTML")
+    try:
+        await send_daily_reports(message_tracker)
+        await message.answer("✅ Ежедневные отчеты отправлены всем сотрудникам!", parse_mode="HTML")
+    except Exception as e:
+        await message.answer(f"❌ Ошибка при отправке отчетов: {e}", parse_mode="HTML")
 
 def register_commands(dp: Dispatcher, bot: Bot):
     """Регистрация обработчиков команд"""
@@ -0,0 +1,163 @@
+"""Справочник сотрудников в памяти бота"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from config.config import settings
+from database.database import AsyncSessionLocal
+from database.models import Employee
+from database.cache_versions import EMPLOYEES, get_version, version_notifications
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class EmployeeRecord:
+    """Неизменяемый снимок сотрудника (те же поля, что у Employee, без привязки к сессии)"""
+    id: int
+    telegram_id: int
+    telegram_username: Optional[str]
+    full_name: str
+    is_active: bool
+    is_admin: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, employee: Employee) -> "EmployeeRecord":
+        return cls(
+            id=employee.id,
+            telegram_id=employee.telegram_id,
+            telegram_username=employee.telegram_username,
+            full_name=employee.full_name,
+            is_active=bool(employee.is_active),
+            is_admin=bool(employee.is_admin),
+            created_at=employee.created_at
+        )
+
+
+class EmployeeDirectory:
+    """Все сотрудники в памяти с индексами по id, telegram_id и username (в нижнем регистре).
+
+    Веб при создании, изменении и удалении сотрудника увеличивает версию "employees"
+    в cache_versions (database.cache_versions.bump_version). Бот раз в poll_seconds
+    сравнивает версию одним запросом и перечитывает справочник только при ее смене;
+    раз в max_age_seconds справочник перечитывается безусловно (изменения напрямую в БД).
+    На PostgreSQL версия проверяется сразу по NOTIFY, не дожидаясь опроса.
+    Поиск сотрудника запросов к БД не делает.
+    """
+
+    def __init__(self, poll_seconds: int, max_age_seconds: int):
+        self._poll_seconds = poll_seconds
+        self._max_age_seconds = max_age_seconds
+        self._by_id: Dict[int, EmployeeRecord] = {}
+        self._by_telegram_id: Dict[int, EmployeeRecord] = {}
+        self._by_username: Dict[str, EmployeeRecord] = {}
+        self._active: Tuple[EmployeeRecord, ...] = ()
+        self._version: Optional[int] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        version_notifications.subscribe(EMPLOYEES, self._on_version_notify)
+
+    async def start(self):
+        """Загрузить справочник и запустить отслеживание изменений"""
+        await self.refresh()
+        if not self._task or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self):
+        """Перечитать справочник из БД (параллельные вызовы выполняют одно чтение)"""
+        loaded_at = self._loaded_at
+        async with self._lock:
+            if self._loaded_at != loaded_at:
+                # Пока ждали блокировку, справочник уже перечитали
+                return
+            async with AsyncSessionLocal() as session:
+                version = await get_version(session, EMPLOYEES)
+                result = await session.execute(select(Employee).order_by(Employee.id))
+                records = [EmployeeRecord.from_model(employee) for employee in result.scalars().all()]
+            self._by_id = {record.id: record for record in records}
+            self._by_telegram_id = {record.telegram_id: record for record in records}
+            self._by_username = {record.telegram_username.lower(): record for record in records if record.telegram_username}
+            self._active = tuple(record for record in records if record.is_active)
+            self._version = version
+            self._loaded_at = time.monotonic()
+        logger.info(f"[EMPLOYEES] Справочник сотрудников загружен: всего {len(records)}, активных {len(self._active)}, версия {version}")
+
+    async def get(self, employee_id: int) -> Optional[EmployeeRecord]:
+        await self._ensure_loaded()
+        return self._by_id.get(employee_id)
+
+    async def get_by_telegram_id(self, telegram_id: int) -> Optional[EmployeeRecord]:
+        await self._ensure_loaded()
+        return self._by_telegram_id.get(telegram_id)
+
+    async def get_by_username(self, username: str) -> Optional[EmployeeRecord]:
+        await self._ensure_loaded()
+        return self._by_username.get(username.lstrip("@").lower())
+
+    async def get_active(self) -> List[EmployeeRecord]:
+        """Активные сотрудники (включая админов)"""
+        await self._ensure_loaded()
+        return list(self._active)
+
+    async def get_active_admins(self) -> List[EmployeeRecord]:
+        await self._ensure_loaded()
+        return [record for record in self._active if record.is_admin]
+
+    async def get_all(self) -> List[EmployeeRecord]:
+        await self._ensure_loaded()
+        return list(self._by_id.values())
+
+    async def _ensure_loaded(self):
+        if self._loaded_at is None:
+            await self.refresh()
+
+    def _on_version_notify(self):
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _watch(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                if time.monotonic() - self._loaded_at >= self._max_age_seconds:
+                    await self.refresh()
+                    continue
+                async with AsyncSessionLocal() as session:
+                    version = await get_version(session, EMPLOYEES)
+                if version != self._version:
+                    logger.info(f"[EMPLOYEES] Версия справочника изменилась: {self._version} -> {version}")
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[EMPLOYEES] Ошибка проверки версии справочника сотрудников: {e}")
+
+
+# Глобальный экземпляр справочника сотрудников
+employee_directory = EmployeeDirectory(
+    poll_seconds=settings.employee_directory_poll_seconds,
+    max_age_seconds=settings.employee_directory_max_age_minutes * 60
+)
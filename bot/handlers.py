@@ -3,8 +3,13 @@ from aiogram.filters import Command
 from aiogram.types import Message
 from sqlalchemy import select
 from database.database import AsyncSessionLocal
-from database.models import Employee, Message as DBMessage
+from database.models import Message as DBMessage
+from database.daily_stats import rebuild_daily_stats
 from .scheduler import setup_scheduler
+from .employee_directory import employee_directory
+from .message_store import delete_client_messages
+from .open_conversations import open_conversations
+from .stats_cache import stats_cache
 
 
 def register_handlers(dp: Dispatcher, message_tracker):
@@ -18,13 +23,8 @@ def register_handlers(dp: Dispatcher, message_tracker):
             return
         
         # Проверяем является ли пользователь админом
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Employee).where(Employee.telegram_id == message.from_user.id)
-            )
-            employee = result.scalar_one_or_none()
-            
-            is_admin = employee and employee.is_admin if employee else False
+        employee = await employee_directory.get_by_telegram_id(message.from_user.id)
+        is_admin = employee and employee.is_admin if employee else False
         
         help_text = """
 🤖 <b>Доступные команды:</b>
@@ -63,39 +63,35 @@ def register_handlers(dp: Dispatcher, message_tracker):
         if message.chat.type != "private":
             return
             
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Employee).where(Employee.telegram_id == message.from_user.id)
-            )
-            employee = result.scalar_one_or_none()
+        employee = await employee_directory.get_by_telegram_id(message.from_user.id)
             
-            if not employee:
-                await message.answer("❌ Вы не зарегистрированы в системе")
-                return
+        if not employee:
+            await message.answer("❌ Вы не зарегистрированы в системе")
+            return
             
-            stats = await message_tracker.analytics.get_employee_stats(employee.id, 'weekly')
+        stats = await message_tracker.analytics.get_employee_stats(employee.id, 'weekly')
             
-            if stats:
-                text = f"📊 <b>Ваша статистика за неделю:</b>\n\n"
-                text += f"📨 Всего сообщений: {stats.total_messages}\n"
-                text += f"✅ Отвечено: {stats.responded_messages}\n"
-                text += f"❌ Пропущено: {stats.missed_messages}\n"
+        if stats:
+            text = f"📊 <b>Ваша статистика за неделю:</b>\n\n"
+            text += f"📨 Всего сообщений: {stats.total_messages}\n"
+            text += f"✅ Отвечено: {stats.responded_messages}\n"
+            text += f"❌ Пропущено: {stats.missed_messages}\n"
                 
-                if stats.responded_messages > 0:
-                    text += f"\n⏱ Среднее время ответа: {stats.avg_response_time:.1f} мин\n"
-                    text += f"\n⚠️ Превышений времени ответа:\n"
-                    text += f"  • Более 15 мин: {stats.exceeded_15_min}\n"
-                    text += f"  • Более 30 мин: {stats.exceeded_30_min}\n"
-                    text += f"  • Более 1 часа: {stats.exceeded_60_min}"
+            if stats.responded_messages > 0:
+                text += f"\n⏱ Среднее время ответа: {stats.avg_response_time:.1f} мин\n"
+                text += f"\n⚠️ Превышений времени ответа:\n"
+                text += f"  • Более 15 мин: {stats.exceeded_15_min}\n"
+                text += f"  • Более 30 мин: {stats.exceeded_30_min}\n"
+                text += f"  • Более 1 часа: {stats.exceeded_60_min}"
                 
-                # Расчет эффективности
-                if stats.total_messages > 0:
-                    efficiency = (stats.responded_messages / stats.total_messages) * 100
-                    text += f"\n\n📈 Эффективность: {efficiency:.1f}%"
-            else:
-                text = "📊 Статистика за неделю пока отсутствует"
-            
-            await message.answer(text, parse_mode="HTML")
+            # Расчет эффективности
+            if stats.total_messages > 0:
+                efficiency = (stats.responded_messages / stats.total_messages) * 100
+                text += f"\n\n📈 Эффективность: {efficiency:.1f}%"
+        else:
+            text = "📊 Статистика за неделю пока отсутствует"
+            
+        await message.answer(text, parse_mode="HTML")
     
     @dp.message(Command("report_monthly"))
     async def monthly_report_command(message: Message):
@@ -104,42 +100,38 @@ def register_handlers(dp: Dispatcher, message_tracker):
         if message.chat.type != "private":
             return
             
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Employee).where(Employee.telegram_id == message.from_user.id)
-            )
-            employee = result.scalar_one_or_none()
+        employee = await employee_directory.get_by_telegram_id(message.from_user.id)
             
-            if not employee:
-                await message.answer("❌ Вы не зарегистрированы в системе")
-                return
+        if not employee:
+            await message.answer("❌ Вы не зарегистрированы в системе")
+            return
             
-            stats = await message_tracker.analytics.get_employee_stats(employee.id, 'monthly')
+        stats = await message_tracker.analytics.get_employee_stats(employee.id, 'monthly')
             
-            if stats:
-                text = f"📊 <b>Ваша статистика за месяц:</b>\n\n"
-                text += f"📨 Всего сообщений: {stats.total_messages}\n"
-                text += f"✅ Отвечено: {stats.responded_messages}\n"
-                text += f"❌ Пропущено: {stats.missed_messages}\n"
+        if stats:
+            text = f"📊 <b>Ваша статистика за месяц:</b>\n\n"
+            text += f"📨 Всего сообщений: {stats.total_messages}\n"
+            text += f"✅ Отвечено: {stats.responded_messages}\n"
+            text += f"❌ Пропущено: {stats.missed_messages}\n"
                 
-                if stats.responded_messages > 0:
-                    text += f"\n⏱ Среднее время ответа: {stats.avg_response_time:.1f} мин\n"
-                    text += f"\n⚠️ Превышений времени ответа:\n"
-                    text += f"  • Более 15 мин: {stats.exceeded_15_min}\n"
-                    text += f"  • Более 30 мин: {stats.exceeded_30_min}\n"
-                    text += f"  • Более 1 часа: {stats.exceeded_60_min}"
+            if stats.responded_messages > 0:
+                text += f"\n⏱ Среднее время ответа: {stats.avg_response_time:.1f} мин\n"
+                text += f"\n⚠️ Превышений времени ответа:\n"
+                text += f"  • Более 15 мин: {stats.exceeded_15_min}\n"
+                text += f"  • Более 30 мин: {stats.exceeded_30_min}\n"
+                text += f"  • Более 1 часа: {stats.exceeded_60_min}"
                 
-                # Расчет эффективности и средних показателей
-                if stats.total_messages > 0:
-                    efficiency = (stats.responded_messages / stats.total_messages) * 100
-                    avg_daily = stats.total_messages / 30  # Примерно
+            # Расчет эффективности и средних показателей
+            if stats.total_messages > 0:
+                efficiency = (stats.responded_messages / stats.total_messages) * 100
+                avg_daily = stats.total_messages / 30  # Примерно
                     
-                    text += f"\n\n📈 Эффективность: {efficiency:.1f}%"
-                    text += f"\n📅 В среднем в день: {avg_daily:.1f} сообщений"
-            else:
-                text = "📊 Статистика за месяц пока отсутствует"
+                text += f"\n\n📈 Эффективность: {efficiency:.1f}%"
+                text += f"\n📅 В среднем в день: {avg_daily:.1f} сообщений"
+        else:
+            text = "📊 Статистика за месяц пока отсутствует"
             
-            await message.answer(text, parse_mode="HTML")
+        await message.answer(text, parse_mode="HTML")
     
     @dp.message(Command("admin_stats"))
     async def admin_stats_command(message: Message):
@@ -148,67 +140,57 @@ def register_handlers(dp: Dispatcher, message_tracker):
         if message.chat.type != "private":
             return
             
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Employee).where(
-                    Employee.telegram_id == message.from_user.id,
-                    Employee.is_admin == True
-                )
-            )
-            admin = result.scalar_one_or_none()
+        admin = await employee_directory.get_by_telegram_id(message.from_user.id)
             
-            if not admin:
-                await message.answer("❌ У вас нет прав администратора")
-                return
+        if not admin or not admin.is_admin:
+            await message.answer("❌ У вас нет прав администратора")
+            return
             
-            # Получаем статистику всех сотрудников
-            employees_result = await session.execute(
-                select(Employee).where(Employee.is_active == True)
-            )
-            employees = employees_result.scalars().all()
+        # Получаем статистику всех сотрудников
+        employees = await employee_directory.get_active()
             
-            text = "👥 <b>Статистика по всем сотрудникам за сегодня:</b>\n\n"
+        text = "👥 <b>Статистика по всем сотрудникам за сегодня:</b>\n\n"
             
-            total_messages = 0
-            total_responded = 0
-            total_missed = 0
-            total_deleted = 0
+        total_messages = 0
+        total_responded = 0
+        total_missed = 0
+        total_deleted = 0
             
-            for employee in employees:
-                stats = await message_tracker.analytics.get_employee_stats(employee.id, 'daily')
+        for employee in employees:
+            stats = await message_tracker.analytics.get_employee_stats(employee.id, 'daily')
                 
-                if stats:
-                    text += f"👤 <b>{employee.full_name}</b>\n"
-                    text += f"  📨 Сообщений: {stats['total_messages']}\n"
-                    text += f"  ✅ Отвечено: {stats['responded_messages']}\n"
-                    text += f"  ❌ Пропущено: {stats['missed_messages']}\n"
+            if stats:
+                text += f"👤 <b>{employee.full_name}</b>\n"
+                text += f"  📨 Сообщений: {stats['total_messages']}\n"
+                text += f"  ✅ Отвечено: {stats['responded_messages']}\n"
+                text += f"  ❌ Пропущено: {stats['missed_messages']}\n"
                     
-                    if stats.get('deleted_messages', 0) > 0:
-                        text += f"  🗑 Удалено: {stats['deleted_messages']}\n"
+                if stats.get('deleted_messages', 0) > 0:
+                    text += f"  🗑 Удалено: {stats['deleted_messages']}\n"
                     
-                    if stats['responded_messages'] > 0:
-                        text += f"  ⏱ Среднее время: {stats['avg_response_time']:.1f} мин\n"
+                if stats['responded_messages'] > 0:
+                    text += f"  ⏱ Среднее время: {stats['avg_response_time']:.1f} мин\n"
                     
-                    text += "\n"
+                text += "\n"
                     
-                    total_messages += stats['total_messages']
-                    total_responded += stats['responded_messages']
-                    total_missed += stats['missed_messages']
-                    total_deleted += stats.get('deleted_messages', 0)
+                total_messages += stats['total_messages']
+                total_responded += stats['responded_messages']
+                total_missed += stats['missed_messages']
+                total_deleted += stats.get('deleted_messages', 0)
             
-            text += f"\n📊 <b>Итого:</b>\n"
-            text += f"📨 Всего сообщений: {total_messages}\n"
-            text += f"✅ Отвечено: {total_responded}\n"
-            text += f"❌ Пропущено: {total_missed}\n"
+        text += f"\n📊 <b>Итого:</b>\n"
+        text += f"📨 Всего сообщений: {total_messages}\n"
+        text += f"✅ Отвечено: {total_responded}\n"
+        text += f"❌ Пропущено: {total_missed}\n"
             
-            if total_deleted > 0:
-                text += f"🗑 Удалено: {total_deleted}\n"
+        if total_deleted > 0:
+            text += f"🗑 Удалено: {total_deleted}\n"
             
-            if total_messages > 0:
-                overall_efficiency = ((total_responded + total_deleted) / total_messages) * 100
-                text += f"📈 Общая эффективность: {overall_efficiency:.1f}%"
+        if total_messages > 0:
+            overall_efficiency = ((total_responded + total_deleted) / total_messages) * 100
+            text += f"📈 Общая эффективность: {overall_efficiency:.1f}%"
             
-            await message.answer(text, parse_mode="HTML")
+        await message.answer(text, parse_mode="HTML")
     
     @dp.message(Command("mark_deleted"))
     async def mark_deleted_command(message: Message):
@@ -216,14 +198,8 @@ def register_handlers(dp: Dispatcher, message_tracker):
         if message.chat.type != "private":
             return
         async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Employee).where(
-                    Employee.telegram_id == message.from_user.id,
-                    Employee.is_admin == True
-                )
-            )
-            admin = result.scalar_one_or_none()
-            if not admin:
+            admin = await employee_directory.get_by_telegram_id(message.from_user.id)
+            if not admin or not admin.is_admin:
                 await message.answer("❌ У вас нет прав администратора")
                 return
             args = message.text.split()[1:] if len(message.text.split()) > 1 else []
@@ -254,9 +230,14 @@ def register_handlers(dp: Dispatcher, message_tracker):
             if not db_messages:
                 await message.answer("❌ Сообщение не найдено в базе.")
                 return
-            for db_msg in db_messages:
-                await session.delete(db_msg)
+            affected_days = {db_msg.received_at.date() for db_msg in db_messages if db_msg.received_at}
+            await delete_client_messages(session, {db_msg.client_message_id for db_msg in db_messages})
+            # Пересобираем суточную сводку за дни удаленных копий
+            for day in affected_days:
+                await rebuild_daily_stats(session, day, day)
             await session.commit()
+            open_conversations.invalidate({(db_msg.chat_id, db_msg.client_telegram_id) for db_msg in db_messages})
+            stats_cache.invalidate({db_msg.employee_id for db_msg in db_messages})
             await message.answer(
                 f"✅ Сообщение {msg_id} в чате {chat_id} полностью удалено из базы.\n\n"
                 "Оно больше не будет учитываться нигде в статистике.",
@@ -0,0 +1,322 @@
+"""Буфер записи событий из групповых чатов (write-behind).
+
+Обработчик сообщений только ставит событие в очередь и сразу возвращается.
+Фоновая задача забирает события пачками (раз в flush_interval_ms или по
+max_batch событий) и применяет их в одной транзакции: подряд идущие сообщения
+клиентов вставляются одним INSERT, ответ сотрудника закрывает сессию клиента
+одним UPDATE. События применяются строго в порядке поступления, поэтому
+для каждой пары (chat_id, client_telegram_id) порядок "сообщение -> ответ"
+сохраняется. Время события фиксируется в обработчике, а не при записи.
+
+Если пачка не записывается и после повторов, она делится пополам до
+отдельных событий: отбрасываются только события, которые не записываются
+и поодиночке.
+
+Открытые диалоги берутся из индекса в памяти (OpenConversationIndex); БД
+читается только для диалогов, которых в индексе нет. Индекс обновляется
+после коммита пачки.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from config.log_setup import fields
+from database.database import AsyncSessionLocal
+from .message_store import ClientKey, insert_client_messages, get_open_sessions, close_client_session
+from .open_conversations import OpenConversationIndex
+from .stats_cache import stats_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClientMessageEvent:
+    """Сообщение клиента, которое нужно сохранить для сотрудников чата"""
+    chat_id: int
+    message_id: int
+    client_telegram_id: int
+    client_username: Optional[str]
+    client_name: Optional[str]
+    message_text: Optional[str]
+    received_at: datetime
+    employee_ids: List[int] = field(default_factory=list)
+
+    @property
+    def key(self) -> ClientKey:
+        return (self.chat_id, self.client_telegram_id)
+
+    @property
+    def event_id(self) -> str:
+        """Идентификатор события для логов (без текста и имени клиента)"""
+        return f"message:{self.chat_id}:{self.message_id}"
+
+
+@dataclass
+class EmployeeReplyEvent:
+    """Ответ сотрудника клиенту: закрывает все открытые сообщения клиента в чате"""
+    chat_id: int
+    client_telegram_id: int
+    employee_id: int  # Employee.id (не telegram_id)
+    responded_at: datetime
+
+    @property
+    def key(self) -> ClientKey:
+        return (self.chat_id, self.client_telegram_id)
+
+    @property
+    def event_id(self) -> str:
+        """Идентификатор события для логов"""
+        return f"reply:{self.chat_id}:{self.client_telegram_id}:{self.employee_id}"
+
+
+IngestEvent = Union[ClientMessageEvent, EmployeeReplyEvent]
+
+
+@dataclass
+class FlushResult:
+    """Что нужно сделать после коммита пачки"""
+    to_notify: List[Tuple[int, int, int]] = field(default_factory=list)  # (DBMessage.id, employee_id, chat_id)
+    to_cancel: List[int] = field(default_factory=list)  # DBMessage.id закрытых сообщений
+    conversations: Dict[ClientKey, Set[int]] = field(default_factory=dict)  # состояние диалогов после пачки
+    employees: Set[int] = field(default_factory=set)  # сотрудники, чья статистика изменилась
+    saved_messages: int = 0
+    closed_messages: int = 0
+
+
+class IngestBuffer:
+    """Очередь событий групповых чатов с пакетной записью в БД"""
+
+    def __init__(
+        self,
+        notifications,
+        conversations: OpenConversationIndex,
+        flush_interval_ms: int = 50,
+        max_batch: int = 200,
+        max_pending: int = 10000,
+        max_retries: int = 3
+    ):
+        self.notifications = notifications
+        self.conversations = conversations
+        self._flush_interval = flush_interval_ms / 1000
+        self._max_batch = max_batch
+        self._max_retries = max_retries
+        # Ограниченная очередь: при переполнении обработчики ждут (обратное давление)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Запуск фоновой записи"""
+        if self._task and not self._task.done():
+            return
+        await self.conversations.start()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"[INGEST] Буфер записи запущен: интервал {self._flush_interval * 1000:.0f} мс, пачка до {self._max_batch} событий"
+        )
+
+    async def stop(self, timeout: float = 30):
+        """Дописать все накопленные события и остановить фоновую запись"""
+        if not self._task:
+            return
+        pending = self._queue.qsize()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            logger.info(f"[INGEST] Буфер записи остановлен, дописано событий: {pending}")
+        except asyncio.TimeoutError:
+            logger.error(f"[INGEST] Не удалось дописать события за {timeout} с, потеряно: {self._queue.qsize()}")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.conversations.stop()
+
+    async def put(self, event: IngestEvent):
+        """Поставить событие в очередь (ждет только при переполнении очереди)"""
+        await self._queue.put(event)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._flush_interval
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                # Перестраиваем до записи: пачка должна видеть изменения из веб-панели
+                if self.conversations.needs_rebuild:
+                    await self.conversations.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Устаревший индекс не используется: диалоги читаются из БД
+                logger.error(f"[INGEST] Ошибка перестроения индекса открытых диалогов: {e}")
+            try:
+                await self._flush_with_retries(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush_with_retries(self, batch: List[IngestEvent]):
+        for attempt in range(1, self._max_retries + 1):
+            generation = self.conversations.generation
+            try:
+                result = await self._flush(batch)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[INGEST] Ошибка записи пачки из {len(batch)} событий (попытка {attempt}/{self._max_retries}): {e}")
+                if attempt == self._max_retries:
+                    # Ошибка повторяется - обычно ее вызывает одно событие: пишем пачку по частям
+                    dropped = await self._flush_bisect(batch)
+                    logger.error(
+                        f"[INGEST] Из пачки {len(batch)} событий отброшено {len(dropped)}",
+                        extra=fields(events=dropped)
+                    )
+                    return
+                await asyncio.sleep(attempt)
+
+        await self._after_flush(batch, result, generation)
+
+    async def _flush_bisect(self, batch: List[IngestEvent]) -> List[str]:
+        """Записать пачку половинами (в исходном порядке) без повторов.
+
+        Возвращает идентификаторы событий, которые не записались и поодиночке.
+        """
+        if len(batch) == 1:
+            return [batch[0].event_id]
+        middle = len(batch) // 2
+        dropped = []
+        for part in (batch[:middle], batch[middle:]):
+            generation = self.conversations.generation
+            try:
+                result = await self._flush(part)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if len(part) == 1:
+                    logger.error(f"[INGEST] Событие {part[0].event_id} не записано: {e}")
+                    dropped.append(part[0].event_id)
+                else:
+                    dropped.extend(await self._flush_bisect(part))
+                continue
+            await self._after_flush(part, result, generation)
+        return dropped
+
+    async def _after_flush(self, batch: List[IngestEvent], result: FlushResult, generation: int):
+        """Обновить индекс и кэш и запланировать уведомления после коммита пачки"""
+        self.conversations.apply(result.conversations, since_generation=generation)
+        stats_cache.invalidate(result.employees)
+        logger.info(
+            f"[INGEST] Записана пачка: событий {len(batch)}, сохранено DBMessage {result.saved_messages}, "
+            f"закрыто {result.closed_messages}"
+        )
+        # Сначала планируем, потом отменяем: сообщение могло быть получено и закрыто в одной пачке
+        try:
+            await self.notifications.schedule_warnings_for_messages(result.to_notify)
+            await self.notifications.cancel_notifications_bulk(result.to_cancel)
+        except Exception as e:
+            logger.error(f"[INGEST] Ошибка планирования уведомлений после записи пачки: {e}")
+
+    async def _flush(self, batch: List[IngestEvent]) -> FlushResult:
+        """Применить пачку событий в одной транзакции"""
+        result = FlushResult()
+        async with AsyncSessionLocal() as session:
+            run: List[IngestEvent] = []
+            for event in batch:
+                if run and type(event) is not type(run[0]):
+                    await self._apply_run(session, run, result)
+                    run = []
+                run.append(event)
+            if run:
+                await self._apply_run(session, run, result)
+            await session.commit()
+        return result
+
+    async def _apply_run(self, session, run: List[IngestEvent], result: FlushResult):
+        if isinstance(run[0], ClientMessageEvent):
+            await self._save_messages(session, run, result)
+        else:
+            await self._close_sessions(session, run, result)
+
+    async def _save_messages(self, session, events: List[ClientMessageEvent], result: FlushResult):
+        """Подряд идущие сообщения клиентов: открытые сессии из индекса (и из БД для
+        неизвестных индексу диалогов - одним запросом) и один INSERT"""
+        open_sessions = await self._get_open_sessions(session, events, result)
+        first_for_employee: Dict[Tuple[int, int, int], bool] = {}
+        for event in events:
+            already_active = open_sessions.setdefault(event.key, set())
+            for employee_id in event.employee_ids:
+                first_for_employee[(event.chat_id, event.message_id, employee_id)] = employee_id not in already_active
+            already_active.update(event.employee_ids)
+
+        created = await insert_client_messages(session, [
+            {
+                "employee_ids": event.employee_ids,
+                "chat_id": event.chat_id,
+                "message_id": event.message_id,
+                "client_telegram_id": event.client_telegram_id,
+                "client_username": event.client_username,
+                "client_name": event.client_name,
+                "message_text": event.message_text,
+                "received_at": event.received_at
+            }
+            for event in events
+        ])
+        result.conversations.update(open_sessions)
+        result.employees.update(row.employee_id for row in created)
+        for row in created:
+            if first_for_employee.get((row.chat_id, row.message_id, row.employee_id)):
+                result.to_notify.append((row.id, row.employee_id, row.chat_id))
+        result.saved_messages += len(created)
+
+    async def _get_open_sessions(self, session, events: List[ClientMessageEvent], result: FlushResult) -> Dict[ClientKey, Set[int]]:
+        """Открытые сессии клиентов перед серией: изменения этой пачки, затем индекс, затем БД"""
+        keys = {event.key for event in events}
+        open_sessions = {key: set(result.conversations[key]) for key in keys if key in result.conversations}
+        known, unknown = self.conversations.lookup(keys - open_sessions.keys())
+        open_sessions.update(known)
+        if unknown:
+            # Сообщения этой пачки еще не вставлены, поэтому в БД - только более ранние
+            from_db = await get_open_sessions(session, unknown, None, min(event.received_at for event in events))
+            for key in unknown:
+                open_sessions[key] = from_db.get(key, set())
+        return open_sessions
+
+    async def _close_sessions(self, session, events: List[EmployeeReplyEvent], result: FlushResult):
+        """Подряд идущие ответы сотрудников: сессию клиента закрывает первый ответ (один UPDATE на клиента)"""
+        replies: Dict[ClientKey, EmployeeReplyEvent] = {}
+        for event in events:
+            replies.setdefault(event.key, event)
+
+        for (chat_id, client_telegram_id), reply in replies.items():
+            closed = await close_client_session(session, chat_id, client_telegram_id, reply.employee_id, reply.responded_at)
+            result.to_cancel.extend(row.id for row in closed)
+            result.conversations[(chat_id, client_telegram_id)] = set()
+            result.closed_messages += len(closed)
+            result.employees.update(row.employee_id for row in closed)
+            if closed:
+                logger.debug(
+                    "[SESSION-CLOSE] Сессия клиента закрыта",
+                    extra=fields(client=client_telegram_id, chat_id=chat_id, employee_id=reply.employee_id, messages=len(closed))
+                )
+            else:
+                logger.debug(
+                    "[SESSION-CLOSE] Не найдено DBMessage клиента — возможно, уже отвечено или удалено",
+                    extra=fields(client=client_telegram_id, chat_id=chat_id)
+                )
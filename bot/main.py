@@ -1,168 +1,116 @@
 import asyncio
 import logging
 from datetime import datetime, timedelta
+from typing import List
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, CommandStart
-from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand, BotCommandScopeChat, BotCommandScopeDefault, BotCommandScopeAllGroupChats, CallbackQuery
+from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand, BotCommandScopeChat, BotCommandScopeDefault, BotCommandScopeAllGroupChats, CallbackQuery, ChatMemberUpdated
 from sqlalchemy import select, and_, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config.config import settings
+from config.log_setup import setup_logging, fields
+from monitoring.metrics import timed, register_gauge, start_metrics_server
 from database.database import init_db, AsyncSessionLocal
-from database.models import Employee, Message as DBMessage, DeferredMessageSimple
+from database.models import Message as DBMessage, DeferredMessageSimple
+from database.cache_versions import version_notifications
 from .analytics import AnalyticsService
 from .notifications import NotificationService
 from .handlers import register_handlers_and_scheduler
+from .membership_cache import membership_cache, LEFT_STATUSES
+from .employee_directory import employee_directory, EmployeeRecord
+from .settings_manager import settings_manager
+from .chat_metadata import chat_metadata
+from .outbound import attach_outbound
+from .open_conversations import open_conversations
+from .stats_cache import stats_cache
+from .ingest_buffer import IngestBuffer, ClientMessageEvent, EmployeeReplyEvent
+from .message_store import close_messages
 from web.services.statistics_service import EmployeeStats
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Настройка логирования (запись в отдельном потоке)
+setup_logging()
 logger = logging.getLogger(__name__)
+# Отладка личных сообщений и пересылок (категория bot.main.forward, уровень DEBUG)
+forward_logger = logger.getChild("forward")
 
 # Инициализация бота и диспетчера
-bot = Bot(token=settings.bot_token)
+# Все исходящие сообщения проходят через общую очередь с лимитами Telegram
+bot = attach_outbound(Bot(token=settings.bot_token))
 dp = Dispatcher()
 
 
 class MessageTracker:
     def __init__(self):
-        self.pending_messages = {}  # {chat_id: {telegram_message_id: (employee_id_who_first_got_it, original_received_at)}}
         self.analytics = AnalyticsService()
         self.notifications = NotificationService(bot)
+        self.ingest = IngestBuffer(
+            self.notifications,
+            open_conversations,
+            flush_interval_ms=settings.ingest_flush_interval_ms,
+            max_batch=settings.ingest_max_batch,
+            max_pending=settings.ingest_max_pending
+        )
     
     async def track_message(self, message: Message, employee_id: int):
-        """Отслеживание входящего сообщения от клиента.
-        Уведомления планируются только для первого активного сообщения от клиента в чате.
+        """Отслеживание входящего сообщения от клиента для одного сотрудника"""
+        await self.track_message_for_employees(message, [employee_id])
+    
+    @timed("track_message")
+    async def track_message_for_employees(self, message: Message, employee_ids: List[int]):
+        """Отслеживание входящего сообщения от клиента сразу для всех сотрудников.
+        Сообщение ставится в буфер записи: все копии DBMessage будут вставлены пачкой
+        вместе с другими событиями. Уведомления планируются только для первого активного
+        сообщения от клиента в чате (для каждого сотрудника отдельно).
         """
+        if not employee_ids:
+            return
         chat_id = message.chat.id
         telegram_message_id = message.message_id # ID сообщения из Telegram
         client_telegram_id = message.from_user.id
-
-        # Сначала сохраняем DBMessage для статистики и для всех сотрудников
-        async with AsyncSessionLocal() as session:
-            db_message = DBMessage(
-                employee_id=employee_id,
-                chat_id=chat_id,
-                message_id=telegram_message_id, # ID сообщения из Telegram
-                client_telegram_id=client_telegram_id,
-                client_username=message.from_user.username,
-                client_name=message.from_user.full_name,
-                message_text=message.text,
-                received_at=datetime.utcnow()
-            )
-            session.add(db_message)
-            await session.commit()
-            # db_message.id теперь доступен (PK из нашей БД)
-
-            # --- Подробное логирование: ищем активные сессии ---
-            earlier_active_messages_stmt = select(DBMessage.id, DBMessage.responded_at, DBMessage.is_deleted, DBMessage.received_at).where(
-                and_(
-                    DBMessage.chat_id == chat_id,
-                    DBMessage.client_telegram_id == client_telegram_id,
-                    DBMessage.employee_id == employee_id,
-                    DBMessage.responded_at.is_(None),
-                    DBMessage.is_deleted == False,
-                    DBMessage.id != db_message.id,
-                    DBMessage.received_at < db_message.received_at
-                )
+        received_at = datetime.utcnow()
+
+        await self.ingest.put(ClientMessageEvent(
+            chat_id=chat_id,
+            message_id=telegram_message_id,
+            client_telegram_id=client_telegram_id,
+            client_username=message.from_user.username,
+            client_name=message.from_user.full_name,
+            message_text=message.text,
+            received_at=received_at,
+            employee_ids=list(employee_ids)
+        ))
+        logger.debug(
+            "Сообщение клиента поставлено в очередь",
+            extra=fields(
+                message_id=telegram_message_id, client=client_telegram_id, chat_id=chat_id,
+                employees=len(employee_ids), pending=self.ingest.pending
             )
-            earlier_active_result = await session.execute(earlier_active_messages_stmt)
-            earlier_msgs = earlier_active_result.all()
-            if earlier_msgs:
-                logger.info(f"[DEBUG] Для сотрудника {employee_id} и клиента {client_telegram_id} в чате {chat_id} найдены активные DBMessage:")
-                for row in earlier_msgs:
-                    logger.info(f"  [DEBUG ACTIVE] id={row.id}, responded_at={row.responded_at}, is_deleted={row.is_deleted}, received_at={row.received_at}")
-            else:
-                logger.info(f"[DEBUG] Нет других активных DBMessage для сотрудника {employee_id} и клиента {client_telegram_id} в чате {chat_id}")
-
-            already_active_session_for_employee = len(earlier_msgs) > 0
-
-            if not already_active_session_for_employee:
-                # Это первое сообщение в сессии для этого сотрудника, или предыдущие были отвечены.
-                # Планируем уведомления для текущего db_message.id
-                logger.info(f"Планируем уведомления для DBMessage.id={db_message.id} (клиент {client_telegram_id}, сотрудник {employee_id}), т.к. нет других активных сессий.")
-                await self.notifications.schedule_warnings_for_message(db_message.id, employee_id, chat_id)
-            else:
-                logger.info(f"НЕ планируем уведомления для DBMessage.id={db_message.id} (клиент {client_telegram_id}, сотрудник {employee_id}), т.к. уже есть активная сессия.")
-
-        # Обновляем pending_messages (этот словарь может понадобиться для быстрой проверки, кто из сотрудников получил сообщение первым, если решим так делать)
-        # Ключ: ID сообщения из Telegram. Значение: (employee_id первого сотрудника, время получения в UTC)
-        # Эта часть может потребовать пересмотра, если pending_messages используется для других целей.
-        # Пока что, если сообщение новое для этого чата/сообщения, записываем.
-        if chat_id not in self.pending_messages:
-            self.pending_messages[chat_id] = {}
-        
-        # Если для этого telegram_message_id еще нет записи в pending_messages, 
-        # или если мы хотим перезаписывать (например, чтобы отслеживать последнего назначенного сотрудника - но текущая логика не такова),
-        # то добавляем/обновляем. 
-        # Текущая логика self.pending_messages не очень ясна из предыдущего кода, поэтому оставляю как было, 
-        # но с комментарием, что она может быть не нужна или изменена.
-        if telegram_message_id not in self.pending_messages[chat_id]:
-             self.pending_messages[chat_id][telegram_message_id] = (employee_id, datetime.utcnow()) # Возможно, здесь лучше db_message.received_at
-             logger.debug(f"Сообщение Telegram.ID {telegram_message_id} добавлено в pending_messages для чата {chat_id}")
+        )
         
-    async def mark_as_responded(self, employee_reply_message: Message, responding_employee_id: int):
+    @timed("mark_as_responded")
+    async def mark_as_responded(self, employee_reply_message: Message, responding_employee: EmployeeRecord):
         """Отметка сообщения как отвеченного.
         Если сотрудник отвечает на ЛЮБОЕ сообщение клиента,
         все активные сообщения от этого клиента в этом чате считаются отвеченными этим сотрудником.
-        Время ответа считается от самого раннего неотвеченного сообщения этого клиента в чате."""
+        Время ответа считается от самого раннего неотвеченного сообщения этого клиента в чате
+        до момента получения ответа (запись в БД выполняет буфер)."""
         if not employee_reply_message.reply_to_message:
-            logger.warning(f"Сообщение от сотрудника {responding_employee_id} не является ответом. Нечего отмечать.")
+            logger.warning(f"Сообщение от сотрудника {responding_employee.telegram_id} не является ответом. Нечего отмечать.")
             return
 
         chat_id = employee_reply_message.chat.id
         client_telegram_id = employee_reply_message.reply_to_message.from_user.id
-        logger.info(f"[DEBUG] Начало mark_as_responded: chat_id={chat_id}, client_telegram_id={client_telegram_id}, responding_employee_id={responding_employee_id}")
-
-        # Получаем ID сотрудника из базы данных
-        async with AsyncSessionLocal() as session:
-            employee_result = await session.execute(
-                select(Employee).where(Employee.telegram_id == responding_employee_id)
-            )
-            employee = employee_result.scalar_one_or_none()
-            
-            if not employee:
-                logger.error(f"Сотрудник с Telegram ID {responding_employee_id} не найден в базе данных")
-                return
-            
-            logger.info(f"[ASSERT DEBUG] employee.id={employee.id}, employee.telegram_id={employee.telegram_id}, employee.full_name={employee.full_name}")
-            assert employee.id != employee.telegram_id, f"BUG: employee.id == telegram_id! {employee.id}"
-            
-            logger.info(f"[DEBUG] Найден сотрудник: id={employee.id}, telegram_id={employee.telegram_id}, name={employee.full_name}")
-            
-            # Закрываем сессию: отмечаем все неотвеченные сообщения этого клиента в этом чате для всех сотрудников
-            all_db_messages_for_client = await session.execute(
-                select(DBMessage).where(
-                    and_(
-                        DBMessage.chat_id == chat_id,
-                        DBMessage.client_telegram_id == client_telegram_id,
-                        DBMessage.responded_at.is_(None),
-                        DBMessage.is_deleted == False
-                    )
-                )
-            )
-            db_messages_to_update = all_db_messages_for_client.scalars().all()
-            logger.info(f"[DEBUG] Найдено {len(db_messages_to_update)} неотвеченных сообщений для обновления")
-            
-            if db_messages_to_update:
-                logger.info(f"[SESSION-CLOSE] Найдено {len(db_messages_to_update)} DBMessage для клиента {client_telegram_id} в чате {chat_id} — закрываем сессию.")
-                now = datetime.utcnow()
-                for db_msg in db_messages_to_update:
-                    logger.info(f"[SESSION-CLOSE] Закрываем DBMessage.id={db_msg.id}, employee_id={db_msg.employee_id}, message_id={db_msg.message_id}, received_at={db_msg.received_at}")
-                    db_msg.responded_at = now
-                    db_msg.answered_by_employee_id = employee.id  # Используем ID сотрудника из базы данных
-                    # Вычисляем время ответа
-                    time_diff = now - db_msg.received_at
-                    db_msg.response_time_minutes = time_diff.total_seconds() / 60
-                    logger.info(f"[DEBUG] Установлен answered_by_employee_id={employee.id} и response_time_minutes={db_msg.response_time_minutes:.1f} для сообщения {db_msg.id}")
-                    await self.notifications.cancel_notifications(db_msg.id)
-                await session.commit()
-                logger.info(f"[SESSION-CLOSE] Сессия клиента {client_telegram_id} в чате {chat_id} закрыта для сотрудника {employee.id}.")
-            else:
-                logger.info(f"[SESSION-CLOSE] Не найдено DBMessage для клиента {client_telegram_id} в чате {chat_id} — возможно, уже отвечено или удалено.")
+        await self.ingest.put(EmployeeReplyEvent(
+            chat_id=chat_id,
+            client_telegram_id=client_telegram_id,
+            employee_id=responding_employee.id,  # ID сотрудника из базы данных, не telegram_id
+            responded_at=datetime.utcnow()
+        ))
+        logger.debug(
+            "[SESSION-CLOSE] Закрытие сессии клиента поставлено в очередь",
+            extra=fields(client=client_telegram_id, chat_id=chat_id, employee_id=responding_employee.id)
+        )
 
     async def schedule_notifications(self, message_id: int, employee_id: int, chat_id: int):
         """Планирование уведомлений с актуальными настройками из БД"""
@@ -210,10 +158,7 @@ async def stats_command(message: Message):
     logger.info(f"Запрос /stats от пользователя {user_telegram_id}")
 
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Employee).where(Employee.telegram_id == user_telegram_id)
-        )
-        employee = result.scalar_one_or_none()
+        employee = await employee_directory.get_by_telegram_id(user_telegram_id)
         
         if not employee:
             logger.warning(f"Пользователь {user_telegram_id} не найден в системе.")
@@ -225,21 +170,17 @@ async def stats_command(message: Message):
         from web.services.statistics_service import StatisticsService
         stats_service = StatisticsService(session)
         
-        # --- Логирование перед вызовом get_employee_stats ---
-        period_start_debug, period_end_debug = stats_service._get_period_dates("today")
-        messages_for_stats_debug = await stats_service._get_messages_for_period(employee.id, period_start_debug, period_end_debug)
-        logger.info(f"[DEBUG /stats] Сообщения, полученные _get_messages_for_period для employee_id={employee.id} ({len(messages_for_stats_debug)} шт.):")
-        for i, msg_debug in enumerate(messages_for_stats_debug):
-            logger.info(f"  [DEBUG MSG {i+1}] id={msg_debug.id}, text='{msg_debug.message_text[:20]}...', received_at={msg_debug.received_at}, responded_at={msg_debug.responded_at}, answered_by={msg_debug.answered_by_employee_id}, deleted={msg_debug.is_deleted}")
-        # --- Конец логирования перед вызовом ---
-        stats: EmployeeStats = await stats_service.get_employee_stats(employee.id, period="today")
-        # Получаем количество новых отложенных сообщений
-        deferred_simple_count = await stats_service.get_deferred_simple_count(employee.id, period="today")
+        async def load_stats():
+            stats_by_period = await stats_service.get_employee_stats_multi(employee.id, periods=["today"])
+            # Количество новых отложенных сообщений
+            return stats_by_period["today"], await stats_service.get_deferred_simple_count(employee.id, period="today")
         
-        logger.info(f"[DEBUG /stats] Получена статистика для employee_id={employee.id}:")
-        logger.info(f"  Total: {stats.total_messages}, Responded (by this emp): {stats.responded_messages}, Missed (by this emp): {stats.missed_messages}, Deleted: {stats.deleted_messages}")
-        logger.info(f"  Unique Clients: {stats.unique_clients}, Avg Resp Time: {stats.avg_response_time}, Efficiency: {stats.efficiency_percent}")
-        logger.info(f"  Exceeded 15/30/60: {stats.exceeded_15_min}/{stats.exceeded_30_min}/{stats.exceeded_60_min}")
+        # Повторные /stats без новых событий сотрудника берутся из кэша
+        stats, deferred_simple_count = await stats_cache.get(("stats", employee.id), employee.id, load_stats)
+        logger.info(
+            f"[STATS] /stats employee_id={employee.id}: всего {stats.total_messages}, отвечено {stats.responded_messages}, "
+            f"пропущено {stats.missed_messages}, удалено {stats.deleted_messages}"
+        )
         
         if stats:
             # Форматируем дату как в веб-интерфейсе
@@ -275,7 +216,10 @@ async def stats_command(message: Message):
         
         # Если админ — добавляем общую статистику по всем сотрудникам
         if employee.is_admin:
-            summary = await stats_service.get_dashboard_overview(user_id=employee.id, is_admin=True, period='today')
+            summary = await stats_cache.get(
+                "admin_overview", None,
+                lambda: stats_service.get_dashboard_overview(user_id=employee.id, is_admin=True, period='today')
+            )
             
             text += "\n\n📊 <b>Общая статистика по всем сотрудникам:</b>\n\n"
             text += f"📨 <b>Всего сообщений:</b> {summary['total_messages_today']}\n"
@@ -292,9 +236,13 @@ async def stats_command(message: Message):
 
 
 @dp.message(F.chat.type.in_(['group', 'supergroup']))
+@timed("handle_group_message")
 async def handle_group_message(message: Message):
     """Обработчик сообщений в группах"""
     
+    # Название/username чата (в т.ч. после смены названия) - в кэш метаданных для уведомлений
+    chat_metadata.observe(bot, message.chat)
+    
     # Игнорируем системные сообщения
     if (message.new_chat_members or 
         message.left_chat_member or 
@@ -308,87 +256,106 @@ async def handle_group_message(message: Message):
         message.migrate_from_chat_id or 
         message.pinned_message or
         not message.text):  # Игнорируем сообщения без текста (стикеры, фото и т.д.)
-        logger.info(f"🚫 Игнорируем системное/нетекстовое сообщение в чате {message.chat.id}")
+        logger.debug("🚫 Игнорируем системное/нетекстовое сообщение", extra=fields(chat_id=message.chat.id))
         return
     
-    logger.info(f"📩 Получено сообщение от {message.from_user.full_name} (ID: {message.from_user.id}) в чате {message.chat.id}: '{message.text[:50]}...' ")
-    async with AsyncSessionLocal() as session:
-        # Получаем всех активных сотрудников и админов из БД
-        active_employees_result = await session.execute(
-            select(Employee).where(Employee.is_active == True)
-        )
-        all_active_employees = active_employees_result.scalars().all()
-        sender_is_employee = any(emp.telegram_id == message.from_user.id for emp in all_active_employees)
-        if sender_is_employee:
-            # Если это reply на сообщение клиента — засчитываем как ответ
-            if message.reply_to_message and message.reply_to_message.from_user and message.reply_to_message.from_user.id != message.from_user.id:
-                logger.info(f"✅ Сотрудник/админ {message.from_user.full_name} (ID: {message.from_user.id}) отвечает на сообщение клиента — засчитываем как ответ.")
-                await message_tracker.mark_as_responded(message, message.from_user.id)
-            else:
-                logger.info(f"🗣️ Сообщение от сотрудника/админа {message.from_user.full_name} (ID: {message.from_user.id}) — не трекаем как клиента.")
-            return
-        # Проверяем, кто реально состоит в чате
-        real_group_members = []
-        for employee_obj in all_active_employees:
-            try:
-                member = await bot.get_chat_member(message.chat.id, employee_obj.telegram_id)
-                if member.status not in ("left", "kicked"):
-                    real_group_members.append(employee_obj)
-                else:
-                    logger.info(f"Сотрудник {employee_obj.full_name} (id={employee_obj.id}) не состоит в группе, не уведомляем.")
-            except Exception as e:
-                logger.warning(f"Не удалось проверить членство сотрудника {employee_obj.full_name} (id={employee_obj.id}) в группе: {e}")
-        if not real_group_members:
-            logger.warning(f"Нет сотрудников/админов, реально состоящих в группе {message.chat.id} для уведомления.")
-            return
-        for employee_obj in real_group_members:
-            await message_tracker.track_message(message, employee_obj.id)
-            logger.info(f"📊 Трекаем сообщение для сотрудника: {employee_obj.full_name} (ID: {employee_obj.id}) [реально в группе]")
+    logger.debug(
+        "📩 Получено сообщение",
+        extra=fields(user_id=message.from_user.id, chat_id=message.chat.id, message_id=message.message_id, text_length=len(message.text))
+    )
+    # Сотрудники берутся из справочника в памяти - без запросов к БД
+    sender = await employee_directory.get_by_telegram_id(message.from_user.id)
+    if sender and sender.is_active:
+        # Если это reply на сообщение клиента — засчитываем как ответ
+        if message.reply_to_message and message.reply_to_message.from_user and message.reply_to_message.from_user.id != message.from_user.id:
+            logger.debug("✅ Сотрудник отвечает на сообщение клиента — засчитываем как ответ", extra=fields(employee_id=sender.id, chat_id=message.chat.id))
+            await message_tracker.mark_as_responded(message, sender)
+        else:
+            logger.debug("🗣️ Сообщение сотрудника — не трекаем как клиента", extra=fields(employee_id=sender.id, chat_id=message.chat.id))
+        return
+    all_active_employees = await employee_directory.get_active()
+    # Проверяем, кто реально состоит в чате (кэш членства, промахи проверяются параллельно)
+    real_group_members = await membership_cache.get_members(bot, message.chat.id, all_active_employees)
+    if not real_group_members:
+        logger.warning(f"Нет сотрудников/админов, реально состоящих в группе {message.chat.id} для уведомления.")
+        return
+    await message_tracker.track_message_for_employees(message, [employee_obj.id for employee_obj in real_group_members])
+    logger.debug(
+        "📊 Трекаем сообщение для сотрудников в группе",
+        extra=fields(chat_id=message.chat.id, employee_ids=[employee_obj.id for employee_obj in real_group_members])
+    )
+
+
+@dp.chat_member()
+async def handle_chat_member_update(update: ChatMemberUpdated):
+    """Вход/выход участников группы - поддерживаем кэш членства сотрудников"""
+    chat_metadata.observe(bot, update.chat)
+    user = update.new_chat_member.user
+    employee = await employee_directory.get_by_telegram_id(user.id)
+    if not employee:
+        return
+    is_member = update.new_chat_member.status not in LEFT_STATUSES
+    await membership_cache.update_member(update.chat.id, employee, is_member)
+
+
+@dp.my_chat_member()
+async def handle_my_chat_member_update(update: ChatMemberUpdated):
+    """Бота добавили в группу или удалили из нее - сбрасываем кэш членства чата"""
+    membership_cache.forget_chat(update.chat.id)
+    # Права бота могли измениться (например, стал админом и видит invite-ссылку)
+    chat_metadata.observe(bot, update.chat)
+    if update.new_chat_member.status not in LEFT_STATUSES:
+        chat_metadata.schedule_refresh(bot, update.chat.id)
+    logger.info(f"Статус бота в чате {update.chat.id} изменен на {update.new_chat_member.status}, кэш членства сброшен")
 
 
 @dp.message(F.chat.type == 'private')
 async def handle_private_message(message: Message):
-    logger.info(f"[FORWARD-DEBUG] message_id={message.message_id}, chat_id={message.chat.id}, text={repr(message.text)}")
-    logger.info(f"[FORWARD-DEBUG] forward_from_chat={getattr(message, 'forward_from_chat', None)}")
-    logger.info(f"[FORWARD-DEBUG] forward_from={getattr(message, 'forward_from', None)}")
-    logger.info(f"[FORWARD-DEBUG] forward_sender_name={getattr(message, 'forward_sender_name', None)}")
-    logger.info(f"[FORWARD-DEBUG] forward_from_message_id={getattr(message, 'forward_from_message_id', None)}")
-    logger.info(f"[FORWARD-DEBUG] forward_date={getattr(message, 'forward_date', None)}")
+    forward_logger.debug(
+        "[FORWARD] Личное сообщение",
+        extra=fields(
+            message_id=message.message_id,
+            chat_id=message.chat.id,
+            forward_from_chat=message.forward_from_chat.id if message.forward_from_chat else None,
+            forward_from=message.forward_from.id if message.forward_from else None,
+            forward_sender_name=message.forward_sender_name,
+            forward_from_message_id=message.forward_from_message_id,
+            forward_date=message.forward_date
+        )
+    )
     # Обработка только пересланных сообщений
     if not (message.forward_from_chat or message.forward_from or message.forward_sender_name):
         return  # Не пересланное — игнорируем
 
     # Получаем id сотрудника, который переслал сообщение
     async with AsyncSessionLocal() as session:
-        emp_result = await session.execute(select(Employee).where(Employee.telegram_id == message.from_user.id))
-        employee = emp_result.scalar_one_or_none()
+        employee = await employee_directory.get_by_telegram_id(message.from_user.id)
         if not employee:
-            logger.warning(f"[FORWARD-DEBUG] Сотрудник с telegram_id={message.from_user.id} не найден в базе!")
+            logger.warning(f"[FORWARD] Сотрудник с telegram_id={message.from_user.id} не найден в базе!")
             await message.answer("Вы не зарегистрированы как сотрудник. Обратитесь к администратору.")
             return
-        logger.info(f"[FORWARD-DEBUG] Сотрудник найден: id={employee.id}, full_name={employee.full_name}")
+        forward_logger.debug("[FORWARD] Сотрудник найден", extra=fields(employee_id=employee.id))
         # --- Новая логика: если пересылается сообщение, то ищем оригинал в Message и делаем его отвеченным ---
         if message.forward_from and message.forward_from.id:
-            # Пытаемся найти все оригинальные сообщения клиента в Message, которые считаются пропущенными и неотвеченными
-            orig_result = await session.execute(
-                select(DBMessage)
-                .where(
+            # Все оригинальные сообщения клиента, которые считаются пропущенными и неотвеченными, закрываются одним UPDATE
+            orig_msgs = await close_messages(
+                session,
+                [
                     DBMessage.client_telegram_id == message.forward_from.id,
                     DBMessage.is_missed == True,
-                    DBMessage.responded_at.is_(None),
                     DBMessage.is_deleted == False
-                )
-                .order_by(DBMessage.received_at.desc())
+                ],
+                employee.id,
+                datetime.utcnow(),
+                with_response_time=False,
+                is_missed=False
             )
-            orig_msgs = orig_result.scalars().all()
-            now = datetime.utcnow()
-            for orig_msg in orig_msgs:
-                orig_msg.is_missed = False
-                orig_msg.responded_at = now
-                orig_msg.answered_by_employee_id = employee.id
             if orig_msgs:
                 await session.commit()
-                logger.info(f"[FORWARD-DEBUG] {len(orig_msgs)} оригинальных сообщений отмечены как отвеченные.")
+                open_conversations.invalidate({(row.chat_id, row.client_telegram_id) for row in orig_msgs})
+                stats_cache.invalidate({row.employee_id for row in orig_msgs})
+                await message_tracker.notifications.cancel_notifications_bulk([row.id for row in orig_msgs])
+                logger.info(f"[FORWARD] {len(orig_msgs)} оригинальных сообщений отмечены как отвеченные.")
         # --- Конец новой логики ---
         # Добавляем пересланное сообщение в новую таблицу DeferredMessageSimple
         new_deferred = DeferredMessageSimple(
@@ -405,6 +372,7 @@ async def handle_private_message(message: Message):
         )
         session.add(new_deferred)
         await session.commit()
+        stats_cache.clear()
         kb = InlineKeyboardMarkup(inline_keyboard=[[
             InlineKeyboardButton(text="Убрать из отложенных", callback_data=f"undefer_simple:{new_deferred.id}"),
             InlineKeyboardButton(text="Удалить", callback_data=f"delete_simple:{new_deferred.id}")
@@ -422,6 +390,7 @@ async def undefer_simple_callback(call: CallbackQuery):
             return
         deferred.is_active = False
         await session.commit()
+    stats_cache.clear()
     await call.answer("Сообщение убрано из отложенных.", show_alert=True)
     await call.message.edit_reply_markup(reply_markup=None)
 
@@ -436,6 +405,7 @@ async def delete_simple_callback(call: CallbackQuery):
             return
         await session.delete(deferred)
         await session.commit()
+    stats_cache.clear()
     await call.answer("Сообщение удалено из базы.", show_alert=True)
     await call.message.edit_reply_markup(reply_markup=None)
 
@@ -458,22 +428,66 @@ async def setup_bot_commands():
     logger.info("✅ Меню команд настроено: личные чаты - есть команды, группы - без меню")
 
 
+def _register_runtime_gauges(loop: asyncio.AbstractEventLoop):
+    """Глубина очередей и число задач бота (читаются при каждом сборе метрик)"""
+    register_gauge("bot_ingest_queue_depth", "События в буфере записи", lambda: message_tracker.ingest.pending)
+    register_gauge("bot_asyncio_tasks", "Задачи asyncio в цикле бота", lambda: len(asyncio.all_tasks(loop)))
+    register_gauge(
+        "bot_notification_timer_entries", "Уведомления в таймере (ближайшее окно)",
+        lambda: message_tracker.notifications.scheduler.timer_size
+    )
+    register_gauge(
+        "bot_notification_digest_pending", "Уведомления, ожидающие отправки дайджестом",
+        lambda: message_tracker.notifications.digest_pending
+    )
+
+
 async def main():
     """Основная функция запуска бота"""
     # Инициализация БД
     await init_db()
     
+    # Запуск планировщика уведомлений (восстанавливает ожидающие уведомления из БД)
+    await message_tracker.notifications.start()
+    
+    # Подписка на смену версий кэшей (PostgreSQL LISTEN; на SQLite - только опрос)
+    await version_notifications.start()
+    
+    # Загрузка настроек (дальше обновляются по версии из cache_versions)
+    await settings_manager.start()
+    
+    # Загрузка справочника сотрудников (дальше обновляется по версии из cache_versions)
+    await employee_directory.start()
+    
+    # Загрузка сохраненных метаданных чатов (ссылки в уведомлениях)
+    await chat_metadata.start()
+    
+    # Запуск буфера записи сообщений из групп
+    await message_tracker.ingest.start()
+    
     # Регистрация обработчиков
     await register_handlers_and_scheduler(dp, message_tracker)
     
+    # Метрики процесса для Prometheus
+    _register_runtime_gauges(asyncio.get_running_loop())
+    start_metrics_server(settings.bot_metrics_port, settings.bot_metrics_host)
+    
     # Настройка команд бота
     await setup_bot_commands()
     
     # Запуск бота
     logger.info("Бот запущен")
     try:
-        await dp.start_polling(bot)
+        # chat_member приходят только если явно запрошены в allowed_updates
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        # Сначала дописываем накопленные события (они планируют и отменяют уведомления)
+        await message_tracker.ingest.stop()
+        await message_tracker.notifications.stop()
+        await employee_directory.stop()
+        await settings_manager.stop()
+        await version_notifications.stop()
+        await chat_metadata.stop()
         await bot.session.close()
 
 
@@ -0,0 +1,165 @@
+"""Кэш членства сотрудников в групповых чатах"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from sqlalchemy import select
+
+from config.config import settings
+from config.log_setup import fields
+from database.database import AsyncSessionLocal
+from database.models import ChatEmployee, Employee
+
+logger = logging.getLogger(__name__)
+
+LEFT_STATUSES = ("left", "kicked")
+
+
+class ChatMembershipCache:
+    """Кэш "кто из сотрудников состоит в чате" с TTL.
+
+    Поддерживается в актуальном состоянии апдейтами chat_member / my_chat_member
+    и сохраняется в ChatEmployee, поэтому после перезапуска бота известные чаты
+    не требуют обращений к Telegram. Промахи проверяются параллельно
+    (не более max_concurrency одновременных get_chat_member), устаревшие записи
+    отдаются из кэша и обновляются в фоне.
+    """
+
+    def __init__(self, ttl_seconds: int, max_concurrency: int):
+        self._ttl = ttl_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._members: Dict[int, Dict[int, Tuple[bool, float]]] = {}  # {chat_id: {telegram_id: (is_member, checked_at)}}
+        self._loaded_chats: Set[int] = set()
+        self._refreshing: Set[Tuple[int, int]] = set()
+        self._background_tasks: Set[asyncio.Task] = set()
+
+    async def get_members(self, bot: Bot, chat_id: int, employees: Iterable) -> List:
+        """Вернуть сотрудников из списка, которые состоят в чате (порядок сохраняется)"""
+        employees = list(employees)
+        if chat_id not in self._loaded_chats:
+            await self._load_chat(chat_id)
+        chat_members = self._members.setdefault(chat_id, {})
+
+        now = time.monotonic()
+        member_ids = set()
+        missing = []
+        stale = []
+        for employee in employees:
+            cached = chat_members.get(employee.telegram_id)
+            if cached is None:
+                missing.append(employee)
+                continue
+            is_member, checked_at = cached
+            if is_member:
+                member_ids.add(employee.telegram_id)
+            if now - checked_at > self._ttl:
+                stale.append(employee)
+
+        if missing:
+            results = await asyncio.gather(*(self._check(bot, chat_id, employee) for employee in missing))
+            resolved = [(employee, is_member) for employee, is_member in zip(missing, results) if is_member is not None]
+            member_ids.update(employee.telegram_id for employee, is_member in resolved if is_member)
+            await self._persist(chat_id, resolved)
+
+        if stale:
+            task = asyncio.create_task(self._refresh(bot, chat_id, stale))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+        return [employee for employee in employees if employee.telegram_id in member_ids]
+
+    async def update_member(self, chat_id: int, employee, is_member: bool):
+        """Обновить кэш по апдейту chat_member"""
+        if chat_id in self._loaded_chats or chat_id in self._members:
+            self._members.setdefault(chat_id, {})[employee.telegram_id] = (is_member, time.monotonic())
+        await self._persist(chat_id, [(employee, is_member)])
+        logger.info(f"[MEMBERSHIP] Сотрудник {employee.id} {'в чате' if is_member else 'покинул чат'} {chat_id}")
+
+    def forget_chat(self, chat_id: int):
+        """Сбросить кэш чата (например, бота удалили из группы или добавили заново)"""
+        self._members.pop(chat_id, None)
+        self._loaded_chats.discard(chat_id)
+
+    async def _load_chat(self, chat_id: int):
+        """Загрузить сохраненное членство чата из ChatEmployee"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Employee.telegram_id, ChatEmployee.is_active_in_chat, ChatEmployee.last_seen_at)
+                .join(ChatEmployee, Employee.id == ChatEmployee.employee_id)
+                .where(ChatEmployee.chat_id == chat_id)
+            )
+            rows = result.all()
+
+        now_monotonic = time.monotonic()
+        now = datetime.utcnow()
+        chat_members = self._members.setdefault(chat_id, {})
+        for row in rows:
+            age = (now - row.last_seen_at).total_seconds() if row.last_seen_at else self._ttl + 1
+            chat_members.setdefault(row.telegram_id, (bool(row.is_active_in_chat), now_monotonic - age))
+        self._loaded_chats.add(chat_id)
+
+    async def _check(self, bot: Bot, chat_id: int, employee) -> Optional[bool]:
+        async with self._semaphore:
+            try:
+                member = await bot.get_chat_member(chat_id, employee.telegram_id)
+            except Exception as e:
+                logger.warning(f"Не удалось проверить членство сотрудника {employee.full_name} (id={employee.id}) в группе: {e}")
+                return None
+        is_member = member.status not in LEFT_STATUSES
+        self._members.setdefault(chat_id, {})[employee.telegram_id] = (is_member, time.monotonic())
+        if not is_member:
+            logger.debug("Сотрудник не состоит в группе, не уведомляем", extra=fields(employee_id=employee.id, chat_id=chat_id))
+        return is_member
+
+    async def _refresh(self, bot: Bot, chat_id: int, employees: List):
+        """Фоновое обновление устаревших записей"""
+        employees = [employee for employee in employees if (chat_id, employee.telegram_id) not in self._refreshing]
+        if not employees:
+            return
+        keys = {(chat_id, employee.telegram_id) for employee in employees}
+        self._refreshing.update(keys)
+        try:
+            results = await asyncio.gather(*(self._check(bot, chat_id, employee) for employee in employees))
+            await self._persist(chat_id, [(employee, is_member) for employee, is_member in zip(employees, results) if is_member is not None])
+        except Exception as e:
+            logger.error(f"[MEMBERSHIP] Ошибка фонового обновления членства в чате {chat_id}: {e}")
+        finally:
+            self._refreshing.difference_update(keys)
+
+    async def _persist(self, chat_id: int, results: List[Tuple[object, bool]]):
+        """Сохранить результаты проверки в ChatEmployee"""
+        if not results:
+            return
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            existing_result = await session.execute(
+                select(ChatEmployee).where(
+                    ChatEmployee.chat_id == chat_id,
+                    ChatEmployee.employee_id.in_([employee.id for employee, _ in results])
+                )
+            )
+            existing = {row.employee_id: row for row in existing_result.scalars().all()}
+            for employee, is_member in results:
+                chat_employee = existing.get(employee.id)
+                if chat_employee:
+                    chat_employee.is_active_in_chat = is_member
+                    chat_employee.last_seen_at = now
+                else:
+                    session.add(ChatEmployee(
+                        chat_id=chat_id,
+                        employee_id=employee.id,
+                        is_active_in_chat=is_member,
+                        last_seen_at=now
+                    ))
+            await session.commit()
+
+
+# Глобальный экземпляр кэша членства
+membership_cache = ChatMembershipCache(
+    ttl_seconds=settings.membership_cache_ttl_minutes * 60,
+    max_concurrency=settings.membership_check_concurrency
+)
@@ -6,7 +6,8 @@ from datetime import datetime
 from aiogram.types import Message
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import Employee, ChatEmployee
+from database.models import ChatEmployee
+from .employee_directory import employee_directory, EmployeeRecord
 import logging
 
 logger = logging.getLogger(__name__)
@@ -44,17 +45,11 @@ class MessageAnalyzer:
             'message_type': 'client'
         }
         
-        # Получаем всех сотрудников в системе
-        employees_result = await db.execute(select(Employee))
-        all_employees = employees_result.scalars().all()
-        employee_by_telegram_id = {emp.telegram_id: emp for emp in all_employees}
-        employee_by_username = {emp.telegram_username.lower(): emp for emp in all_employees if emp.telegram_username}
-        
         sender_telegram_id = message.from_user.id
         sender_username = message.from_user.username
         
-        # Проверяем, является ли отправитель сотрудником
-        sender_employee = employee_by_telegram_id.get(sender_telegram_id)
+        # Проверяем, является ли отправитель сотрудником (справочник в памяти)
+        sender_employee = await employee_directory.get_by_telegram_id(sender_telegram_id)
         
         if sender_employee:
             # Сообщение от сотрудника - проверяем, является ли ответом
@@ -75,7 +70,7 @@ class MessageAnalyzer:
             result['message_type'] = 'client'
             
             # Анализируем кому адресовано сообщение
-            addressed_to = await self._analyze_addressing(message, employee_by_username, db)
+            addressed_to = await self._analyze_addressing(message)
             
             if addressed_to:
                 # Сообщение адресовано конкретному сотруднику
@@ -91,7 +86,7 @@ class MessageAnalyzer:
         
         return result
     
-    async def _analyze_addressing(self, message: Message, employee_by_username: Dict[str, Employee], db: AsyncSession) -> Optional[Employee]:
+    async def _analyze_addressing(self, message: Message) -> Optional[EmployeeRecord]:
         """Анализирует к кому обращено сообщение"""
         
         if not message.text:
@@ -102,7 +97,7 @@ class MessageAnalyzer:
         # 1. Проверяем упоминания @username
         mentions = re.findall(r'@(\w+)', text)
         for mention in mentions:
-            employee = employee_by_username.get(mention.lower())
+            employee = await employee_directory.get_by_username(mention)
             if employee:
                 return employee
         
@@ -111,10 +106,7 @@ class MessageAnalyzer:
             replied_user_id = message.reply_to_message.from_user.id
             
             # Ищем сотрудника по Telegram ID
-            employees_result = await db.execute(
-                select(Employee).where(Employee.telegram_id == replied_user_id)
-            )
-            employee = employees_result.scalar_one_or_none()
+            employee = await employee_directory.get_by_telegram_id(replied_user_id)
             if employee:
                 return employee
         
@@ -123,28 +115,23 @@ class MessageAnalyzer:
         
         return None
     
-    async def _get_active_employees_in_chat(self, chat_id: int, db: AsyncSession) -> List[Employee]:
+    async def _get_active_employees_in_chat(self, chat_id: int, db: AsyncSession) -> List[EmployeeRecord]:
         """Получает список активных сотрудников в чате"""
         
-        # Получаем активных сотрудников, которые есть в этом чате
+        # Получаем сотрудников, которые есть в этом чате (активность - по справочнику)
         result = await db.execute(
-            select(Employee, ChatEmployee)
-            .join(ChatEmployee, Employee.id == ChatEmployee.employee_id)
-            .where(
+            select(ChatEmployee.employee_id).where(
                 ChatEmployee.chat_id == chat_id,
-                Employee.is_active == True,
                 ChatEmployee.is_active_in_chat == True
             )
         )
-        
-        employees = [row[0] for row in result.fetchall()]
+        chat_employee_ids = set(result.scalars().all())
+        active_employees = await employee_directory.get_active()
+        employees = [emp for emp in active_employees if emp.id in chat_employee_ids]
         
         # Если нет записей в ChatEmployee, считаем что все активные сотрудники могут получать уведомления
         if not employees:
-            result = await db.execute(
-                select(Employee).where(Employee.is_active == True)
-            )
-            employees = result.scalars().all()
+            employees = active_employees
             logger.info(f"Нет записей ChatEmployee для чата {chat_id}, используем всех активных сотрудников")
         
         return employees
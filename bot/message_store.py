@@ -0,0 +1,279 @@
+"""Пакетная запись сообщений клиентов в БД.
+
+Сообщение клиента хранится один раз (client_messages), копии сотрудников -
+назначения (message_assignments). Чтение идет через DBMessage (JOIN обеих
+таблиц), запись - по таблицам напрямую.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import select, insert, update, delete, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Message as DBMessage, ClientMessage, MessageAssignment, Notification
+from database.daily_stats import record_received_many, record_answered
+from database.dialect import minutes_between, upsert
+
+from .notification_scheduler import cancel_scheduled
+
+# (chat_id, client_telegram_id) - ключ "сессии" клиента в чате
+ClientKey = Tuple[int, int]
+
+# Поля DBMessage, которые хранятся в client_messages (остальные - в назначении)
+CLIENT_FIELDS = frozenset(ClientMessage.__table__.c.keys()) - {"id"}
+
+
+class SavedCopy(NamedTuple):
+    """Созданная копия (назначение) сообщения клиента"""
+    id: int
+    employee_id: int
+    chat_id: int
+    message_id: int
+
+
+class ClosedCopy(NamedTuple):
+    """Копия, закрытая ответом"""
+    id: int
+    employee_id: Optional[int]
+    chat_id: int
+    client_telegram_id: Optional[int]
+    received_at: datetime
+    answered_by_employee_id: Optional[int]
+    response_time_minutes: Optional[float]
+
+
+def _client_keys_filter(keys: List[ClientKey]):
+    """Условие "сообщение одного из клиентов" в виде OR по парам (chat_id, client_telegram_id):
+    в отличие от сравнения кортежей и SQLite, и PostgreSQL ищут каждую пару по индексу"""
+    return or_(*(
+        and_(DBMessage.chat_id == chat_id, DBMessage.client_telegram_id == client_telegram_id)
+        for chat_id, client_telegram_id in keys
+    ))
+
+
+async def insert_client_message_copies(
+    session: AsyncSession,
+    employee_ids: List[int],
+    chat_id: int,
+    message_id: int,
+    client_telegram_id: int,
+    client_username: Optional[str],
+    client_name: Optional[str],
+    message_text: Optional[str],
+    received_at: datetime,
+    **extra_fields
+) -> List[SavedCopy]:
+    """Вставить копии сообщения клиента для всех сотрудников
+    и учесть их в суточной сводке статистики.
+
+    Возвращает созданные копии (id, employee_id, chat_id, message_id). Коммит делает вызывающий.
+    """
+    return await insert_client_messages(session, [{
+        "employee_ids": employee_ids,
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "client_telegram_id": client_telegram_id,
+        "client_username": client_username,
+        "client_name": client_name,
+        "message_text": message_text,
+        "received_at": received_at,
+        **extra_fields
+    }])
+
+
+async def insert_client_messages(session: AsyncSession, items: List[Dict[str, Any]]) -> List[SavedCopy]:
+    """Вставить несколько сообщений клиентов и их копии двумя INSERT.
+
+    Каждый элемент - поля DBMessage плюс employee_ids (по копии на сотрудника).
+    Сообщение, уже записанное раньше (тот же chat_id и message_id), не дублируется:
+    к нему добавляются новые назначения. Возвращает созданные копии
+    (id, employee_id, chat_id, message_id). Коммит делает вызывающий.
+    """
+    client_messages: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    assignments = []
+    for item in items:
+        fields = dict(item)
+        employee_ids = fields.pop("employee_ids")
+        key = (fields["chat_id"], fields["message_id"])
+        client_messages.setdefault(key, {name: value for name, value in fields.items() if name in CLIENT_FIELDS})
+        assignment = {name: value for name, value in fields.items() if name not in CLIENT_FIELDS}
+        assignments.extend((key, employee_id, assignment) for employee_id in employee_ids)
+    if not assignments:
+        return []
+
+    statement = upsert(ClientMessage).values(list(client_messages.values()))
+    # Пустое обновление при конфликте, чтобы RETURNING вернул id и уже существующих строк
+    statement = statement.on_conflict_do_update(
+        index_elements=["chat_id", "message_id"],
+        set_={"chat_id": statement.excluded.chat_id}
+    ).returning(ClientMessage.id, ClientMessage.chat_id, ClientMessage.message_id, ClientMessage.received_at)
+    saved = {(row.chat_id, row.message_id): row for row in (await session.execute(statement)).all()}
+    keys = {row.id: key for key, row in saved.items()}
+
+    # received_at копируется в назначение (у уже записанного сообщения - прежнее значение)
+    result = await session.execute(
+        insert(MessageAssignment).values([
+            {
+                "client_message_id": saved[key].id,
+                "employee_id": employee_id,
+                "received_at": saved[key].received_at,
+                **assignment
+            }
+            for key, employee_id, assignment in assignments
+        ]).returning(MessageAssignment.id, MessageAssignment.employee_id, MessageAssignment.client_message_id)
+    )
+    created = [SavedCopy(row.id, row.employee_id, *keys[row.client_message_id]) for row in result.all()]
+    await record_received_many(session, [
+        (item["received_at"], item["chat_id"], item["client_telegram_id"], item["employee_ids"])
+        for item in items
+    ])
+    return created
+
+
+async def get_employees_with_open_session(
+    session: AsyncSession,
+    chat_id: int,
+    client_telegram_id: int,
+    employee_ids: List[int],
+    before: datetime
+) -> Set[int]:
+    """Сотрудники, у которых уже есть неотвеченные сообщения этого клиента в чате (один запрос)"""
+    if not employee_ids:
+        return set()
+    open_sessions = await get_open_sessions(session, [(chat_id, client_telegram_id)], employee_ids, before)
+    return open_sessions.get((chat_id, client_telegram_id), set())
+
+
+async def get_open_sessions(
+    session: AsyncSession,
+    keys: Iterable[ClientKey],
+    employee_ids: Optional[Iterable[int]],
+    before: datetime
+) -> Dict[ClientKey, Set[int]]:
+    """Открытые сессии сразу для нескольких клиентов: {(chat_id, client_telegram_id): {employee_id}}.
+
+    employee_ids=None - по всем сотрудникам.
+    """
+    keys = list(set(keys))
+    conditions = [
+        _client_keys_filter(keys),
+        DBMessage.responded_at.is_(None),
+        DBMessage.is_deleted == False,
+        DBMessage.received_at < before
+    ]
+    if employee_ids is not None:
+        employee_ids = list(set(employee_ids))
+        if not employee_ids:
+            return {}
+        conditions.append(DBMessage.employee_id.in_(employee_ids))
+    if not keys:
+        return {}
+    result = await session.execute(
+        select(DBMessage.chat_id, DBMessage.client_telegram_id, DBMessage.employee_id)
+        .where(and_(*conditions))
+        .group_by(DBMessage.chat_id, DBMessage.client_telegram_id, DBMessage.employee_id)
+    )
+    open_sessions: Dict[ClientKey, Set[int]] = {}
+    for row in result.all():
+        open_sessions.setdefault((row.chat_id, row.client_telegram_id), set()).add(row.employee_id)
+    return open_sessions
+
+
+async def close_messages(
+    session: AsyncSession,
+    conditions: list,
+    employee_id: int,
+    responded_at: datetime,
+    with_response_time: bool = True,
+    **extra_values
+) -> List[ClosedCopy]:
+    """Закрыть неотвеченные копии одним UPDATE ... RETURNING и учесть их в суточной сводке.
+
+    conditions - условия на DBMessage (по полям и копии, и сообщения клиента).
+    Время ответа считается в БД для каждой копии (от received_at ее сообщения).
+    Возвращает закрытые копии (id, employee_id, chat_id, client_telegram_id, received_at,
+    answered_by_employee_id, response_time_minutes). Коммит делает вызывающий.
+    """
+    values = {"responded_at": responded_at, "answered_by_employee_id": employee_id, **extra_values}
+    if with_response_time:
+        values["response_time_minutes"] = minutes_between(MessageAssignment.received_at, responded_at)
+    open_copies = select(DBMessage.id).where(and_(*conditions, DBMessage.responded_at.is_(None))).correlate(None)
+    result = await session.execute(
+        update(MessageAssignment)
+        .where(MessageAssignment.id.in_(open_copies))
+        .values(values)
+        .returning(
+            MessageAssignment.id,
+            MessageAssignment.employee_id,
+            MessageAssignment.client_message_id,
+            MessageAssignment.answered_by_employee_id,
+            MessageAssignment.response_time_minutes
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    if not rows:
+        return []
+    # RETURNING в SQLite видит только изменяемую таблицу - поля сообщения отдельным запросом по первичному ключу
+    client_messages = {
+        row.id: row for row in (await session.execute(
+            select(ClientMessage.id, ClientMessage.chat_id, ClientMessage.client_telegram_id, ClientMessage.received_at)
+            .where(ClientMessage.id.in_({row.client_message_id for row in rows}))
+        )).all()
+    }
+    closed = [
+        ClosedCopy(
+            row.id,
+            row.employee_id,
+            client_messages[row.client_message_id].chat_id,
+            client_messages[row.client_message_id].client_telegram_id,
+            client_messages[row.client_message_id].received_at,
+            row.answered_by_employee_id,
+            row.response_time_minutes
+        )
+        for row in rows
+    ]
+    await record_answered(session, closed)
+    return closed
+
+
+async def close_client_session(
+    session: AsyncSession,
+    chat_id: int,
+    client_telegram_id: int,
+    employee_id: int,
+    responded_at: datetime
+) -> List[ClosedCopy]:
+    """Закрыть все неотвеченные и неудаленные сообщения клиента в чате (для всех сотрудников)"""
+    return await close_messages(
+        session,
+        [
+            DBMessage.chat_id == chat_id,
+            DBMessage.client_telegram_id == client_telegram_id,
+            DBMessage.is_deleted == False
+        ],
+        employee_id,
+        responded_at
+    )
+
+
+async def delete_client_messages(session: AsyncSession, client_message_ids: Iterable[int]):
+    """Удалить сообщения клиентов вместе со всеми копиями. Коммит делает вызывающий.
+
+    Сначала в той же транзакции удаляются ссылки на копии: запланированные
+    уведомления (через планировщик) и история отправленных.
+    """
+    client_message_ids = list(set(client_message_ids))
+    if not client_message_ids:
+        return
+    assignment_ids = list((await session.execute(
+        select(MessageAssignment.id).where(MessageAssignment.client_message_id.in_(client_message_ids))
+    )).scalars().all())
+    if assignment_ids:
+        await cancel_scheduled(session, assignment_ids)
+        await session.execute(delete(Notification).where(Notification.message_id.in_(assignment_ids)))
+    await session.execute(
+        delete(MessageAssignment).where(MessageAssignment.client_message_id.in_(client_message_ids))
+    )
+    await session.execute(delete(ClientMessage).where(ClientMessage.id.in_(client_message_ids)))
@@ -0,0 +1,343 @@
+"""Персистентный планировщик уведомлений о просроченных ответах"""
+
+import asyncio
+import heapq
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, insert, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import AsyncSessionLocal
+from database.models import ScheduledNotification
+from monitoring.metrics import observe_notification_delay
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DueNotification:
+    """Уведомление, время отправки которого наступило"""
+    id: int
+    message_id: int
+    employee_id: int
+    chat_id: int
+    notification_type: str
+    delay_minutes: int
+    due_at: datetime
+
+
+async def cancel_scheduled(session: AsyncSession, message_ids: List[int]) -> int:
+    """Удалить запланированные уведомления для сообщений (DBMessage.id) в транзакции вызывающего.
+
+    Записи в куче планировщика не трогаем: при срабатывании они не найдутся в БД
+    и будут пропущены. Коммит делает вызывающий.
+    """
+    if not message_ids:
+        return 0
+    result = await session.execute(
+        delete(ScheduledNotification).where(ScheduledNotification.message_id.in_(message_ids))
+    )
+    return result.rowcount or 0
+
+
+class NotificationScheduler:
+    """Единый таймер для всех отложенных уведомлений.
+
+    Очередь хранится в таблице scheduled_notifications и переживает перезапуск бота.
+    В памяти держится только куча ближайших срабатываний (окно lookahead, не более
+    max_heap_size записей), поэтому память не растет с числом ожидающих клиентов.
+
+    Доставка - не менее одного раза. Сработавшие записи захватываются арендой
+    (claimed_until) и удаляются только после того, как обработчик вернул управление.
+    Обработчик может вернуть часть записей в очередь (retry - ошибка отправки) или
+    продлить их аренду (hold - отправка отложена). Если бот упал или перезапустился
+    во время обработки, записи с истекшей арендой снова попадают в очередь при
+    загрузке окна.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[DueNotification]], Awaitable[None]],
+        lookahead_minutes: int = 5,
+        max_heap_size: int = 1000,
+        batch_size: int = 100,
+        lease_minutes: int = 10,
+        retry_delay_seconds: int = 60,
+        max_attempts: int = 5
+    ):
+        self._handler = handler
+        self._lookahead = timedelta(minutes=lookahead_minutes)
+        self._max_heap_size = max_heap_size
+        self._batch_size = batch_size
+        self._lease = timedelta(minutes=lease_minutes)
+        self._retry_delay = timedelta(seconds=retry_delay_seconds)
+        self._max_attempts = max_attempts
+        self._heap: List[Tuple[datetime, int]] = []  # (due_at, ScheduledNotification.id)
+        self._horizon: Optional[datetime] = None  # все записи с due_at <= horizon уже в куче
+        # Загрузка окна заменяет кучу: добавления в кучу ждут ее окончания
+        self._heap_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Запуск таймера; ожидающие уведомления подхватываются из БД"""
+        if self._task and not self._task.done():
+            return
+        async with AsyncSessionLocal() as session:
+            pending = await session.scalar(select(func.count()).select_from(ScheduledNotification))
+        logger.info(f"[NOTIFY] Планировщик уведомлений запущен, ожидающих в БД: {pending}")
+        self._horizon = None
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка таймера (записи остаются в БД до следующего запуска)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def timer_size(self) -> int:
+        """Срабатываний в памяти (ближайшее окно)"""
+        return len(self._heap)
+
+    async def schedule(self, entries: List[Dict[str, Any]]):
+        """Поставить уведомления в очередь.
+
+        Каждый элемент: message_id, employee_id, chat_id, notification_type, delay_minutes, due_at.
+        """
+        if not entries:
+            return
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                insert(ScheduledNotification)
+                .values(entries)
+                .returning(ScheduledNotification.id, ScheduledNotification.due_at)
+            )
+            rows = result.all()
+            await session.commit()
+
+        async with self._heap_lock:
+            self._push(rows)
+
+    def _push(self, rows):
+        """Добавить в кучу записи из текущего окна (вызывается под _heap_lock)"""
+        if self._horizon is None:
+            # Таймер еще не загрузил окно - записи будут подхвачены при загрузке
+            return
+        earliest = self._heap[0][0] if self._heap else None
+        # Запись, вставленная до SELECT загрузки окна, уже в куче
+        queued = {entry_id for _, entry_id in self._heap}
+        for row in rows:
+            if row.due_at > self._horizon or row.id in queued:
+                continue
+            if len(self._heap) >= self._max_heap_size:
+                # Куча заполнена: сужаем окно, остальное будет загружено из БД
+                self._horizon = min(self._horizon, row.due_at - timedelta(microseconds=1))
+                continue
+            heapq.heappush(self._heap, (row.due_at, row.id))
+        if self._heap and (earliest is None or self._heap[0][0] < earliest):
+            self._wakeup.set()
+
+    async def cancel(self, message_ids: List[int]) -> int:
+        """Отменить все запланированные уведомления для сообщений (DBMessage.id)"""
+        if not message_ids:
+            return 0
+        async with AsyncSessionLocal() as session:
+            cancelled = await cancel_scheduled(session, message_ids)
+            await session.commit()
+        return cancelled
+
+    async def complete(self, ids: List[int]):
+        """Уведомления обработаны - удалить их из очереди"""
+        if not ids:
+            return
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(ScheduledNotification).where(ScheduledNotification.id.in_(ids)))
+            await session.commit()
+
+    async def retry(self, ids: List[int]):
+        """Вернуть уведомления в очередь после ошибки (через retry_delay, не больше max_attempts попыток)"""
+        if not ids:
+            return
+        retry_at = datetime.utcnow() + self._retry_delay
+        async with AsyncSessionLocal() as session:
+            dropped = await session.execute(
+                delete(ScheduledNotification)
+                .where(
+                    ScheduledNotification.id.in_(ids),
+                    ScheduledNotification.attempts + 1 >= self._max_attempts
+                )
+                .returning(ScheduledNotification.id, ScheduledNotification.message_id)
+            )
+            dropped_rows = dropped.all()
+            result = await session.execute(
+                update(ScheduledNotification)
+                .where(ScheduledNotification.id.in_(ids))
+                .values(
+                    claimed_until=None,
+                    attempts=ScheduledNotification.attempts + 1,
+                    due_at=retry_at
+                )
+                .returning(ScheduledNotification.id, ScheduledNotification.due_at)
+            )
+            rows = result.all()
+            await session.commit()
+
+        if dropped_rows:
+            logger.error(
+                f"[NOTIFY] Уведомления не доставлены за {self._max_attempts} попыток и удалены из очереди: "
+                f"DBMessage={sorted({row.message_id for row in dropped_rows})}"
+            )
+        async with self._heap_lock:
+            self._push(rows)
+
+    @property
+    def lease(self) -> timedelta:
+        """Срок аренды сработавших записей"""
+        return self._lease
+
+    async def hold(self, ids: List[int], until: datetime):
+        """Продлить аренду уведомлений до until: обработчик отправит их позже сам.
+
+        Если к этому времени записи не удалены (complete) или не возвращены (retry),
+        они снова попадут в очередь.
+        """
+        if not ids:
+            return
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(ScheduledNotification)
+                .where(ScheduledNotification.id.in_(ids))
+                .values(claimed_until=until)
+            )
+            await session.commit()
+
+    async def _run(self):
+        while True:
+            try:
+                now = datetime.utcnow()
+                if self._horizon is None or now >= self._horizon:
+                    await self._refill(now)
+
+                due_ids = []
+                while self._heap and self._heap[0][0] <= now and len(due_ids) < self._batch_size:
+                    due_ids.append(heapq.heappop(self._heap)[1])
+                if due_ids:
+                    await self._fire(due_ids)
+                    continue
+
+                wake_at = self._horizon
+                if self._heap and self._heap[0][0] < wake_at:
+                    wake_at = self._heap[0][0]
+                timeout = max((wake_at - datetime.utcnow()).total_seconds(), 0)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[NOTIFY] Ошибка в цикле планировщика уведомлений: {e}")
+                await asyncio.sleep(5)
+
+    async def _refill(self, now: datetime):
+        """Загрузить из БД ближайшие срабатывания (включая просроченные за время простоя)"""
+        window_end = now + self._lookahead
+        # schedule() и retry() ждут конца загрузки: их записи, вставленные после SELECT,
+        # добавятся уже в новую кучу
+        async with self._heap_lock:
+            async with AsyncSessionLocal() as session:
+                # Аренда истекла, а записи не удалены: обработка прервалась (сбой, перезапуск)
+                reclaimed = await session.execute(
+                    update(ScheduledNotification)
+                    .where(ScheduledNotification.claimed_until < now)
+                    .values(claimed_until=None)
+                )
+                result = await session.execute(
+                    select(ScheduledNotification.id, ScheduledNotification.due_at)
+                    .where(
+                        ScheduledNotification.due_at <= window_end,
+                        ScheduledNotification.claimed_until.is_(None)
+                    )
+                    .order_by(ScheduledNotification.due_at)
+                    .limit(self._max_heap_size)
+                )
+                rows = result.all()
+                await session.commit()
+
+            self._heap = [(row.due_at, row.id) for row in rows]
+            heapq.heapify(self._heap)
+            if len(rows) >= self._max_heap_size:
+                self._horizon = rows[-1].due_at - timedelta(microseconds=1)
+            else:
+                self._horizon = window_end
+        if reclaimed.rowcount:
+            logger.warning(f"[NOTIFY] Возвращены в очередь уведомления с истекшей арендой: {reclaimed.rowcount}")
+
+    async def _fire(self, ids: List[int]):
+        """Захватить сработавшие записи арендой и передать их обработчику"""
+        now = datetime.utcnow()
+        lease_until = now + self._lease
+        async with AsyncSessionLocal() as session:
+            # Отмененные записи уже удалены, захваченные другим срабатыванием - пропускаются
+            result = await session.execute(
+                update(ScheduledNotification)
+                .where(
+                    ScheduledNotification.id.in_(ids),
+                    ScheduledNotification.due_at <= now,
+                    ScheduledNotification.claimed_until.is_(None)
+                )
+                .values(claimed_until=lease_until)
+                .returning(
+                    ScheduledNotification.id,
+                    ScheduledNotification.message_id,
+                    ScheduledNotification.employee_id,
+                    ScheduledNotification.chat_id,
+                    ScheduledNotification.notification_type,
+                    ScheduledNotification.delay_minutes,
+                    ScheduledNotification.due_at
+                )
+            )
+            due = [DueNotification(**row._asdict()) for row in result.all()]
+            await session.commit()
+
+        if not due:
+            return
+        observe_notification_delay((entry.due_at for entry in due), "fired")
+        due.sort(key=lambda entry: entry.due_at)
+        claimed_ids = [entry.id for entry in due]
+        try:
+            await self._handler(due)
+        except Exception as e:
+            logger.error(f"[NOTIFY] Ошибка обработки {len(due)} уведомлений, повтор через {self._retry_delay}: {e}")
+            await self.retry(await self._still_claimed(claimed_ids, lease_until))
+            return
+        # Удаляем только записи с нашей арендой: возвращенные (retry) и отложенные (hold)
+        # обработчиком остаются в очереди
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                delete(ScheduledNotification)
+                .where(
+                    ScheduledNotification.id.in_(claimed_ids),
+                    ScheduledNotification.claimed_until == lease_until
+                )
+            )
+            await session.commit()
+
+    async def _still_claimed(self, ids: List[int], lease_until: datetime) -> List[int]:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(ScheduledNotification.id).where(
+                    ScheduledNotification.id.in_(ids),
+                    ScheduledNotification.claimed_until == lease_until
+                )
+            )
+            return list(result.scalars().all())
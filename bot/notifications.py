@@ -1,11 +1,18 @@
 import asyncio
+from html import escape
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Tuple
 from aiogram import Bot
-from sqlalchemy import select
+from sqlalchemy import select, insert
+from config.log_setup import fields
+from monitoring.metrics import observe_notification_delay
 from database.database import AsyncSessionLocal
-from database.models import Employee, Message, Notification
+from database.models import Message, Notification
 from .settings_manager import settings_manager
+from .employee_directory import employee_directory
+from .chat_metadata import chat_metadata
+from .outbound import send_priority, Priority
+from .notification_scheduler import NotificationScheduler, DueNotification
 from web.services.statistics_service import EmployeeStats
 import logging
 
@@ -13,114 +20,224 @@ logger = logging.getLogger(__name__)
 
 
 class NotificationService:
+    NOTIFICATION_TYPES = ("warning_15", "warning_30", "warning_60")
+    DIGEST_MAX_LINES = 30  # клиентов в одном дайджесте (лимит длины сообщения Telegram)
+
     def __init__(self, bot: Bot):
         self.bot = bot
-        self.scheduled_tasks: Dict[int, List[asyncio.Task]] = {}  # message_id (DBMessage.id): [tasks]
+        self.scheduler = NotificationScheduler(self._deliver_warnings)
+        # Режим дайджеста: накопленные уведомления и таймеры окна по сотрудникам
+        self._digest_pending: Dict[int, List[DueNotification]] = {}
+        self._digest_tasks: Dict[int, asyncio.Task] = {}
+    
+    async def start(self):
+        """Запуск планировщика уведомлений (подхватывает ожидающие уведомления из БД)"""
+        await self.scheduler.start()
+    
+    async def stop(self):
+        """Остановка планировщика уведомлений (накопленные дайджесты отправляются сразу)"""
+        await self.scheduler.stop()
+        for task in list(self._digest_tasks.values()):
+            task.cancel()
+        self._digest_tasks.clear()
+        for employee_id in list(self._digest_pending):
+            await self._flush_digest(employee_id)
     
     async def schedule_warnings_for_message(self, message_id: int, employee_id: int, chat_id: int):
+        await self.schedule_warnings_for_messages([(message_id, employee_id, chat_id)])
+    
+    async def schedule_warnings_for_messages(self, items: List[Tuple[int, int, int]]):
+        """Планирование уведомлений пачкой: items - список (DBMessage.id, employee_id, chat_id)"""
+        if not items:
+            return
         delays = await settings_manager.get_notification_delays()
-        types = ["warning_15", "warning_30", "warning_60"]
-        logger.info(f"[NOTIFY] Планирование уведомлений: DBMessage={message_id}, Employee={employee_id}, Delays={delays}m, Types={types}")
+        logger.debug("[NOTIFY] Планирование уведомлений", extra=fields(messages=[item[0] for item in items], delays=delays))
         if not await settings_manager.notifications_enabled():
             logger.info("[NOTIFY] Уведомления отключены в настройках")
             return
-        for delay, ntype in zip(delays, types):
-            await self.schedule_warning(message_id, employee_id, chat_id, delay, ntype)
+        now = datetime.utcnow()
+        await self.scheduler.schedule([
+            self._make_entry(message_id, employee_id, chat_id, delay, ntype, now)
+            for message_id, employee_id, chat_id in items
+            for delay, ntype in zip(delays, self.NOTIFICATION_TYPES)
+        ])
     
     async def schedule_warning(self, message_id: int, employee_id: int, chat_id: int, delay_minutes: int, notification_type: str):
-        task = asyncio.create_task(
-            self._send_delayed_warning(message_id, employee_id, chat_id, delay_minutes, notification_type)
+        entry = self._make_entry(message_id, employee_id, chat_id, delay_minutes, notification_type, datetime.utcnow())
+        await self.scheduler.schedule([entry])
+    
+    @staticmethod
+    def _make_entry(message_id: int, employee_id: int, chat_id: int, delay_minutes: int, notification_type: str, now: datetime) -> dict:
+        return {
+            "message_id": message_id,
+            "employee_id": employee_id,
+            "chat_id": chat_id,
+            "notification_type": notification_type,
+            "delay_minutes": delay_minutes,
+            "due_at": now + timedelta(minutes=delay_minutes)
+        }
+    
+    @property
+    def digest_pending(self) -> int:
+        """Уведомлений, ожидающих отправки дайджестом"""
+        return sum(len(entries) for entries in self._digest_pending.values())
+    
+    async def _deliver_warnings(self, due: List[DueNotification]):
+        """Отправка сработавших уведомлений (вызывается планировщиком пачкой)"""
+        if await settings_manager.notification_digest_enabled():
+            await self._add_to_digest(due)
+            return
+        
+        to_send = await self._load_pending(due)
+        # Отправки идут параллельно: очередь исходящих сама соблюдает лимиты Telegram,
+        # и несколько уведомлений одному сотруднику не задерживают остальных
+        sent = await asyncio.gather(*(
+            self._send_warning(entry, employee, message) for entry, employee, message in to_send
+        ))
+        await self._record_notifications([entry for (entry, _, _), ok in zip(to_send, sent) if ok])
+        # Неотправленные остаются в очереди и будут повторены; остальные планировщик удалит сам
+        await self.scheduler.retry([entry.id for (entry, _, _), ok in zip(to_send, sent) if not ok])
+    
+    async def _load_pending(self, due: List[DueNotification]) -> list:
+        """Сработавшие уведомления, которые еще нужно отправить: [(entry, сотрудник, DBMessage)] (один запрос)"""
+        async with AsyncSessionLocal() as session:
+            messages_result = await session.execute(
+                select(Message).where(Message.id.in_({entry.message_id for entry in due}))
+            )
+            messages = {message.id: message for message in messages_result.scalars().all()}
+        
+        to_send = []
+        for entry in due:
+            message = messages.get(entry.message_id)
+            if not message or message.responded_at:
+                logger.info(f"[NOTIFY] Сообщение уже отвечено или не найдено: DBMessage={entry.message_id}")
+                continue
+            employee = await employee_directory.get(entry.employee_id)
+            if not employee or not employee.is_active:
+                logger.info(f"[NOTIFY] Сотрудник неактивен или не найден: Employee={entry.employee_id}")
+                continue
+            to_send.append((entry, employee, message))
+        return to_send
+    
+    async def _record_notifications(self, entries: List[DueNotification]):
+        """Записать отправленные уведомления одним INSERT"""
+        if not entries:
+            return
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(Notification).values([
+                {"employee_id": entry.employee_id, "notification_type": entry.notification_type, "message_id": entry.message_id}
+                for entry in entries
+            ]))
+            await session.commit()
+    
+    async def _send_warning(self, entry: DueNotification, employee, message) -> bool:
+        warning_text = await self._get_warning_text(entry.delay_minutes, message)
+        try:
+            with send_priority(Priority.WARNING):
+                await self.bot.send_message(employee.telegram_id, warning_text, parse_mode="HTML")
+            observe_notification_delay([entry.due_at], "sent")
+            logger.info(f"[NOTIFY] Уведомление отправлено: DBMessage={entry.message_id}, Employee={entry.employee_id}, Type={entry.notification_type}")
+            return True
+        except Exception as e:
+            logger.error(f"[NOTIFY] Ошибка отправки: DBMessage={entry.message_id}, Employee={entry.employee_id}, Type={entry.notification_type}: {e}")
+            return False
+    
+    async def _add_to_digest(self, due: List[DueNotification]):
+        """Режим дайджеста: копим уведомления сотрудника в течение окна и отправляем одним сообщением.
+
+        Записи остаются в scheduled_notifications под арендой до конца окна: если бот
+        перезапустится раньше, чем дайджест уйдет, планировщик выдаст их снова.
+        """
+        window = await settings_manager.get_notification_digest_window()
+        await self.scheduler.hold(
+            [entry.id for entry in due],
+            datetime.utcnow() + timedelta(seconds=window) + self.scheduler.lease
         )
-        if message_id not in self.scheduled_tasks:
-            self.scheduled_tasks[message_id] = []
-        self.scheduled_tasks[message_id].append(task)
+        for entry in due:
+            self._digest_pending.setdefault(entry.employee_id, []).append(entry)
+            if entry.employee_id not in self._digest_tasks:
+                self._digest_tasks[entry.employee_id] = asyncio.create_task(self._digest_after(entry.employee_id, window))
     
-    async def _send_delayed_warning(self, message_id: int, employee_id: int, chat_id: int, delay_minutes: int, notification_type: str):
-        # Группируем логи ожидания по DBMessage и Employee
-        if delay_minutes == 1:
-            logger.info(f"[NOTIFY] Ожидание: DBMessage={message_id}, Employee={employee_id}, Delays=[1m, 2m, 60m], Types=[warning_15, warning_30, warning_60]")
+    async def _digest_after(self, employee_id: int, window: int):
         try:
-            await asyncio.sleep(delay_minutes * 60)
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(select(Message).where(Message.id == message_id))
-                message = result.scalar_one_or_none()
-                if message and not message.responded_at:
-                    emp_result = await session.execute(select(Employee).where(Employee.id == employee_id))
-                    employee = emp_result.scalar_one_or_none()
-                    if employee and employee.is_active:
-                        warning_text = await self._get_warning_text(delay_minutes, message)
-                        try:
-                            await self.bot.send_message(employee.telegram_id, warning_text, parse_mode="HTML")
-                            notification = Notification(employee_id=employee_id, notification_type=notification_type, message_id=message_id)
-                            session.add(notification)
-                            await session.commit()
-                            logger.info(f"[NOTIFY] Уведомление отправлено: DBMessage={message_id}, Employee={employee_id}, Type={notification_type}")
-                        except Exception as e:
-                            logger.error(f"[NOTIFY] Ошибка отправки: DBMessage={message_id}, Employee={employee_id}, Type={notification_type}: {e}")
-                    else:
-                        logger.info(f"[NOTIFY] Сотрудник неактивен или не найден: Employee={employee_id}")
-                else:
-                    logger.info(f"[NOTIFY] Сообщение уже отвечено или не найдено: DBMessage={message_id}")
+            await asyncio.sleep(window)
         except asyncio.CancelledError:
-            logger.info(f"[NOTIFY] Уведомление отменено: DBMessage={message_id}, Employee={employee_id}, Type={notification_type}")
-        finally:
-            if message_id in self.scheduled_tasks:
-                self.scheduled_tasks[message_id] = [t for t in self.scheduled_tasks[message_id] if not t.done()]
-                if not self.scheduled_tasks[message_id]:
-                    del self.scheduled_tasks[message_id]
+            self._digest_tasks.pop(employee_id, None)
+            raise
+        self._digest_tasks.pop(employee_id, None)
+        await self._flush_digest(employee_id)
     
-    async def cancel_notifications(self, message_id: int):
-        logger.info(f"[NOTIFY] Отмена уведомлений: DBMessage={message_id}")
-        if message_id in self.scheduled_tasks:
-            for task in self.scheduled_tasks[message_id]:
-                if not task.done():
-                    task.cancel()
-        else:
-            logger.info(f"[NOTIFY] Нет задач для отмены: DBMessage={message_id}")
+    async def _flush_digest(self, employee_id: int):
+        entries = self._digest_pending.pop(employee_id, [])
+        if not entries:
+            return
+        try:
+            to_send = await self._load_pending(entries)
+            ok = True
+            if len({message.id for _, _, message in to_send}) == 1:
+                # Одно сообщение клиента - обычное уведомление с максимальной задержкой
+                entry, employee, message = max(to_send, key=lambda item: item[0].delay_minutes)
+                ok = await self._send_warning(entry, employee, message)
+            elif to_send:
+                ok = await self._send_digest(to_send)
+            if ok:
+                await self._record_notifications([entry for entry, _, _ in to_send])
+                await self.scheduler.complete([entry.id for entry in entries])
+            else:
+                # Уже не нужные (отвечены, сотрудник неактивен) удаляем, остальные - на повтор
+                sending = {entry.id for entry, _, _ in to_send}
+                await self.scheduler.complete([entry.id for entry in entries if entry.id not in sending])
+                await self.scheduler.retry(sorted(sending))
+        except Exception as e:
+            logger.error(f"[NOTIFY] Ошибка отправки дайджеста сотруднику {employee_id}: {e}")
+            await self.scheduler.retry([entry.id for entry in entries])
     
-    async def _get_warning_text(self, delay_minutes, message):
-        chat_id = message.chat_id if hasattr(message, 'chat_id') else message.chat.id
-        abs_chat_id = abs(chat_id)
-        chat_username = getattr(message, 'chat_username', None)
-        chat_link = None
-        # Логируем содержимое message.chat
+    async def _send_digest(self, to_send: list) -> bool:
+        employee = to_send[0][1]
+        text = await self._get_digest_text([message for _, _, message in to_send])
         try:
-            logger.info(f"[NOTIFY-DEBUG] message.chat: {getattr(message, 'chat', None)}")
+            with send_priority(Priority.WARNING):
+                await self.bot.send_message(employee.telegram_id, text, parse_mode="HTML", disable_web_page_preview=True)
+            observe_notification_delay((entry.due_at for entry, _, _ in to_send), "sent")
+            logger.info(f"[NOTIFY] Дайджест отправлен: Employee={employee.id}, уведомлений {len(to_send)}, DBMessage={sorted({message.id for _, _, message in to_send})}")
+            return True
         except Exception as e:
-            logger.warning(f"[NOTIFY-DEBUG] Не удалось залогировать message.chat: {e}")
-        if not chat_username and hasattr(self.bot, 'get_chat'):
-            try:
-                chat = await self.bot.get_chat(chat_id)
-                logger.info(f"[NOTIFY-DEBUG] self.bot.get_chat({chat_id}): {chat}")
-                chat_username = getattr(chat, 'username', None)
-                if chat_username:
-                    logger.info(f"[NOTIFY-DEBUG] Получен username чата: {chat_username}")
-                else:
-                    logger.info(f"[NOTIFY-DEBUG] Username чата отсутствует")
-            except Exception as e:
-                logger.warning(f"[NOTIFY-DEBUG] Ошибка при self.bot.get_chat({chat_id}): {e}")
-                chat_username = None
-        if chat_username:
-            chat_link = f"https://t.me/{chat_username}"
-            chat_line = f"Чат: <a href='{chat_link}'>Перейти в чат</a>"
+            logger.error(f"[NOTIFY] Ошибка отправки дайджеста: Employee={employee.id}: {e}")
+            return False
+    
+    async def cancel_notifications(self, message_id: int):
+        cancelled = await self.scheduler.cancel([message_id])
+        if cancelled:
+            logger.debug("[NOTIFY] Отменены уведомления", extra=fields(cancelled=cancelled, message_id=message_id))
         else:
-            # ВСЕГДА пробуем получить новую invite_link через API
-            try:
-                invite_link = await self.bot.export_chat_invite_link(chat_id)
-            except Exception as e:
-                logger.warning(f"[NOTIFY] Не удалось получить invite-ссылку для чата {chat_id}: {e}")
-                invite_link = None
-            if invite_link:
-                chat_line = f"Чат: <a href='{invite_link}'>Рабочий чат</a>"
-            else:
-                chat_line = f"Чат: <code>{chat_id}</code> (приватный, ссылка недоступна)"
-
-        # Формируем ссылку на профиль клиента
-        client_profile = None
+            logger.debug("[NOTIFY] Нет уведомлений для отмены", extra=fields(message_id=message_id))
+    
+    async def cancel_notifications_bulk(self, message_ids: List[int]):
+        """Отмена уведомлений сразу для нескольких сообщений одним запросом"""
+        if not message_ids:
+            return
+        cancelled = await self.scheduler.cancel(message_ids)
+        logger.debug("[NOTIFY] Отменены уведомления", extra=fields(cancelled=cancelled, messages=len(message_ids)))
+    
+    async def _get_chat_line(self, chat_id: int) -> str:
+        # Метаданные чата из кэша: в обычном режиме без обращений к Bot API
+        chat = await chat_metadata.get(self.bot, chat_id)
+        if chat.username:
+            return f"Чат: <a href='{chat.link}'>Перейти в чат</a>"
+        if chat.invite_link:
+            return f"Чат: <a href='{chat.invite_link}'>{escape(chat.title or 'Рабочий чат')}</a>"
+        return f"Чат: <code>{chat_id}</code> (приватный, ссылка недоступна)"
+    
+    @staticmethod
+    def _client_profile(message) -> str:
         if getattr(message, 'client_username', None):
-            client_profile = f"<a href='https://t.me/{message.client_username}'>@{message.client_username}</a> (ID: {message.client_telegram_id})"
-        else:
-            client_profile = f"ID клиента: <code>{message.client_telegram_id}</code>"
+            return f"<a href='https://t.me/{message.client_username}'>@{message.client_username}</a> (ID: {message.client_telegram_id})"
+        return f"ID клиента: <code>{message.client_telegram_id}</code>"
+    
+    async def _get_warning_text(self, delay_minutes, message):
+        chat_id = message.chat_id if hasattr(message, 'chat_id') else message.chat.id
+        chat_line = await self._get_chat_line(chat_id)
+        client_profile = self._client_profile(message)
 
         return (
             f"⚠️ <b>Вы не ответили на сообщение клиента!</b>\n"
@@ -132,6 +249,33 @@ class NotificationService:
             f"⏱ <b>Время ожидания:</b> {delay_minutes} мин."
         )
     
+    async def _get_digest_text(self, messages: List[Message]) -> str:
+        """Один текст по всем неотвеченным сообщениям сотрудника, сгруппированный по чатам"""
+        now = datetime.utcnow()
+        unique = {message.id: message for message in messages}
+        by_chat = {}
+        for message in sorted(unique.values(), key=lambda message: message.received_at):
+            by_chat.setdefault(message.chat_id, []).append(message)
+        
+        lines = [f"⚠️ <b>Вы не ответили клиентам: {len(unique)}</b>"]
+        shown = 0
+        for chat_id, chat_messages in by_chat.items():
+            if shown >= self.DIGEST_MAX_LINES:
+                break
+            lines.append("")
+            lines.append(await self._get_chat_line(chat_id))
+            for message in chat_messages:
+                if shown >= self.DIGEST_MAX_LINES:
+                    break
+                waited = int((now - message.received_at).total_seconds() // 60)
+                text = escape((message.message_text or "")[:50])
+                lines.append(f"• {self._client_profile(message)} — {waited} мин.: {text}")
+                shown += 1
+        if shown < len(unique):
+            lines.append("")
+            lines.append(f"…и еще сообщений: {len(unique) - shown}")
+        return "\n".join(lines)
+    
     async def send_daily_report(self, employee_id: int, stats_obj: EmployeeStats):
         """Отправка ежедневного отчета сотруднику (принимает объект EmployeeStats)"""
         # Проверяем включены ли ежедневные отчеты
@@ -139,6 +283,21 @@ class NotificationService:
             logger.info(f"Ежедневные отчеты отключены - отчет сотруднику {employee_id} не отправлен")
             return
         
+        text = self.render_daily_report(stats_obj)
+        try:
+            # Получаем информацию о сотруднике
+            employee = await employee_directory.get(employee_id)
+            
+            if employee and employee.is_active:
+                await self.deliver_report(employee.telegram_id, text)
+                logger.info(f"Ежедневный отчет отправлен сотруднику {employee_id}")
+            else:
+                logger.info(f"Сотрудник {employee_id} не найден или неактивен - отчет не отправлен")
+        except Exception as e:
+            logger.error(f"Ошибка при отправке ежедневного отчета сотруднику {employee_id}: {e}")
+    
+    def render_daily_report(self, stats_obj: EmployeeStats) -> str:
+        """Текст ежедневного отчета сотрудника"""
         # Получаем данные из объекта EmployeeStats
         total_messages = stats_obj.total_messages
         responded_messages = stats_obj.responded_messages
@@ -191,26 +350,7 @@ class NotificationService:
         
         # Дополнительная информация
         text += "\n💡 <i>Продолжайте в том же духе!</i>"
-        
-        try:
-            # Получаем информацию о сотруднике
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(
-                    select(Employee).where(Employee.id == employee_id)
-                )
-                employee = result.scalar_one_or_none()
-                
-                if employee and employee.is_active:
-                    await self.bot.send_message(
-                        employee.telegram_id,
-                        text,
-                        parse_mode="HTML"
-                    )
-                    logger.info(f"Ежедневный отчет отправлен сотруднику {employee_id}")
-                else:
-                    logger.info(f"Сотрудник {employee_id} не найден или неактивен - отчет не отправлен")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке ежедневного отчета сотруднику {employee_id}: {e}")
+        return text
     
     async def send_admin_report(self, admin_telegram_id: int, summary_stats: dict, individual_employee_stats: List[EmployeeStats]):
         """Отправка отчета администратору.
@@ -220,7 +360,16 @@ class NotificationService:
         if not await settings_manager.daily_reports_enabled():
             logger.info(f"Ежедневные отчеты отключены - отчет админу {admin_telegram_id} не отправлен")
             return
-            
+        
+        text = self.render_admin_report(summary_stats, individual_employee_stats)
+        try:
+            await self.deliver_report(admin_telegram_id, text)
+            logger.info(f"Отправлен отчет администратору {admin_telegram_id}")
+        except Exception as e:
+            logger.error(f"Не удалось отправить отчет администратору {admin_telegram_id}: {e}")
+    
+    def render_admin_report(self, summary_stats: dict, individual_employee_stats: List[EmployeeStats]) -> str:
+        """Текст общего отчета администратора"""
         text = "📊 <b>Общая статистика по всем сотрудникам:</b>\n\n"
 
         # Используем данные из summary_stats (уже корректно посчитаны)
@@ -252,13 +401,31 @@ class NotificationService:
                     text += f"  • Среднее время (его ответов): {stats_obj.avg_response_time:.1f} мин\n"
                 elif stats_obj.responded_messages == 0:
                     text += f"  • Среднее время (его ответов): - (нет ответов)\n"
+        return text
+    
+    async def deliver_report(self, telegram_id: int, text: str):
+        """Отправить отчет с приоритетом отчетов; длинный текст делится на несколько сообщений.
+        Ошибка отправки пробрасывается вызывающему."""
+        with send_priority(Priority.REPORT):
+            for chunk in split_message(text):
+                await self.bot.send_message(telegram_id, chunk, parse_mode="HTML")
 
-        try:
-            await self.bot.send_message(
-                admin_telegram_id,
-                text,
-                parse_mode="HTML"
-            )
-            logger.info(f"Отправлен отчет администратору {admin_telegram_id}")
-        except Exception as e:
-            logger.error(f"Не удалось отправить отчет администратору {admin_telegram_id}: {e}") 
\ No newline at end of file
+
+def split_message(text: str, limit: int = 4096) -> List[str]:
+    """Разбить текст по строкам на части не длиннее limit (ограничение Telegram на сообщение)"""
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        while len(line) > limit:
+            chunks.append(line[:limit])
+            line = line[limit:]
+        current = line
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,242 @@
+"""Индекс открытых диалогов клиентов в памяти бота"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select, func, and_
+
+from config.config import settings
+from database.cache_versions import OPEN_CONVERSATIONS, get_version, version_notifications
+from database.database import AsyncSessionLocal
+from database.models import Message as DBMessage
+from .message_store import ClientKey
+
+logger = logging.getLogger(__name__)
+
+
+class OpenConversationIndex:
+    """Какие сотрудники ждут ответа клиенту: {(chat_id, client_telegram_id): {employee_id}}.
+
+    Память ограничена: запись живет ttl_seconds с момента записи (обращения ее
+    не продлевают), записей не больше max_entries (вытесняются давно не
+    используемые). Индекс хранит и пустые наборы - "диалог закрыт".
+
+    Ключа нет в индексе - диалог закрыт, если только ключ не был вытеснен или
+    сброшен: такие ключи отмечаются в битовом фильтре фиксированного размера,
+    и их состояние читается из БД. Когда фильтр заполняется, индекс
+    перестраивается из БД (rebuild), как и при запуске бота.
+
+    Изменения, сделанные в обход буфера записи (пересылка, удаление сообщения
+    админом), сбрасывают ключ через invalidate. Веб-панель после изменения
+    диалогов увеличивает версию "open_conversations" в cache_versions: бот
+    проверяет ее раз в poll_seconds (на PostgreSQL - сразу по NOTIFY) и до
+    перестроения читает все диалоги из БД.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        max_entries: int,
+        poll_seconds: int = 5,
+        filter_bits: int = 1 << 20,
+        rebuild_fill_ratio: float = 0.25
+    ):
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        self._poll_seconds = poll_seconds
+        self._entries: "OrderedDict[ClientKey, Tuple[FrozenSet[int], float]]" = OrderedDict()  # ключ -> (сотрудники, время записи)
+        self._filter_bits = filter_bits
+        self._filter = bytearray(filter_bits // 8)
+        self._filter_set = 0
+        self._rebuild_fill_ratio = rebuild_fill_ratio
+        self._complete = False  # индекс загружен из БД полностью: отсутствующий ключ = закрытый диалог
+        self._generation = 0  # растет при каждом invalidate
+        self._rebuilding = False
+        self._invalidated_during_rebuild: Set[ClientKey] = set()
+        self._version: Optional[int] = None  # версия open_conversations, с которой построен индекс
+        self._stale = False  # версия сменилась: индексу нельзя верить до перестроения
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        version_notifications.subscribe(OPEN_CONVERSATIONS, self._on_version_notify)
+
+    async def start(self):
+        """Построить индекс и запустить отслеживание изменений из веб-панели"""
+        await self.rebuild()
+        if not self._task or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """Диалоги изменены в веб-панели или фильтр сброшенных ключей заполнен
+        настолько, что выгоднее перечитать индекс"""
+        return self._stale or self._filter_set > self._filter_bits * self._rebuild_fill_ratio
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, keys: Iterable[ClientKey]) -> Tuple[Dict[ClientKey, Set[int]], List[ClientKey]]:
+        """Известные состояния диалогов и ключи, которые нужно прочитать из БД"""
+        now = time.monotonic()
+        self._evict(now)
+        known: Dict[ClientKey, Set[int]] = {}
+        unknown: List[ClientKey] = []
+        if self._stale:
+            return known, list(set(keys))
+        for key in set(keys):
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self._ttl:
+                # Запись устарела: время жизни считается от записи, а не от обращения
+                del self._entries[key]
+                self._filter_add(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                known[key] = set(entry[0])
+            elif self._complete and not self._filter_has(key):
+                known[key] = set()
+            else:
+                unknown.append(key)
+        return known, unknown
+
+    def has_open_session(self, key: ClientKey, employee_id: int) -> Optional[bool]:
+        """Есть ли у сотрудника неотвеченные сообщения клиента (None - неизвестно, нужен запрос к БД)"""
+        known, _ = self.lookup([key])
+        if key not in known:
+            return None
+        return employee_id in known[key]
+
+    def apply(self, states: Dict[ClientKey, Set[int]], since_generation: int):
+        """Записать состояния диалогов после коммита.
+
+        Если после since_generation были сброшены ключи, состояния могли устареть -
+        тогда ключи сбрасываются, а не записываются.
+        """
+        if since_generation != self._generation:
+            self.invalidate(states.keys())
+            return
+        now = time.monotonic()
+        for key, employee_ids in states.items():
+            self._entries[key] = (frozenset(employee_ids), now)
+            self._entries.move_to_end(key)
+        self._evict(now)
+
+    def invalidate(self, keys: Iterable[ClientKey]):
+        """Сбросить ключи: состояние диалога изменено в обход индекса"""
+        self._generation += 1
+        for key in keys:
+            self._entries.pop(key, None)
+            self._filter_add(key)
+            if self._rebuilding:
+                self._invalidated_during_rebuild.add(key)
+
+    async def rebuild(self):
+        """Перестроить индекс по открытым сообщениям в БД"""
+        self._rebuilding = True
+        self._invalidated_during_rebuild = set()
+        try:
+            async with AsyncSessionLocal() as session:
+                # Версия читается до диалогов: изменение после чтения снова пометит индекс устаревшим
+                version = await get_version(session, OPEN_CONVERSATIONS)
+                last_received = func.max(DBMessage.received_at).label("last_received")
+                result = await session.execute(
+                    select(DBMessage.chat_id, DBMessage.client_telegram_id, DBMessage.employee_id, last_received)
+                    .where(and_(DBMessage.responded_at.is_(None), DBMessage.is_deleted == False))
+                    .group_by(DBMessage.chat_id, DBMessage.client_telegram_id, DBMessage.employee_id)
+                    .order_by(last_received.desc())
+                )
+                rows = result.all()
+        finally:
+            self._rebuilding = False
+
+        states: Dict[ClientKey, Set[int]] = {}
+        complete = True
+        for row in rows:
+            key = (row.chat_id, row.client_telegram_id)
+            if key not in states and len(states) >= self._max_entries:
+                # Открытых диалогов больше лимита - остальные будут читаться из БД
+                complete = False
+                continue
+            states.setdefault(key, set()).add(row.employee_id)
+
+        now = time.monotonic()
+        # Самые свежие диалоги - в конец, их вытеснение наступит позже
+        self._entries = OrderedDict((key, (frozenset(employee_ids), now)) for key, employee_ids in reversed(list(states.items())))
+        self._filter = bytearray(self._filter_bits // 8)
+        self._filter_set = 0
+        self._complete = complete
+        self._version = version
+        self._stale = False
+        invalidated = self._invalidated_during_rebuild
+        self._invalidated_during_rebuild = set()
+        if invalidated:
+            self.invalidate(invalidated)
+        logger.info(f"[CONVERSATIONS] Индекс открытых диалогов перестроен: диалогов {len(self._entries)}, полный: {complete}")
+
+    def _on_version_notify(self):
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _watch(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                async with AsyncSessionLocal() as session:
+                    version = await get_version(session, OPEN_CONVERSATIONS)
+                if version != self._version and not self._stale:
+                    logger.info(f"[CONVERSATIONS] Диалоги изменены в веб-панели: версия {self._version} -> {version}, индекс будет перестроен")
+                    self._stale = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[CONVERSATIONS] Ошибка проверки версии индекса открытых диалогов: {e}")
+
+    def _evict(self, now: float):
+        while self._entries:
+            key, (_, touched_at) = next(iter(self._entries.items()))
+            if len(self._entries) <= self._max_entries and now - touched_at <= self._ttl:
+                break
+            self._entries.popitem(last=False)
+            self._filter_add(key)
+
+    def _filter_position(self, key: ClientKey) -> Tuple[int, int]:
+        position = hash(key) % self._filter_bits
+        return position >> 3, 1 << (position & 7)
+
+    def _filter_add(self, key: ClientKey):
+        index, mask = self._filter_position(key)
+        if not self._filter[index] & mask:
+            self._filter[index] |= mask
+            self._filter_set += 1
+
+    def _filter_has(self, key: ClientKey) -> bool:
+        index, mask = self._filter_position(key)
+        return bool(self._filter[index] & mask)
+
+
+# Глобальный индекс открытых диалогов
+open_conversations = OpenConversationIndex(
+    ttl_seconds=settings.open_conversations_ttl_minutes * 60,
+    max_entries=settings.open_conversations_max_entries,
+    poll_seconds=settings.open_conversations_poll_seconds
+)
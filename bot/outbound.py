@@ -0,0 +1,319 @@
+"""Очередь исходящих сообщений Telegram.
+
+Все отправки бота (и коды входа из веб-панели) проходят через middleware
+сессии aiogram: запрос ждет токен лимита своего чата (~1 сообщение/с), затем
+встает в общую очередь с приоритетом и получает токен общего лимита (~30/с).
+При 429 (TelegramRetryAfter) отправки приостанавливаются на retry_after
+и запрос повторяется, а не теряется.
+
+Приоритет задается контекстом вызова:
+
+    with send_priority(Priority.REPORT):
+        await bot.send_message(...)
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Deque, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config.config import settings
+from monitoring.metrics import REGISTRY, BOT_API_SECONDS, BOT_API_ERRORS, OutboundCollector
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Чем меньше значение, тем раньше отправка"""
+    LOGIN = 0    # коды входа в веб-панель
+    WARNING = 1  # уведомления о просроченных ответах
+    REPLY = 2    # ответы на команды (по умолчанию)
+    REPORT = 3   # ежедневные отчеты
+
+
+_current_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.REPLY)
+
+# Методы, которые публикуют сообщения в чат и подпадают под лимиты Telegram
+LIMITED_METHODS = {"forwardMessage", "copyMessage", "editMessageText"}
+
+
+@contextmanager
+def send_priority(priority: Priority):
+    """Приоритет для всех отправок внутри блока"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не более capacity накопленных"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now <= self.updated:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def drain_until(self, moment: float):
+        """Обнулить токены; новые начнут копиться только с moment"""
+        self.tokens = 0
+        self.updated = max(self.updated, moment)
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self, now: float) -> float:
+        """Забрать токен (в долг, если его нет) и вернуть время ожидания"""
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundMetrics:
+    """Счетчики очереди: глубина по приоритетам, отправлено, 429, ошибки, задержка постановка -> отправка"""
+
+    def __init__(self, latency_window: int = 1000):
+        self.queue_depth: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.sent: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.failed: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.retry_after = 0
+        self.latencies: Dict[Priority, Deque[float]] = {priority: deque(maxlen=latency_window) for priority in Priority}
+
+    def snapshot(self) -> dict:
+        latency = {}
+        for priority, samples in self.latencies.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            latency[priority.name] = {
+                "avg": sum(ordered) / len(ordered),
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1]
+            }
+        return {
+            "queue_depth": {priority.name: value for priority, value in self.queue_depth.items()},
+            "sent": {priority.name: value for priority, value in self.sent.items()},
+            "failed": {priority.name: value for priority, value in self.failed.items()},
+            "retry_after": self.retry_after,
+            "latency_seconds": latency
+        }
+
+
+class OutboundLimiter:
+    """Общий лимит с приоритетами и лимит на чат"""
+
+    def __init__(self, global_rate: float, per_chat_rate: float, max_retries: int, stats_interval: int = 60):
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._per_chat_rate = per_chat_rate
+        self._chats: Dict[int, TokenBucket] = {}
+        self._chat_sent: Dict[int, float] = {}  # время последней разрешенной отправки в чат
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # (priority, seq, future)
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats_interval = stats_interval
+        self.max_retries = max_retries
+        self.metrics = OutboundMetrics()
+
+    async def acquire(self, chat_id, priority: Priority, seq: Optional[int] = None) -> int:
+        """Дождаться права на отправку в чат. Возвращает порядковый номер (для повтора без потери места)"""
+        self._ensure_dispatcher()
+        seq = next(self._seq) if seq is None else seq
+        self.metrics.queue_depth[priority] += 1
+        try:
+            # Сначала лимит чата: ожидание не занимает место в общей очереди
+            wait = self._chat_bucket(chat_id).reserve(time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, seq, future))
+            self._wakeup.set()
+            await future
+            # Общая очередь могла сжать отправки в один чат - выдерживаем интервал чата
+            now = time.monotonic()
+            slot = max(now, self._chat_sent.get(chat_id, 0.0) + 1 / self._per_chat_rate)
+            self._chat_sent[chat_id] = slot
+            if slot > now:
+                await asyncio.sleep(slot - now)
+        finally:
+            self.metrics.queue_depth[priority] -= 1
+        return seq
+
+    def pause(self, seconds: float):
+        """Приостановить все отправки (Telegram вернул 429)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # После паузы отправки возобновляются в темпе лимита, без накопленного всплеска
+        self._global.drain_until(self._paused_until)
+        self.metrics.retry_after += 1
+
+    def stats(self) -> dict:
+        return self.metrics.snapshot()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1000:
+                now = time.monotonic()
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle(now)}
+                self._chat_sent = {key: value for key, value in self._chat_sent.items() if key in self._chats}
+            bucket = self._chats[chat_id] = TokenBucket(self._per_chat_rate, capacity=1)
+        return bucket
+
+    def _ensure_dispatcher(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        last_stats = time.monotonic()
+        while True:
+            while not self._waiters:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._stats_interval)
+                except asyncio.TimeoutError:
+                    pass
+                last_stats = self._log_stats(last_stats)
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self._global.delay(now))
+            if wait > 0:
+                # После ожидания снова выбираем лучший запрос: мог прийти более приоритетный
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # отправитель отменен
+            self._global.reserve(now)
+            future.set_result(None)
+            last_stats = self._log_stats(last_stats)
+
+    def _log_stats(self, last_stats: float) -> float:
+        now = time.monotonic()
+        if now - last_stats < self._stats_interval:
+            return last_stats
+        stats = self.stats()
+        if any(stats["sent"].values()) or any(stats["queue_depth"].values()):
+            logger.info(f"[OUTBOUND] Очередь: {stats['queue_depth']}, отправлено: {stats['sent']}, ошибок: {stats['failed']}, 429: {stats['retry_after']}, задержка: {stats['latency_seconds']}")
+        return now
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    """Middleware сессии aiogram: пропускает отправки через OutboundLimiter"""
+
+    def __init__(self, limiter: OutboundLimiter):
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = getattr(method, "__api_method__", "")
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not (api_method.startswith("send") or api_method in LIMITED_METHODS):
+            return await make_request(bot, method)
+
+        priority = _current_priority.get()
+        enqueued_at = time.monotonic()
+        seq = None
+        for attempt in range(self.limiter.max_retries + 1):
+            seq = await self.limiter.acquire(chat_id, priority, seq)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.limiter.pause(e.retry_after)
+                if attempt == self.limiter.max_retries:
+                    self.limiter.metrics.failed[priority] += 1
+                    raise
+                logger.warning(f"[OUTBOUND] 429 при {api_method} в чат {chat_id}: пауза {e.retry_after} с, повтор {attempt + 1}/{self.limiter.max_retries}")
+                continue
+            except Exception:
+                self.limiter.metrics.failed[priority] += 1
+                raise
+            self.limiter.metrics.sent[priority] += 1
+            self.limiter.metrics.latencies[priority].append(time.monotonic() - enqueued_at)
+            return response
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии aiogram: время и ошибки запросов к Bot API по методам"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = getattr(method, "__api_method__", "") or type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            BOT_API_ERRORS.labels(api_method, type(e).__name__).inc()
+            raise
+        finally:
+            BOT_API_SECONDS.labels(api_method).observe(time.perf_counter() - started)
+
+
+def attach_outbound(bot: Bot) -> Bot:
+    """Подключить к боту общую очередь исходящих сообщений и метрики запросов к API"""
+    bot.session.middleware(OutboundMiddleware(outbound_limiter))
+    # Подключается после очереди - измеряет сам запрос, без ожидания лимитов
+    bot.session.middleware(ApiMetricsMiddleware())
+    return bot
+
+
+_shared_bots: Dict[str, Bot] = {}
+
+
+def get_shared_bot(token: str) -> Bot:
+    """Bot с очередью исходящих для процессов без своего бота (веб-панель)"""
+    bot = _shared_bots.get(token)
+    if bot is None:
+        bot = _shared_bots[token] = attach_outbound(Bot(token=token))
+    return bot
+
+
+async def close_shared_bots():
+    for bot in _shared_bots.values():
+        await bot.session.close()
+    _shared_bots.clear()
+
+
+# Глобальный лимитер исходящих сообщений (один на процесс)
+outbound_limiter = OutboundLimiter(
+    global_rate=settings.outbound_global_rate,
+    per_chat_rate=settings.outbound_per_chat_rate,
+    max_retries=settings.outbound_max_retries
+)
+
+# Очередь исходящих в метриках процесса
+REGISTRY.register(OutboundCollector(outbound_limiter.stats))
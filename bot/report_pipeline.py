@@ -0,0 +1,164 @@
+"""Конвейер ежедневных отчетов: расчет одним проходом, параллельная отправка"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from config.config import settings
+from database.database import AsyncSessionLocal
+from database.dialect import upsert
+from database.models import SystemSettings
+from web.services.statistics_service import StatisticsService
+from .employee_directory import employee_directory
+from .settings_manager import settings_manager
+
+logger = logging.getLogger(__name__)
+
+# Ключ SystemSettings с итогами последнего запуска (JSON)
+LAST_RUN_KEY = "daily_reports_last_run"
+
+
+@dataclass
+class ReportJob:
+    """Готовый к отправке отчет"""
+    telegram_id: int
+    text: str
+    kind: str  # employee / admin
+    employee_id: Optional[int] = None
+
+
+@dataclass
+class ReportRun:
+    """Итоги запуска: время этапов, отправлено, ошибки"""
+    started_at: str
+    trigger: str
+    employees: int = 0
+    admins: int = 0
+    sent: int = 0
+    failed: int = 0
+    compute_seconds: float = 0.0
+    send_seconds: float = 0.0
+    total_seconds: float = 0.0
+    failures: List[Tuple[int, str]] = field(default_factory=list)  # (telegram_id, ошибка)
+
+
+class DailyReportPipeline:
+    """Ежедневные отчеты сотрудникам и администраторам.
+
+    Статистика всех сотрудников считается одним агрегированным запросом
+    (StatisticsService.get_all_employees_stats), общая сводка - один раз на всех
+    админов. Тексты готовятся заранее, отправка идет не более чем в concurrency
+    потоков через общую очередь исходящих (она соблюдает лимиты Telegram);
+    при spread_seconds > 0 отправки равномерно распределяются по этому окну.
+    Итоги запуска пишутся в лог и в SystemSettings (daily_reports_last_run).
+    """
+
+    def __init__(self, notifications, concurrency: int, spread_seconds: float = 0):
+        self.notifications = notifications
+        self._concurrency = max(1, concurrency)
+        self._spread_seconds = max(0.0, spread_seconds)
+
+    async def run(self, trigger: str = "schedule") -> Optional[ReportRun]:
+        if not await settings_manager.daily_reports_enabled():
+            logger.info("[REPORTS] Ежедневные отчеты отключены - отправка пропущена")
+            return None
+
+        run = ReportRun(started_at=datetime.utcnow().isoformat(timespec="seconds"), trigger=trigger)
+        started = time.monotonic()
+        jobs = await self._prepare(run)
+        run.compute_seconds = time.monotonic() - started
+
+        send_started = time.monotonic()
+        await self._send_all(jobs, run)
+        run.send_seconds = time.monotonic() - send_started
+        run.total_seconds = time.monotonic() - started
+
+        logger.info(
+            f"[REPORTS] Отчеты отправлены: сотрудникам {run.employees}, админам {run.admins}, "
+            f"успешно {run.sent}, ошибок {run.failed}; расчет {run.compute_seconds:.2f} с, "
+            f"отправка {run.send_seconds:.2f} с, всего {run.total_seconds:.2f} с"
+        )
+        await self._save_run(run)
+        return run
+
+    async def _prepare(self, run: ReportRun) -> List[ReportJob]:
+        """Расчет статистики и подготовка текстов всех отчетов"""
+        active = {employee.id: employee for employee in await employee_directory.get_active()}
+        admins = await employee_directory.get_active_admins()
+
+        async with AsyncSessionLocal() as session:
+            stats_service = StatisticsService(session)
+            all_stats = await stats_service.get_all_employees_stats(period="today")
+            summary = None
+            if admins:
+                summary = await stats_service.get_dashboard_overview(user_id=admins[0].id, is_admin=True, period="today")
+
+        employee_stats = [stats_obj for stats_obj in all_stats if stats_obj.employee_id in active]
+        jobs = [
+            ReportJob(
+                telegram_id=active[stats_obj.employee_id].telegram_id,
+                text=self.notifications.render_daily_report(stats_obj),
+                kind="employee",
+                employee_id=stats_obj.employee_id
+            )
+            for stats_obj in employee_stats
+        ]
+        if admins:
+            admin_text = self.notifications.render_admin_report(summary, employee_stats)
+            jobs.extend(ReportJob(telegram_id=admin.telegram_id, text=admin_text, kind="admin", employee_id=admin.id) for admin in admins)
+        run.employees = len(employee_stats)
+        run.admins = len(admins)
+        return jobs
+
+    async def _send_all(self, jobs: List[ReportJob], run: ReportRun):
+        semaphore = asyncio.Semaphore(self._concurrency)
+        interval = self._spread_seconds / len(jobs) if jobs else 0
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        async def send(index: int, job: ReportJob):
+            delay = start + index * interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with semaphore:
+                try:
+                    await self.notifications.deliver_report(job.telegram_id, job.text)
+                    run.sent += 1
+                except Exception as e:
+                    run.failed += 1
+                    run.failures.append((job.telegram_id, str(e)))
+                    logger.error(f"[REPORTS] Не удалось отправить отчет ({job.kind}) {job.telegram_id}: {e}")
+
+        await asyncio.gather(*(send(index, job) for index, job in enumerate(jobs)))
+
+    async def _save_run(self, run: ReportRun):
+        try:
+            value = json.dumps(asdict(run), ensure_ascii=False)
+            statement = upsert(SystemSettings).values(
+                key=LAST_RUN_KEY,
+                value=value,
+                description="Итоги последней отправки ежедневных отчетов",
+                updated_at=datetime.utcnow()
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=["key"],
+                set_={"value": statement.excluded.value, "updated_at": statement.excluded.updated_at}
+            )
+            async with AsyncSessionLocal() as session:
+                await session.execute(statement)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"[REPORTS] Не удалось сохранить итоги отправки отчетов: {e}")
+
+
+def create_report_pipeline(notifications, spread: bool = False) -> DailyReportPipeline:
+    """Конвейер с параметрами из конфигурации (окно распределения - только для плановой отправки)"""
+    return DailyReportPipeline(
+        notifications,
+        concurrency=settings.daily_reports_concurrency,
+        spread_seconds=settings.daily_reports_spread_seconds if spread else 0
+    )
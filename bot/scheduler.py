@@ -1,9 +1,10 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 from .settings_manager import settings_manager
-from web.services.statistics_service import StatisticsService
+from .report_pipeline import create_report_pipeline
+from database.daily_stats import rebuild_daily_stats, get_covered_from, set_covered_from, get_first_message_date
 
 logger = logging.getLogger(__name__)
 
@@ -30,10 +31,22 @@ async def setup_scheduler(message_tracker):
         send_daily_reports,
         CronTrigger(hour=hour, minute=minute),
         args=[message_tracker],
+        kwargs={"spread": True},
         id='daily_reports',
         replace_existing=True
     )
     
+    # Ночная пересборка суточной сводки статистики за вчера (даты сводки - UTC)
+    scheduler.add_job(
+        rebuild_yesterday_stats,
+        CronTrigger(hour=0, minute=5, timezone="UTC"),
+        id='daily_stats_rebuild',
+        replace_existing=True
+    )
+    
+    # Время отчетов, измененное в веб-панели, применяется без перезапуска бота
+    settings_manager.add_listener(_on_settings_changed)
+    
     # Запуск планировщика
     scheduler.start()
     logger.info(f"✅ Планировщик задач запущен. Ежедневные отчеты: {daily_time}")
@@ -41,6 +54,11 @@ async def setup_scheduler(message_tracker):
     return scheduler
 
 
+async def _on_settings_changed(previous, current):
+    if previous.daily_reports_time != current.daily_reports_time:
+        await update_daily_reports_time()
+
+
 async def update_daily_reports_time():
     """Обновление времени ежедневных отчетов в планировщике"""
     global global_scheduler, global_message_tracker
@@ -59,6 +77,7 @@ async def update_daily_reports_time():
             send_daily_reports,
             CronTrigger(hour=hour, minute=minute),
             args=[global_message_tracker],
+            kwargs={"spread": True},
             id='daily_reports',
             replace_existing=True  # Заменяем существующую задачу
         )
@@ -69,51 +88,28 @@ async def update_daily_reports_time():
         logger.error(f"Ошибка при обновлении времени отчетов: {e}")
 
 
-async def send_daily_reports(message_tracker):
-    """Отправка ежедневных отчетов"""
+async def send_daily_reports(message_tracker, spread: bool = False):
+    """Отправка ежедневных отчетов (spread - распределить отправку по окну из конфигурации)"""
+    pipeline = create_report_pipeline(message_tracker.notifications, spread=spread)
+    return await pipeline.run(trigger="schedule" if spread else "manual")
+
+
+async def rebuild_yesterday_stats():
+    """Пересборка суточной сводки за вчерашний день.
+    Если сводка еще не собиралась - собирается вся история."""
     from database.database import AsyncSessionLocal
-    from database.models import Employee
-    from sqlalchemy import select
     
+    yesterday = datetime.utcnow().date() - timedelta(days=1)
     async with AsyncSessionLocal() as session:
-        stats_service = StatisticsService(session)
-        
-        # Получаем всех активных сотрудников
-        active_employees_result = await session.execute(
-            select(Employee).where(Employee.is_active == True)
-        )
-        active_employees = active_employees_result.scalars().all()
-        
-        individual_employee_stats_list = []
-        
-        for employee in active_employees:
-            try:
-                # Получаем статистику сотрудника через StatisticsService
-                employee_stats_obj = await stats_service.get_employee_stats(employee.id, period="today")
-                if employee_stats_obj:
-                    individual_employee_stats_list.append(employee_stats_obj)
-                # Отправляем отчет сотруднику
-                    await message_tracker.notifications.send_daily_report(employee.id, employee_stats_obj)
-            except Exception as e:
-                logger.error(f"Ошибка при получении/отправке отчета для сотрудника {employee.id}: {e}")
-        
-        # Отправляем общий отчет администраторам
-        admin_result = await session.execute(
-            select(Employee).where(
-                Employee.is_admin == True,
-                Employee.is_active == True
-            )
-        )
-        admins = admin_result.scalars().all()
-        logger.info(f"[SCHEDULER_DEBUG] Found {len(admins)} admin(s) to send reports to.")
-        
-        if admins:
-            try:
-                # Получаем корректную общую статистику для админов
-                admin_user_id_for_overview = admins[0].id 
-                admin_summary_stats = await stats_service.get_dashboard_overview(user_id=admin_user_id_for_overview, is_admin=True, period="today")
-                for admin in admins:
-                    # Передаем и общую сводку, и детализацию по каждому сотруднику
-                    await message_tracker.notifications.send_admin_report(admin.telegram_id, admin_summary_stats, individual_employee_stats_list)
-            except Exception as e:
-                logger.error(f"Ошибка при подготовке или отправке общего отчета администраторам: {e}") 
\ No newline at end of file
+        try:
+            covered_from = await get_covered_from(session)
+            start_date = yesterday if covered_from else (await get_first_message_date(session) or yesterday)
+            start_date = min(start_date, yesterday)
+            rows = await rebuild_daily_stats(session, start_date, yesterday)
+            if not covered_from:
+                await set_covered_from(session, start_date)
+            await session.commit()
+            logger.info(f"[DAILY-STATS] Сводка пересобрана за {start_date} - {yesterday}: {rows} строк")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"[DAILY-STATS] Ошибка пересборки суточной сводки: {e}")
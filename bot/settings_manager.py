@@ -1,96 +1,226 @@
 """Модуль для получения настроек системы из базы данных"""
 
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.config import settings as app_settings
 from database.database import AsyncSessionLocal
 from database.models import SystemSettings
-from typing import Dict, List, Tuple
-import logging
+from database.cache_versions import SETTINGS, get_version, version_notifications
 
 logger = logging.getLogger(__name__)
 
+# Значения по умолчанию для отсутствующих в БД настроек
+DEFAULT_SETTINGS = {
+    "notification_delay_1": "15",
+    "notification_delay_2": "30",
+    "notification_delay_3": "60",
+    "notifications_enabled": "true",
+    "notification_digest_enabled": "false",
+    "notification_digest_window": "60",
+    "daily_reports_enabled": "true",
+    "daily_reports_time": "18:00"
+}
+
+
+def _parse_int(values: Dict[str, str], key: str) -> int:
+    try:
+        return int(values[key])
+    except (TypeError, ValueError):
+        logger.warning(f"Некорректное значение настройки {key}={values[key]!r}, используется {DEFAULT_SETTINGS[key]}")
+        return int(DEFAULT_SETTINGS[key])
+
+
+def _parse_bool(values: Dict[str, str], key: str) -> bool:
+    return (values[key] or "").lower() == "true"
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """Настройки одной версии, разобранные в типизированные поля"""
+    notification_delays: Tuple[int, int, int]
+    notifications_enabled: bool
+    notification_digest_enabled: bool
+    notification_digest_window: int
+    daily_reports_enabled: bool
+    daily_reports_time: str
+    version: Optional[int] = None
+    values: Dict[str, str] = field(default_factory=dict, compare=False)
+
+    @classmethod
+    def parse(cls, raw: Dict[str, str], version: Optional[int] = None) -> "SettingsSnapshot":
+        values = {**DEFAULT_SETTINGS, **raw}
+        return cls(
+            notification_delays=(
+                _parse_int(values, "notification_delay_1"),
+                _parse_int(values, "notification_delay_2"),
+                _parse_int(values, "notification_delay_3")
+            ),
+            notifications_enabled=_parse_bool(values, "notifications_enabled"),
+            notification_digest_enabled=_parse_bool(values, "notification_digest_enabled"),
+            notification_digest_window=_parse_int(values, "notification_digest_window"),
+            daily_reports_enabled=_parse_bool(values, "daily_reports_enabled"),
+            daily_reports_time=values["daily_reports_time"] or DEFAULT_SETTINGS["daily_reports_time"],
+            version=version,
+            values=values
+        )
+
+
+SettingsListener = Callable[[SettingsSnapshot, SettingsSnapshot], Awaitable[None]]
+
 
 class SettingsManager:
-    """Менеджер настроек системы"""
-    
-    def __init__(self):
-        self._cache = {}
-        self._cache_timeout = 300  # 5 минут кэша
-        self._last_update = 0
-    
+    """Менеджер настроек системы.
+
+    Настройки читаются из БД целиком и разбираются один раз на версию. Веб при
+    сохранении настроек увеличивает версию "settings" в cache_versions; процесс
+    сравнивает версию не чаще раза в poll_seconds (одним запросом) и перечитывает
+    настройки только при ее смене, а на PostgreSQL узнает о смене сразу по NOTIFY.
+    Раз в max_age_seconds настройки перечитываются безусловно. Параллельные
+    вызовы при обновлении ждут один общий запрос.
+    """
+
+    def __init__(self, poll_seconds: int, max_age_seconds: int):
+        self._poll_seconds = poll_seconds
+        self._max_age_seconds = max_age_seconds
+        self._snapshot: Optional[SettingsSnapshot] = None
+        self._loaded_at = float("-inf")
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+        self._listeners: List[SettingsListener] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        version_notifications.subscribe(SETTINGS, self._on_version_notify)
+
+    async def start(self):
+        """Загрузить настройки и следить за сменой версии в фоне (для бота: слушатели
+        изменений вызываются, даже если настройки никто не запрашивает)"""
+        await self.get_snapshot()
+        if not self._task or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def add_listener(self, listener: SettingsListener):
+        """listener(старые, новые) вызывается после загрузки изменившихся настроек"""
+        self._listeners.append(listener)
+
+    async def get_snapshot(self) -> SettingsSnapshot:
+        """Актуальные настройки"""
+        now = time.monotonic()
+        if self._snapshot is None or now - self._loaded_at >= self._max_age_seconds:
+            await self._refresh(check_version=False)
+        elif now - self._checked_at >= self._poll_seconds:
+            await self._refresh(check_version=True)
+        return self._snapshot or SettingsSnapshot.parse({})
+
     async def get_notification_delays(self) -> Tuple[int, int, int]:
         """Получить задержки для уведомлений в минутах"""
-        settings = await self._get_settings()
-        
-        delay1 = int(settings.get("notification_delay_1", "15"))
-        delay2 = int(settings.get("notification_delay_2", "30"))
-        delay3 = int(settings.get("notification_delay_3", "60"))
-        
-        return delay1, delay2, delay3
-    
+        return (await self.get_snapshot()).notification_delays
+
     async def get_notification_settings(self) -> Dict[str, bool]:
         """Получить настройки уведомлений"""
-        settings = await self._get_settings()
-        
+        snapshot = await self.get_snapshot()
         return {
-            "notifications_enabled": settings.get("notifications_enabled", "true").lower() == "true",
-            "daily_reports_enabled": settings.get("daily_reports_enabled", "true").lower() == "true"
+            "notifications_enabled": snapshot.notifications_enabled,
+            "daily_reports_enabled": snapshot.daily_reports_enabled
         }
-    
+
     async def get_daily_reports_time(self) -> str:
         """Получить время отправки ежедневных отчетов"""
-        settings = await self._get_settings()
-        return settings.get("daily_reports_time", "18:00")
-    
+        return (await self.get_snapshot()).daily_reports_time
+
     async def notifications_enabled(self) -> bool:
         """Проверить включены ли уведомления"""
-        settings = await self.get_notification_settings()
-        return settings["notifications_enabled"]
-    
+        return (await self.get_snapshot()).notifications_enabled
+
+    async def notification_digest_enabled(self) -> bool:
+        """Проверить включен ли режим дайджеста (уведомления сотруднику объединяются в одно сообщение)"""
+        return (await self.get_snapshot()).notification_digest_enabled
+
+    async def get_notification_digest_window(self) -> int:
+        """Окно накопления дайджеста в секундах"""
+        return (await self.get_snapshot()).notification_digest_window
+
     async def daily_reports_enabled(self) -> bool:
         """Проверить включены ли ежедневные отчеты"""
-        settings = await self.get_notification_settings()
-        return settings["daily_reports_enabled"]
-    
-    async def _get_settings(self) -> Dict[str, str]:
-        """Получить все настройки из базы данных с кэшированием"""
-        import time
-        current_time = time.time()
-        
-        # Проверяем кэш
-        if self._cache and (current_time - self._last_update) < self._cache_timeout:
-            return self._cache
-        
-        try:
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(select(SystemSettings))
-                settings = result.scalars().all()
-                
-                self._cache = {setting.key: setting.value for setting in settings}
-                self._last_update = current_time
-                
-                logger.info(f"Настройки обновлены из БД: {len(self._cache)} параметров")
-                return self._cache
-                
-        except Exception as e:
-            logger.error(f"Ошибка при получении настроек: {e}")
-            
-            # Возвращаем настройки по умолчанию при ошибке
-            return {
-                "notification_delay_1": "15",
-                "notification_delay_2": "30", 
-                "notification_delay_3": "60",
-                "notifications_enabled": "true",
-                "daily_reports_enabled": "true",
-                "daily_reports_time": "18:00"
-            }
-    
+        return (await self.get_snapshot()).daily_reports_enabled
+
     def clear_cache(self):
-        """Очистить кэш настроек"""
-        self._cache = {}
-        self._last_update = 0
+        """Сбросить кэш настроек: следующий запрос перечитает их из БД"""
+        self._loaded_at = float("-inf")
+        self._checked_at = float("-inf")
         logger.info("Кэш настроек очищен")
 
+    async def _refresh(self, check_version: bool):
+        """Перечитать настройки (при check_version - только если сменилась версия)"""
+        loaded_at, checked_at = self._loaded_at, self._checked_at
+        async with self._lock:
+            if self._loaded_at != loaded_at or self._checked_at != checked_at:
+                # Пока ждали блокировку, настройки уже обновил другой вызов
+                return
+            self._checked_at = time.monotonic()
+            try:
+                async with AsyncSessionLocal() as session:
+                    version = await get_version(session, SETTINGS)
+                    if check_version and self._snapshot is not None and version == self._snapshot.version:
+                        return
+                    result = await session.execute(select(SystemSettings))
+                    raw = {setting.key: setting.value for setting in result.scalars().all()}
+            except Exception as e:
+                # Остаются прежние настройки (или значения по умолчанию), повтор - через poll_seconds
+                logger.error(f"Ошибка при получении настроек: {e}")
+                return
+            previous = self._snapshot
+            self._snapshot = SettingsSnapshot.parse(raw, version)
+            self._loaded_at = time.monotonic()
+        logger.info(f"Настройки обновлены из БД: {len(raw)} параметров, версия {version}")
+        if previous is not None and previous != self._snapshot:
+            await self._notify_listeners(previous, self._snapshot)
+
+    async def _notify_listeners(self, previous: SettingsSnapshot, current: SettingsSnapshot):
+        for listener in self._listeners:
+            try:
+                await listener(previous, current)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика изменения настроек: {e}")
+
+    def _on_version_notify(self):
+        # Проверить версию при следующем обращении, а фоновой задаче - сразу
+        self._checked_at = float("-inf")
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _watch(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.get_snapshot()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка проверки версии настроек: {e}")
+
 
 # Глобальный экземпляр менеджера настроек
-settings_manager = SettingsManager() 
\ No newline at end of file
+settings_manager = SettingsManager(
+    poll_seconds=app_settings.system_settings_poll_seconds,
+    max_age_seconds=app_settings.system_settings_max_age_minutes * 60
+)
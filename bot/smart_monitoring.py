@@ -9,7 +9,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database.database import AsyncSessionLocal
 from database.models import Message, Employee, ChatEmployee
 from .message_analyzer import message_analyzer
+from .employee_directory import employee_directory
 from .notifications import NotificationService
+from .message_store import close_messages, insert_client_message_copies
+from .open_conversations import open_conversations
+from .stats_cache import stats_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -66,8 +70,9 @@ class SmartMonitoringService:
         client_username = telegram_message.from_user.username
         
         # Создаем запись сообщения
-        message = Message(
-            employee_id=employee_id,
+        created = await insert_client_message_copies(
+            db,
+            [employee_id],
             chat_id=telegram_message.chat.id,
             message_id=telegram_message.message_id,
             client_telegram_id=telegram_message.from_user.id,
@@ -79,17 +84,15 @@ class SmartMonitoringService:
             is_addressed_to_specific=True,
             message_type="client"
         )
-        
-        db.add(message)
         await db.commit()
-        await db.refresh(message)
+        stats_cache.invalidate([employee_id])
         
         # Планируем уведомления только для этого сотрудника
-        await self.notification_service.schedule_warnings_for_message(
-            message.id, employee_id, telegram_message.chat.id
-        )
-        
-        logger.info(f"Создано адресное сообщение {message.id} для сотрудника {employee_id}")
+        for copy in created:
+            await self.notification_service.schedule_warnings_for_message(
+                copy.id, employee_id, telegram_message.chat.id
+            )
+            logger.info(f"Создано адресное сообщение {copy.id} для сотрудника {employee_id}")
     
     async def _create_broadcast_messages(self, telegram_message: TelegramMessage, analysis: Dict[str, Any], db: AsyncSession):
         """Создает сообщения для всех активных сотрудников"""
@@ -100,41 +103,35 @@ class SmartMonitoringService:
             logger.warning(f"Нет активных сотрудников для уведомления в чате {telegram_message.chat.id}")
             return
         
-        created_messages = []
-        
         # Формируем имя клиента
         client_name = ((telegram_message.from_user.first_name or '') +
                       (' ' + telegram_message.from_user.last_name if telegram_message.from_user.last_name else '')).strip() or None
         client_username = telegram_message.from_user.username
         
-        for employee_id in target_employees:
-            # Создаем отдельную запись для каждого сотрудника
-            message = Message(
-                employee_id=employee_id,
-                chat_id=telegram_message.chat.id,
-                message_id=telegram_message.message_id,
-                client_telegram_id=telegram_message.from_user.id,
-                client_username=client_username,
-                client_name=client_name,
-                message_text=telegram_message.text,
-                received_at=datetime.utcnow(),
-                is_addressed_to_specific=False,
-                message_type="client"
-            )
-            
-            db.add(message)
-            created_messages.append((message, employee_id))
-        
+        # Сообщение сохраняется один раз, каждому сотруднику - своя копия (назначение)
+        created = await insert_client_message_copies(
+            db,
+            list(target_employees),
+            chat_id=telegram_message.chat.id,
+            message_id=telegram_message.message_id,
+            client_telegram_id=telegram_message.from_user.id,
+            client_username=client_username,
+            client_name=client_name,
+            message_text=telegram_message.text,
+            received_at=datetime.utcnow(),
+            is_addressed_to_specific=False,
+            message_type="client"
+        )
         await db.commit()
+        stats_cache.invalidate(target_employees)
         
         # Планируем уведомления для каждого сотрудника
-        for message, employee_id in created_messages:
-            await db.refresh(message)
+        for copy in created:
             await self.notification_service.schedule_warnings_for_message(
-                message.id, employee_id, telegram_message.chat.id
+                copy.id, copy.employee_id, telegram_message.chat.id
             )
         
-        logger.info(f"Создано {len(created_messages)} общих сообщений для чата {telegram_message.chat.id}")
+        logger.info(f"Создано {len(created)} общих сообщений для чата {telegram_message.chat.id}")
     
     async def _handle_employee_response(self, telegram_message: TelegramMessage, analysis: Dict[str, Any], db: AsyncSession):
         """Обрабатывает ответ сотрудника"""
@@ -145,10 +142,7 @@ class SmartMonitoringService:
         sender_telegram_id = telegram_message.from_user.id
         
         # Находим сотрудника
-        emp_result = await db.execute(
-            select(Employee).where(Employee.telegram_id == sender_telegram_id)
-        )
-        employee = emp_result.scalar_one_or_none()
+        employee = await employee_directory.get_by_telegram_id(sender_telegram_id)
         
         if not employee:
             logger.error(f"Сотрудник с Telegram ID {sender_telegram_id} не найден в базе данных")
@@ -172,91 +166,56 @@ class SmartMonitoringService:
             
         logger.info(f"[DEBUG] Найдено исходное сообщение: id={replied_message.id}, chat_id={replied_message.chat_id}, message_id={replied_message.message_id}")
         
-        # Обновляем сообщение, на которое отвечают, если оно еще не отвечено
+        response_time = datetime.utcnow()
+        closed = []
+        
+        # Обновляем все копии сообщения, на которое отвечают (по chat_id и message_id), если оно еще не отвечено
         if replied_message.responded_at is None:
-            now = datetime.utcnow()
-            # Обновляем все копии этого сообщения (по chat_id и message_id), где responded_at is NULL
-            all_copies_result = await db.execute(
-                select(Message).where(
+            copies = await close_messages(
+                db,
+                [
                     Message.chat_id == replied_message.chat_id,
                     Message.message_id == replied_message.message_id,
-                    Message.message_type == "client",
-                    Message.responded_at.is_(None)
-                )
+                    Message.message_type == "client"
+                ],
+                employee.id,
+                response_time
             )
-            all_copies = all_copies_result.scalars().all()
-            for msg in all_copies:
-                msg.responded_at = now
-                msg.response_time_minutes = (now - msg.received_at).total_seconds() / 60
-                msg.answered_by_employee_id = employee.id
-                await self.notification_service.cancel_notifications(msg.id)
-            await db.flush()
-            await db.commit()
-            logger.info(f"Обновлены все копии сообщения chat_id={replied_message.chat_id}, message_id={replied_message.message_id} (ответ сотрудника {employee.id})")
-        
-        # ГАРАНТИЯ: после любого ответа сотрудника делаем raw SQL UPDATE для всех копий
-        logger.info(f"Перед raw SQL UPDATE: chat_id={replied_message.chat_id}, message_id={replied_message.message_id}")
-        await db.execute(
-            f"""
-            UPDATE messages
-            SET response_time_minutes = (strftime('%s', responded_at) - strftime('%s', received_at)) / 60.0
-            WHERE chat_id = :chat_id AND message_id = :message_id AND responded_at IS NOT NULL
-            """,
-            {"chat_id": replied_message.chat_id, "message_id": replied_message.message_id}
-        )
-        await db.commit()
-        logger.info(f"RAW SQL UPDATE (после всех commit): response_time_minutes обновлено для chat_id={replied_message.chat_id}, message_id={replied_message.message_id}")
+            closed.extend(copies)
+            logger.info(f"Обновлены все копии сообщения chat_id={replied_message.chat_id}, message_id={replied_message.message_id} (ответ сотрудника {employee.id}): {len(copies)}")
         
         client_telegram_id = replied_message.client_telegram_id
-        if not client_telegram_id:
+        if client_telegram_id:
+            # 2. Закрываем ВСЕ неотвеченные сообщения от этого клиента для данного сотрудника одним UPDATE
+            # (время ответа считается в БД индивидуально для каждого сообщения)
+            client_messages = await close_messages(
+                db,
+                [
+                    Message.chat_id == telegram_message.chat.id,
+                    Message.client_telegram_id == client_telegram_id,
+                    Message.message_type == "client",
+                    or_(
+                        Message.employee_id == employee.id,
+                        Message.addressed_to_employee_id == employee.id
+                    )
+                ],
+                employee.id,
+                response_time
+            )
+            closed.extend(client_messages)
+            logger.info(f"Ответ сотрудника {employee.full_name} закрыл {len(client_messages)} сообщений от клиента {client_telegram_id}")
+        else:
             logger.info(f"У сообщения {reply_to_message_id} нет ID клиента")
-            return
-        
-        # 2. Теперь находим ВСЕ неотвеченные сообщения от этого клиента для данного сотрудника
-        all_messages_result = await db.execute(
-            select(Message).where(
-                Message.chat_id == telegram_message.chat.id,
-                Message.client_telegram_id == client_telegram_id,
-                Message.responded_at.is_(None),
-                Message.message_type == "client",
-                or_(
-                    Message.employee_id == employee.id,
-                    Message.addressed_to_employee_id == employee.id
-                )
-            ).order_by(Message.received_at)  # Сортируем по времени для логирования
-        )
-        
-        messages_to_update = all_messages_result.scalars().all()
-        
-        if not messages_to_update:
-            logger.info(f"Нет неотвеченных сообщений от клиента {client_telegram_id}")
-            return
-        
-        response_time = datetime.utcnow()
-        updated_count = 0
-        
-        for message in messages_to_update:
-            # Отмечаем сообщение как отвеченное
-            message.responded_at = response_time
-            
-            # Вычисляем время ответа ИНДИВИДУАЛЬНО для каждого сообщения
-            time_diff = message.responded_at - message.received_at
-            message.response_time_minutes = time_diff.total_seconds() / 60
-            message.answered_by_employee_id = employee.id  # Используем ID сотрудника из базы данных
-            await db.commit()  # Явно сохраняем изменения после каждого обновления
-            
-            # Отменяем запланированные уведомления для каждого сообщения
-            await self.notification_service.cancel_notifications(message.id)
-            
-            updated_count += 1
-            logger.info(f"Сообщение {message.id} отмечено как отвеченное сотрудником {employee.id} (время ответа: {message.response_time_minutes:.1f} мин)")
-        
-        logger.info(f"Ответ сотрудника {employee.full_name} закрыл {updated_count} сообщений от клиента {client_telegram_id}")
         
         # Обновляем активность сотрудника в чате
         await message_analyzer.update_employee_chat_activity(employee.id, telegram_message.chat.id, db)
         
         await db.commit()
+        open_conversations.invalidate({(row.chat_id, row.client_telegram_id) for row in closed})
+        stats_cache.invalidate({row.employee_id for row in closed})
+        
+        # Отменяем запланированные уведомления для всех закрытых сообщений одним запросом
+        await self.notification_service.cancel_notifications_bulk([row.id for row in closed])
     
     async def _handle_employee_activity(self, telegram_message: TelegramMessage, db: AsyncSession):
         """Обрабатывает активность сотрудника в чате"""
@@ -264,10 +223,7 @@ class SmartMonitoringService:
         sender_telegram_id = telegram_message.from_user.id
         
         # Находим сотрудника
-        emp_result = await db.execute(
-            select(Employee).where(Employee.telegram_id == sender_telegram_id)
-        )
-        employee = emp_result.scalar_one_or_none()
+        employee = await employee_directory.get_by_telegram_id(sender_telegram_id)
         
         if employee:
             # Обновляем активность в чате
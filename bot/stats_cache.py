@@ -0,0 +1,63 @@
+"""Короткоживущий кэш статистики для команды /stats"""
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StatsCache:
+    """Результаты расчета статистики на ttl_seconds.
+
+    Запись сотрудника (employee_id) сбрасывается событиями бота, меняющими его
+    статистику: новые сообщения, ответы, пересылка, удаление. Общие записи
+    (employee_id=None, например сводка для админов) сбрасываются любым событием.
+    Изменения из веб-панели бот не видит, их подхватывает TTL.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self._ttl = ttl_seconds
+        self._entries: Dict[Hashable, Tuple[Any, float, Optional[int]]] = {}  # ключ -> (значение, время расчета, сотрудник)
+        self._generation = 0  # растет при каждом invalidate
+
+    async def get(self, key: Hashable, employee_id: Optional[int], compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Значение из кэша или результат compute()"""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[1] < self._ttl:
+            return entry[0]
+        generation = self._generation
+        value = await compute()
+        # Если во время расчета пришли события, результат мог устареть - не кэшируем
+        if self._ttl > 0 and generation == self._generation:
+            self._evict(now)
+            self._entries[key] = (value, now, employee_id)
+        return value
+
+    def invalidate(self, employee_ids: Iterable[int]):
+        """Сбросить записи сотрудников и общие записи"""
+        employee_ids = set(employee_ids)
+        if not employee_ids:
+            return
+        self._generation += 1
+        self._entries = {
+            key: entry for key, entry in self._entries.items()
+            if entry[2] is not None and entry[2] not in employee_ids
+        }
+
+    def clear(self):
+        """Сбросить все записи (отложенные сообщения в /stats считаются по всем сотрудникам)"""
+        self._generation += 1
+        self._entries = {}
+
+    def _evict(self, now: float):
+        expired = [key for key, (_, computed_at, _) in self._entries.items() if now - computed_at >= self._ttl]
+        for key in expired:
+            del self._entries[key]
+
+
+# Глобальный кэш статистики /stats
+stats_cache = StatsCache(ttl_seconds=settings.stats_cache_ttl_seconds)
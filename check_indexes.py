@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Проверка, что частые запросы к сообщениям используют индексы (EXPLAIN).
+
+Запускать после alembic upgrade head. Код выхода 1, если хотя бы один запрос
+читает таблицу целиком или запрос за период не ограничивает поиск по received_at
+(индекс только по сотруднику читает всю его историю).
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import select, and_, or_
+
+from database.database import engine
+from database.dialect import is_postgresql
+from database.models import Message
+
+now = datetime.utcnow()
+week_ago = now - timedelta(days=7)
+
+# Запросы в том виде, в котором их выполняют бот и веб-статистика
+HOT_QUERIES = {
+    # WHERE того же вида, что у UPDATE в close_client_session
+    "Открытые сообщения клиента в чате (закрытие сессии)": select(Message.id).where(
+        and_(
+            Message.chat_id == -100,
+            Message.client_telegram_id == 42,
+            Message.is_deleted == False,
+            Message.responded_at.is_(None)
+        )
+    ),
+    "Открытые сессии у сотрудников (запись пачки сообщений)": select(
+        Message.chat_id, Message.client_telegram_id, Message.employee_id
+    ).where(
+        and_(
+            or_(
+                and_(Message.chat_id == -100, Message.client_telegram_id == 42),
+                and_(Message.chat_id == -100, Message.client_telegram_id == 43)
+            ),
+            Message.employee_id.in_([1, 2, 3]),
+            Message.responded_at.is_(None),
+            Message.is_deleted == False,
+            Message.received_at < now
+        )
+    ).group_by(Message.chat_id, Message.client_telegram_id, Message.employee_id),
+    "Копии сообщения клиента (удаление / отложенные)": select(Message.id).where(
+        Message.chat_id == -100,
+        Message.message_id == 7
+    ),
+    "Статистика сотрудника за период": select(Message.id).where(
+        Message.employee_id == 1,
+        Message.received_at >= week_ago,
+        Message.received_at <= now
+    ),
+    "Ответы сотрудника за период": select(Message.id).where(
+        Message.answered_by_employee_id == 1,
+        Message.received_at >= week_ago,
+        Message.received_at <= now
+    ),
+    "Все сообщения за период": select(Message.id).where(
+        Message.received_at >= week_ago,
+        Message.received_at <= now
+    ),
+}
+
+
+async def explain(conn, query) -> list:
+    """План запроса построчно"""
+    compiled = query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    if is_postgresql():
+        # На маленьких таблицах PostgreSQL предпочитает Seq Scan - проверяем, что индекс вообще применим
+        await conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        result = await conn.exec_driver_sql(f"EXPLAIN {compiled}")
+        return [row[0] for row in result.all()]
+    result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")
+    return [row[-1] for row in result.all()]
+
+
+# Запросы, которые должны искать по диапазону received_at в индексе, а не фильтровать после него
+RANGE_QUERIES = {
+    "Открытые сессии у сотрудников (запись пачки сообщений)",
+    "Статистика сотрудника за период",
+    "Ответы сотрудника за период",
+    "Все сообщения за период",
+}
+
+# Сообщения хранятся в двух таблицах (Message - их JOIN)
+TABLES = ("client_messages", "message_assignments")
+
+
+def uses_index(plan: list) -> bool:
+    if is_postgresql():
+        return not any(f"Seq Scan on {table}" in line for line in plan for table in TABLES)
+    return not any(
+        line.startswith(f"SCAN {table}") and "INDEX" not in line for line in plan for table in TABLES
+    )
+
+
+def uses_range(plan: list) -> bool:
+    """received_at входит в условие поиска по индексу"""
+    if is_postgresql():
+        return any("Index Cond" in line and "received_at" in line for line in plan)
+    return any(line.startswith("SEARCH") and "received_at<" in line for line in plan)
+
+
+async def check_indexes():
+    """Проверка планов частых запросов"""
+    failed = 0
+    async with engine.begin() as conn:
+        for name, query in HOT_QUERIES.items():
+            plan = await explain(conn, query)
+            if not uses_index(plan):
+                failed += 1
+                print(f"❌ {name}: полный просмотр таблицы")
+            elif name in RANGE_QUERIES and not uses_range(plan):
+                failed += 1
+                print(f"❌ {name}: индекс без received_at, читается вся история")
+            else:
+                print(f"✅ {name}")
+            for line in plan:
+                print(f"   {line}")
+    await engine.dispose()
+
+    print(f"\n📊 Запросов: {len(HOT_QUERIES)}, не прошли проверку: {failed}")
+    if failed:
+        print("💡 Выполните: alembic upgrade head")
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(check_indexes()) else 1)
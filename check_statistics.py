@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Сверка SQL-агрегатов статистики с эталонным расчетом на Python"""
+
+import asyncio
+from database.database import AsyncSessionLocal
+from database.models import Message, Employee
+from database.daily_stats import message_stats_aggregates
+from web.services.statistics_service import StatisticsService
+from sqlalchemy import select
+
+async def check_statistics():
+    """Сравнение message_stats_aggregates и _calculate_stats для всех сотрудников"""
+    async with AsyncSessionLocal() as session:
+        service = StatisticsService(session)
+        result = await session.execute(select(Employee))
+        employees = result.scalars().all()
+
+        mismatches = 0
+        for emp in employees:
+            result = await session.execute(select(Message).where(Message.employee_id == emp.id))
+            expected = service._calculate_stats(result.scalars().all())
+
+            result = await session.execute(
+                select(*message_stats_aggregates(emp.id)).where(Message.employee_id == emp.id)
+            )
+            actual = service._build_stats(result.one())
+
+            diff = []
+            for key, value in expected.items():
+                other = actual.get(key)
+                if isinstance(value, float) or isinstance(other, float):
+                    equal = value is not None and other is not None and abs(value - other) < 1e-6 or value == other
+                else:
+                    equal = value == other
+                if not equal:
+                    diff.append(f"{key}: python={value}, sql={other}")
+
+            if diff:
+                mismatches += 1
+                print(f"❌ {emp.full_name} (ID: {emp.id}):")
+                for line in diff:
+                    print(f"   {line}")
+            else:
+                print(f"✅ {emp.full_name} (ID: {emp.id}): {expected['total_messages']} сообщений")
+
+        print(f"\n📊 Проверено сотрудников: {len(employees)}, расхождений: {mismatches}")
+
+if __name__ == "__main__":
+    asyncio.run(check_statistics())
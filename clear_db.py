@@ -8,8 +8,9 @@ async def clear_database():
         try:
             # Список таблиц для очистки
             tables = [
-                'messages',
                 'notifications',
+                'message_assignments',
+                'client_messages',
                 'chat_employees',
                 'system_settings'
             ]
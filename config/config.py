@@ -27,10 +27,68 @@ class Settings(BaseSettings):
     response_time_warning_2: int = Field(30, env="RESPONSE_TIME_WARNING_2")
     response_time_warning_3: int = Field(60, env="RESPONSE_TIME_WARNING_3")
     
+    # Кэш членства сотрудников в чатах
+    membership_cache_ttl_minutes: int = Field(360, env="MEMBERSHIP_CACHE_TTL_MINUTES")
+    membership_check_concurrency: int = Field(5, env="MEMBERSHIP_CHECK_CONCURRENCY")
+    
+    # Метаданные чатов для уведомлений (название, username, invite-ссылка)
+    chat_metadata_ttl_minutes: int = Field(720, env="CHAT_METADATA_TTL_MINUTES")
+    
+    # Настройки системы (проверка версии / безусловное перечитывание)
+    system_settings_poll_seconds: int = Field(5, env="SYSTEM_SETTINGS_POLL_SECONDS")
+    system_settings_max_age_minutes: int = Field(5, env="SYSTEM_SETTINGS_MAX_AGE_MINUTES")
+    
+    # Справочник сотрудников в памяти бота (проверка версии / безусловное перечитывание)
+    employee_directory_poll_seconds: int = Field(5, env="EMPLOYEE_DIRECTORY_POLL_SECONDS")
+    employee_directory_max_age_minutes: int = Field(10, env="EMPLOYEE_DIRECTORY_MAX_AGE_MINUTES")
+    
+    # Индекс открытых диалогов в памяти бота (время жизни записи / максимум записей / проверка версии)
+    open_conversations_ttl_minutes: int = Field(60, env="OPEN_CONVERSATIONS_TTL_MINUTES")
+    open_conversations_max_entries: int = Field(20000, env="OPEN_CONVERSATIONS_MAX_ENTRIES")
+    open_conversations_poll_seconds: int = Field(5, env="OPEN_CONVERSATIONS_POLL_SECONDS")
+    
+    # Кэш результатов /stats (секунд, 0 - без кэша)
+    stats_cache_ttl_seconds: int = Field(60, env="STATS_CACHE_TTL_SECONDS")
+    
+    # Буфер записи сообщений из групп (пачка пишется раз в интервал или по достижении размера)
+    ingest_flush_interval_ms: int = Field(50, env="INGEST_FLUSH_INTERVAL_MS")
+    ingest_max_batch: int = Field(200, env="INGEST_MAX_BATCH")
+    ingest_max_pending: int = Field(10000, env="INGEST_MAX_PENDING")
+    
+    # Исходящие сообщения Telegram (общий лимит и лимит на чат, сообщений в секунду)
+    outbound_global_rate: float = Field(30, env="OUTBOUND_GLOBAL_RATE")
+    outbound_per_chat_rate: float = Field(1, env="OUTBOUND_PER_CHAT_RATE")
+    outbound_max_retries: int = Field(5, env="OUTBOUND_MAX_RETRIES")
+    
+    # Ежедневные отчеты (одновременных отправок / окно распределения плановой отправки, секунд)
+    daily_reports_concurrency: int = Field(10, env="DAILY_REPORTS_CONCURRENCY")
+    daily_reports_spread_seconds: float = Field(0, env="DAILY_REPORTS_SPREAD_SECONDS")
+    
     # Web Server
     web_host: str = Field("0.0.0.0", env="WEB_HOST")
     web_port: int = Field(8000, env="WEB_PORT")
     
+    # Метрики Prometheus бота (порт 0 - не отдавать); веб-панель отдает их на /metrics
+    bot_metrics_host: str = Field("0.0.0.0", env="BOT_METRICS_HOST")
+    bot_metrics_port: int = Field(9101, env="BOT_METRICS_PORT")
+    
+    # Логирование (см. config/log_setup.py): общий уровень, уровни по категориям
+    # ("bot.main=DEBUG,web.services=WARNING"), лимиты записей в секунду по категориям, файл
+    log_level: str = Field("INFO", env="LOG_LEVEL")
+    log_levels: str = Field("", env="LOG_LEVELS")
+    log_sample_rates: str = Field("", env="LOG_SAMPLE_RATES")
+    log_file: str = Field("", env="LOG_FILE")
+
+    # Профилирование SQL по HTTP-запросам веб-панели (см. web/query_profiler.py): размер
+    # буфера /admin/queries, с какого числа повторов запрос считается N+1, строгий бюджет запросов
+    query_profiler_enabled: bool = Field(True, env="QUERY_PROFILER_ENABLED")
+    query_profiler_buffer_size: int = Field(200, env="QUERY_PROFILER_BUFFER_SIZE")
+    query_profiler_n1_threshold: int = Field(5, env="QUERY_PROFILER_N1_THRESHOLD")
+    query_budget_strict: bool = Field(False, env="QUERY_BUDGET_STRICT")
+
+    # Потоковая выгрузка сообщений (/api/statistics/export/messages): строк в пачке курсора
+    export_chunk_size: int = Field(1000, env="EXPORT_CHUNK_SIZE")
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -0,0 +1,169 @@
+"""Настройка логирования бота и веб-сервера.
+
+Записи попадают в очередь (QueueHandler), а форматирование и вывод в поток или
+файл выполняет отдельный поток (QueueListener): обработчики событий не ждут
+ввода-вывода. Уровни задаются по категориям - именам логгеров (LOG_LEVELS).
+Для шумных категорий можно ограничить частоту записей (LOG_SAMPLE_RATES, записей
+в секунду): лишние отбрасываются, их число выводится в поле suppressed следующей
+записи. Ограничение не касается WARNING и выше.
+
+Структурные поля передаются через extra=fields(...) и превращаются в текст
+(key=value) только в потоке записи и только для записей, прошедших фильтры:
+
+    logger.debug("[FORWARD] Личное сообщение", extra=fields(message_id=message.message_id))
+"""
+
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+def fields(**values: Any) -> Dict[str, Any]:
+    """Структурные поля записи: logger.info("...", extra=fields(key=value))"""
+    return {"fields": values}
+
+
+def parse_mapping(value: Optional[str]) -> Dict[str, str]:
+    """Разобрать строку вида "bot.main=DEBUG,web.services=WARNING" в словарь"""
+    mapping = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, item_value = item.split("=", 1)
+            mapping[name.strip()] = item_value.strip()
+    return mapping
+
+
+class StructuredFormatter(logging.Formatter):
+    """Обычный формат плюс структурные поля записи в конце строки"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        record_fields = getattr(record, "fields", None)
+        suppressed = getattr(record, "suppressed", 0)
+        if record_fields or suppressed:
+            values = dict(record_fields or {})
+            if suppressed:
+                values["suppressed"] = suppressed
+            text += " | " + " ".join(
+                f"{key}={value!r}" if isinstance(value, str) else f"{key}={value}"
+                for key, value in values.items()
+            )
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """Не больше rate записей в секунду на категорию (по префиксу имени логгера).
+
+    Пропуск считается в вызывающем потоке до форматирования, поэтому отброшенная
+    запись почти ничего не стоит.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self._rates = rates
+        self._rate_by_logger: Dict[str, Optional[str]] = {}  # имя логгера -> категория с ограничением
+        self._buckets: Dict[str, list] = {}  # категория -> [токены, время пополнения, пропущено]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self._rates or record.levelno >= logging.WARNING:
+            return True
+        category = self._category(record.name)
+        if category is None:
+            return True
+        rate = self._rates[category]
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(category, [rate, now, 0])
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+    def _category(self, name: str) -> Optional[str]:
+        if name not in self._rate_by_logger:
+            category = name
+            while category and category not in self._rates:
+                category = category.rpartition(".")[0]
+            self._rate_by_logger[name] = category or None
+        return self._rate_by_logger[name]
+
+
+class _LazyQueueHandler(QueueHandler):
+    """В вызывающем потоке фиксируется только текст сообщения (аргументы могут
+    измениться позже); время, формат и структурные поля - в потоке записи"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(
+    level: Optional[str] = None,
+    category_levels: Optional[str] = None,
+    sample_rates: Optional[str] = None,
+    log_file: Optional[str] = None,
+    console: bool = True
+) -> QueueListener:
+    """Настроить корневой логгер (повторный вызов возвращает уже запущенный поток записи).
+
+    Без аргументов параметры берутся из конфигурации (LOG_LEVEL, LOG_LEVELS,
+    LOG_SAMPLE_RATES, LOG_FILE). console=False - без вывода в stderr (только файл).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    from config.config import settings
+    level = level or settings.log_level
+    category_levels = category_levels if category_levels is not None else settings.log_levels
+    sample_rates = sample_rates if sample_rates is not None else settings.log_sample_rates
+    log_file = log_file if log_file is not None else settings.log_file
+
+    formatter = StructuredFormatter(FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)] if console else []
+    if log_file:
+        handlers.append(RotatingFileHandler(log_file, maxBytes=50 * 1024 * 1024, backupCount=5, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _LazyQueueHandler(records)
+    queue_handler.addFilter(SamplingFilter({name: float(rate) for name, rate in parse_mapping(sample_rates).items()}))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, category_level in parse_mapping(category_levels).items():
+        logging.getLogger(name).setLevel(category_level.upper())
+
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Дописать записи из очереди и остановить поток записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
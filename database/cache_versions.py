@@ -0,0 +1,93 @@
+"""Версии кэшей для сброса кэшей в памяти между процессами (бот и веб).
+
+Изменивший данные процесс вызывает bump_version в своей транзакции, остальные
+опрашивают get_version одним легким запросом и перечитывают данные при смене версии.
+На PostgreSQL bump_version дополнительно отправляет NOTIFY, и подписчики
+version_notifications узнают о смене версии сразу после коммита, не дожидаясь опроса.
+"""
+
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from database.database import engine
+from database.dialect import upsert, is_postgresql
+from database.models import CacheVersion
+
+logger = logging.getLogger(__name__)
+
+# Имена кэшей
+EMPLOYEES = "employees"
+SETTINGS = "settings"
+OPEN_CONVERSATIONS = "open_conversations"  # сообщения закрыты или изменены в обход бота
+
+# Канал LISTEN/NOTIFY (PostgreSQL), payload - имя кэша
+CHANNEL = "cache_versions"
+
+
+async def bump_version(session: AsyncSession, name: str):
+    """Увеличить версию кэша. Коммит делает вызывающий (вместе с изменением данных)."""
+    statement = upsert(CacheVersion).values(name=name, version=1, updated_at=datetime.utcnow())
+    statement = statement.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"version": CacheVersion.version + 1, "updated_at": statement.excluded.updated_at}
+    )
+    await session.execute(statement)
+    if is_postgresql():
+        # Уведомление доставляется слушателям при коммите транзакции
+        await session.execute(select(func.pg_notify(CHANNEL, name)))
+
+
+async def get_version(session: AsyncSession, name: str) -> Optional[int]:
+    """Текущая версия кэша (None - данные еще ни разу не менялись через bump_version)"""
+    return await session.scalar(select(CacheVersion.version).where(CacheVersion.name == name))
+
+
+class VersionNotifications:
+    """Подписка на смену версий кэшей через LISTEN (только PostgreSQL).
+
+    Держит одно соединение из пула. На SQLite ничего не делает - там остается
+    периодический опрос версии, который работает и как запасной путь, если
+    соединение слушателя оборвется.
+    """
+
+    def __init__(self):
+        self._callbacks: Dict[str, List[Callable[[], None]]] = {}
+        self._connection: Optional[AsyncConnection] = None
+
+    def subscribe(self, name: str, callback: Callable[[], None]):
+        """callback вызывается без аргументов при каждой смене версии кэша name"""
+        self._callbacks.setdefault(name, []).append(callback)
+
+    async def start(self):
+        if not is_postgresql() or self._connection is not None:
+            return
+        try:
+            self._connection = await engine.connect()
+            raw_connection = await self._connection.get_raw_connection()
+            await raw_connection.driver_connection.add_listener(CHANNEL, self._on_notify)
+            logger.info(f"[CACHE] Подписка на смену версий кэшей (LISTEN {CHANNEL}) включена")
+        except Exception as e:
+            logger.error(f"[CACHE] Не удалось подписаться на смену версий кэшей, остается опрос: {e}")
+            await self.stop()
+
+    async def stop(self):
+        if self._connection is not None:
+            try:
+                await self._connection.close()
+            finally:
+                self._connection = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        for callback in self._callbacks.get(payload, []):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"[CACHE] Ошибка обработки смены версии кэша {payload}: {e}")
+
+
+# Глобальная подписка на смену версий (одна на процесс)
+version_notifications = VersionNotifications()
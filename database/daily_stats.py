@@ -0,0 +1,233 @@
+"""Суточная сводка статистики сотрудников (daily_employee_stats / daily_employee_clients).
+
+Сводка обновляется приращениями при записи и закрытии сообщений и может быть
+пересобрана из messages (rebuild_daily_stats.py). Дата строки - день received_at
+сообщения (UTC), поэтому ответ на вчерашнее сообщение обновляет вчерашнюю строку.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select, delete, insert, and_, case, distinct, func, literal, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.dialect import upsert, date_bucket
+from database.models import DailyEmployeeStats, DailyEmployeeClient, Message, SystemSettings
+
+# Аддитивные счетчики сводки (суммируются по дням и чатам)
+COUNTERS = (
+    "total_messages",
+    "responded_messages",
+    "deleted_messages",
+    "answered_by_others",
+    "response_time_sum",
+    "response_time_count",
+    "exceeded_15_min",
+    "exceeded_30_min",
+    "exceeded_60_min",
+)
+
+# С этой даты сводка полная (все более поздние дни можно читать из нее)
+COVERED_FROM_KEY = "daily_stats_covered_from"
+
+
+def message_stats_aggregates(employee_id, condition=None, prefix: str = "") -> list:
+    """SQL-агрегаты статистики по messages (эквивалент StatisticsService._calculate_stats).
+
+    employee_id - id сотрудника (для одного сотрудника) или колонка Message.employee_id
+    (для запроса с GROUP BY employee_id). condition - учитывать только строки,
+    подходящие под условие (условная агрегация: несколько периодов в одном запросе,
+    имена агрегатов различаются префиксом prefix). Суммы по пустому набору - NULL.
+    """
+    def only(value):
+        return case((condition, value)) if condition is not None else value
+
+    answered_by_me = Message.answered_by_employee_id == employee_id
+    answered_by_others = and_(
+        Message.answered_by_employee_id.isnot(None),
+        Message.answered_by_employee_id != employee_id
+    )
+    # Время ответа учитывается только для ответов этого сотрудника (NULL для остальных)
+    my_response_time = only(case((answered_by_me, Message.response_time_minutes)))
+    return [
+        func.count(only(Message.id)).label(f"{prefix}total_messages"),
+        func.sum(only(case((answered_by_me, 1), else_=0))).label(f"{prefix}responded_messages"),
+        func.sum(only(case((Message.is_deleted == True, 1), else_=0))).label(f"{prefix}deleted_messages"),
+        func.sum(only(case((answered_by_others, 1), else_=0))).label(f"{prefix}answered_by_others"),
+        func.count(distinct(only(Message.client_telegram_id))).label(f"{prefix}unique_clients"),
+        func.sum(my_response_time).label(f"{prefix}response_time_sum"),
+        func.count(my_response_time).label(f"{prefix}response_time_count"),
+        func.sum(case((my_response_time > 15, 1), else_=0)).label(f"{prefix}exceeded_15_min"),
+        func.sum(case((my_response_time > 30, 1), else_=0)).label(f"{prefix}exceeded_30_min"),
+        func.sum(case((my_response_time > 60, 1), else_=0)).label(f"{prefix}exceeded_60_min"),
+    ]
+
+
+def _counter_value(name: str, value: float):
+    """Целочисленные счетчики передаются в БД как int (asyncpg не приводит float к integer)"""
+    return value if name == "response_time_sum" else int(value)
+
+
+async def _apply_deltas(session: AsyncSession, deltas: Dict[Tuple[date, int, int], Dict[str, float]]):
+    """Прибавить приращения к строкам сводки (INSERT ... ON CONFLICT DO UPDATE)"""
+    if not deltas:
+        return
+    values = [
+        {
+            "date": day,
+            "employee_id": employee_id,
+            "chat_id": chat_id,
+            **{name: _counter_value(name, counters.get(name, 0)) for name in COUNTERS},
+            "updated_at": datetime.utcnow()
+        }
+        for (day, employee_id, chat_id), counters in deltas.items()
+    ]
+    statement = upsert(DailyEmployeeStats).values(values)
+    statement = statement.on_conflict_do_update(
+        index_elements=["date", "employee_id", "chat_id"],
+        set_={
+            **{name: getattr(DailyEmployeeStats, name) + getattr(statement.excluded, name) for name in COUNTERS},
+            "updated_at": statement.excluded.updated_at
+        }
+    )
+    await session.execute(statement)
+
+
+async def record_received(
+    session: AsyncSession,
+    received_at: datetime,
+    chat_id: int,
+    client_telegram_id: Optional[int],
+    employee_ids: Iterable[int]
+):
+    """Учесть новое сообщение клиента (по копии на каждого сотрудника). Коммит делает вызывающий."""
+    await record_received_many(session, [(received_at, chat_id, client_telegram_id, employee_ids)])
+
+
+async def record_received_many(
+    session: AsyncSession,
+    items: Iterable[Tuple[datetime, int, Optional[int], Iterable[int]]]
+):
+    """Учесть пачку новых сообщений клиентов двумя запросами.
+
+    Элементы - (received_at, chat_id, client_telegram_id, employee_ids). Коммит делает вызывающий.
+    """
+    deltas = defaultdict(lambda: defaultdict(float))
+    clients = set()
+    for received_at, chat_id, client_telegram_id, employee_ids in items:
+        day = received_at.date()
+        for employee_id in employee_ids:
+            deltas[(day, employee_id, chat_id)]["total_messages"] += 1
+            if client_telegram_id is not None:
+                clients.add((day, employee_id, client_telegram_id))
+    await _apply_deltas(session, deltas)
+    if clients:
+        await session.execute(
+            upsert(DailyEmployeeClient)
+            .values([
+                {"date": day, "employee_id": employee_id, "client_telegram_id": client_telegram_id}
+                for day, employee_id, client_telegram_id in clients
+            ])
+            .on_conflict_do_nothing(index_elements=["date", "employee_id", "client_telegram_id"])
+        )
+
+
+async def record_answered(session: AsyncSession, messages: Iterable):
+    """Учесть закрытие сообщений, которые до этого были без ответа.
+
+    Элементы - DBMessage (или объекты с теми же полями) с уже заполненными
+    answered_by_employee_id и response_time_minutes. Коммит делает вызывающий.
+    """
+    deltas = defaultdict(lambda: defaultdict(float))
+    for message in messages:
+        if message.employee_id is None or message.answered_by_employee_id is None:
+            continue
+        counters = deltas[(message.received_at.date(), message.employee_id, message.chat_id)]
+        if message.answered_by_employee_id != message.employee_id:
+            counters["answered_by_others"] += 1
+            continue
+        counters["responded_messages"] += 1
+        response_time = message.response_time_minutes
+        if response_time is not None:
+            counters["response_time_sum"] += response_time
+            counters["response_time_count"] += 1
+            counters["exceeded_15_min"] += response_time > 15
+            counters["exceeded_30_min"] += response_time > 30
+            counters["exceeded_60_min"] += response_time > 60
+    await _apply_deltas(session, deltas)
+
+
+async def rebuild_daily_stats(session: AsyncSession, start_date: date, end_date: date) -> int:
+    """Пересобрать сводку за дни [start_date, end_date] из messages. Коммит делает вызывающий.
+
+    Возвращает количество строк сводки за период.
+    """
+    period_start = datetime.combine(start_date, datetime.min.time())
+    period_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    in_period = and_(
+        Message.received_at >= period_start,
+        Message.received_at < period_end,
+        Message.employee_id.isnot(None)
+    )
+    day = date_bucket(Message.received_at, "day")
+
+    await session.execute(
+        delete(DailyEmployeeStats).where(DailyEmployeeStats.date.between(start_date, end_date))
+    )
+    await session.execute(
+        delete(DailyEmployeeClient).where(DailyEmployeeClient.date.between(start_date, end_date))
+    )
+
+    aggregates = {column.name: column for column in message_stats_aggregates(Message.employee_id)}
+    await session.execute(
+        insert(DailyEmployeeStats).from_select(
+            ["date", "employee_id", "chat_id", *COUNTERS, "updated_at"],
+            select(
+                day,
+                Message.employee_id,
+                Message.chat_id,
+                *(func.coalesce(aggregates[name], 0) for name in COUNTERS),
+                literal(datetime.utcnow(), DateTime)
+            )
+            .where(in_period)
+            .group_by(day, Message.employee_id, Message.chat_id)
+        )
+    )
+    await session.execute(
+        insert(DailyEmployeeClient).from_select(
+            ["date", "employee_id", "client_telegram_id"],
+            select(day, Message.employee_id, Message.client_telegram_id)
+            .where(in_period, Message.client_telegram_id.isnot(None))
+            .distinct()
+        )
+    )
+    return await session.scalar(
+        select(func.count(DailyEmployeeStats.id)).where(DailyEmployeeStats.date.between(start_date, end_date))
+    )
+
+
+async def get_covered_from(session: AsyncSession) -> Optional[date]:
+    """Дата, начиная с которой сводка полная (None - сводка еще не собиралась)"""
+    value = await session.scalar(select(SystemSettings.value).where(SystemSettings.key == COVERED_FROM_KEY))
+    return date.fromisoformat(value) if value else None
+
+
+async def set_covered_from(session: AsyncSession, covered_from: date):
+    """Сохранить дату начала полной сводки. Коммит делает вызывающий."""
+    setting = await session.scalar(select(SystemSettings).where(SystemSettings.key == COVERED_FROM_KEY))
+    if setting:
+        setting.value = covered_from.isoformat()
+        setting.updated_at = datetime.utcnow()
+    else:
+        session.add(SystemSettings(
+            key=COVERED_FROM_KEY,
+            value=covered_from.isoformat(),
+            description="Суточная сводка статистики полная начиная с этой даты"
+        ))
+
+
+async def get_first_message_date(session: AsyncSession) -> Optional[date]:
+    """Дата самого раннего сообщения (начало истории для полной пересборки)"""
+    first_received_at = await session.scalar(select(func.min(Message.received_at)))
+    return first_received_at.date() if first_received_at else None
@@ -1,6 +1,7 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from config.config import settings
+from monitoring.metrics import instrument_engine
 from .models import Base
 
 # Создаем асинхронный движок
@@ -9,6 +10,8 @@ engine = create_async_engine(
     echo=False,
     future=True
 )
+# Количество и время запросов - в метриках процесса
+instrument_engine(engine)
 
 # Создаем фабрику сессий
 AsyncSessionLocal = sessionmaker(
@@ -0,0 +1,76 @@
+"""SQL-выражения, которые отличаются в SQLite и PostgreSQL"""
+
+from datetime import date, datetime, timedelta
+from typing import Union
+
+from sqlalchemy import Date, DateTime, cast, func, literal
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config.config import settings
+
+BUCKETS = ("day", "week", "month")
+
+
+def is_postgresql() -> bool:
+    """Используется ли PostgreSQL (иначе SQLite)"""
+    return settings.database_url.startswith("postgresql")
+
+
+def upsert(table):
+    """INSERT с поддержкой ON CONFLICT (on_conflict_do_update / on_conflict_do_nothing)"""
+    if is_postgresql():
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def date_bucket(column, bucket: str = "day"):
+    """Начало интервала (день / неделя с понедельника / месяц), в который попадает column"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Неизвестный интервал: {bucket}")
+    if is_postgresql():
+        if bucket == "day":
+            return cast(column, Date)
+        return cast(func.date_trunc(bucket, column), Date)
+    if bucket == "day":
+        return func.date(column)
+    if bucket == "week":
+        # 'weekday 0' - ближайшее воскресенье (или тот же день), минус 6 дней - понедельник
+        return func.date(column, "weekday 0", "-6 days")
+    return func.date(column, "start of month")
+
+
+def minutes_between(start, end):
+    """end - start в минутах (дробное число); end - колонка или datetime"""
+    if isinstance(end, datetime):
+        end = literal(end, DateTime)
+    if is_postgresql():
+        return func.extract("epoch", end - start) / 60
+    # julianday - дни с дробной частью, 1440 минут в сутках
+    return (func.julianday(end) - func.julianday(start)) * 1440
+
+
+def to_date(value: Union[date, datetime, str]) -> date:
+    """Привести значение date_bucket к date (SQLite возвращает строку 'YYYY-MM-DD')"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def bucket_start(day: date, bucket: str = "day") -> date:
+    """То же, что date_bucket, но на стороне Python"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day: date, bucket: str = "day") -> date:
+    """Начало следующего интервала"""
+    if bucket == "week":
+        return day + timedelta(days=7)
+    if bucket == "month":
+        return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+    return day + timedelta(days=1)
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Text, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Float, Text, BigInteger, Index, UniqueConstraint, join
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, column_property
 from datetime import datetime
 
 Base = declarative_base()
@@ -22,11 +22,11 @@ class Employee(Base):
     messages = relationship("Message", back_populates="employee", foreign_keys="Message.employee_id")
 
 
-class Message(Base):
-    __tablename__ = "messages"
+class ClientMessage(Base):
+    """Сообщение клиента в групповом чате - одна строка на сообщение Telegram"""
+    __tablename__ = "client_messages"
     
     id = Column(Integer, primary_key=True, index=True)
-    employee_id = Column(Integer, ForeignKey("employees.id"))
     chat_id = Column(Integer, nullable=False)
     message_id = Column(Integer, nullable=False)
     client_telegram_id = Column(Integer, nullable=True)
@@ -34,9 +34,28 @@ class Message(Base):
     client_name = Column(String, nullable=True)
     message_text = Column(Text, nullable=True)
     message_type = Column(String, default="client")  # client, employee
+    received_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Таблицы и индексы создаются миграцией migrations/versions/0006_client_messages.py
+    __table_args__ = (
+        # Одна строка на сообщение Telegram (назначения сотрудникам ссылаются на нее)
+        UniqueConstraint("chat_id", "message_id", name="uq_client_messages_chat_message"),
+        # Сообщения клиента в чате (сессии, закрытие ответом)
+        Index("ix_client_messages_chat_client", "chat_id", "client_telegram_id"),
+        # Постраничный список сообщений (курсор по received_at, id)
+        Index("ix_client_messages_received", "received_at", "id"),
+    )
+
+
+class MessageAssignment(Base):
+    """Сообщение клиента у конкретного сотрудника: состояние ответа"""
+    __tablename__ = "message_assignments"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    client_message_id = Column(Integer, ForeignKey("client_messages.id"), nullable=False)
+    employee_id = Column(Integer, ForeignKey("employees.id"))
     addressed_to_employee_id = Column(Integer, nullable=True)
     is_addressed_to_specific = Column(Boolean, default=False)
-    received_at = Column(DateTime, default=datetime.utcnow)
     responded_at = Column(DateTime, nullable=True)
     response_time_minutes = Column(Float, nullable=True)
     answered_by_employee_id = Column(Integer, ForeignKey("employees.id"), nullable=True)
@@ -44,17 +63,64 @@ class Message(Base):
     is_deleted = Column(Boolean, default=False)
     deleted_at = Column(DateTime, nullable=True)
     is_deferred = Column(Boolean, default=False)
+    # Копия client_messages.received_at: выборки сотрудника за период идут по одному индексу без JOIN
+    received_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Копии сообщения (и копия конкретного сотрудника - проверка фильтра списка сообщений)
+        Index("ix_message_assignments_client_message", "client_message_id", "employee_id"),
+        # Открытые (неотвеченные и не удаленные) назначения - частичные индексы
+        Index(
+            "ix_message_assignments_open",
+            "client_message_id",
+            sqlite_where=(responded_at.is_(None) & (is_deleted == False)),
+            postgresql_where=(responded_at.is_(None) & (is_deleted == False))
+        ),
+        Index(
+            "ix_message_assignments_employee_open",
+            "employee_id", "received_at",
+            sqlite_where=(responded_at.is_(None) & (is_deleted == False)),
+            postgresql_where=(responded_at.is_(None) & (is_deleted == False))
+        ),
+        # Статистика сотрудника за период
+        Index("ix_message_assignments_employee", "employee_id", "received_at"),
+        Index("ix_message_assignments_answered_by", "answered_by_employee_id", "received_at"),
+        # Выборки за период
+        Index("ix_message_assignments_received_at", "received_at"),
+    )
+
+
+class Message(Base):
+    """Копия сообщения клиента у сотрудника в прежнем виде (одна строка на сотрудника).
+
+    Отображение на JOIN назначения и сообщения клиента: id - id назначения,
+    поля клиента хранятся один раз в client_messages. Чтение и изменение
+    объектов работают как раньше; новые сообщения вставляются через
+    bot.message_store (ORM-вставка создает новую строку client_messages),
+    массовые UPDATE/DELETE - по таблицам напрямую. Для SQL вне приложения
+    миграция 0006_client_messages создает представление messages с прежними колонками.
+    """
+    __table__ = join(
+        MessageAssignment.__table__,
+        ClientMessage.__table__,
+        MessageAssignment.__table__.c.client_message_id == ClientMessage.__table__.c.id
+    )
+    
+    id = MessageAssignment.__table__.c.id
+    client_message_id = column_property(ClientMessage.__table__.c.id, MessageAssignment.__table__.c.client_message_id)
+    # В запросах - колонка назначения (индексы по сотруднику и периоду), при записи меняются обе
+    received_at = column_property(MessageAssignment.__table__.c.received_at, ClientMessage.__table__.c.received_at)
     
     # Relationships
-    employee = relationship("Employee", back_populates="messages", foreign_keys=[employee_id])
-    answered_by = relationship("Employee", foreign_keys=[answered_by_employee_id])
+    employee = relationship("Employee", back_populates="messages", foreign_keys="Message.employee_id")
+    answered_by = relationship("Employee", foreign_keys="Message.answered_by_employee_id")
 
 
 class Notification(Base):
     __tablename__ = "notifications"
     
     id = Column(Integer, primary_key=True, index=True)
-    message_id = Column(Integer, ForeignKey("messages.id"))
+    message_id = Column(Integer, ForeignKey("message_assignments.id"))
     employee_id = Column(Integer, ForeignKey("employees.id"))
     notification_type = Column(String, nullable=False)  # '15min', '30min', '60min'
     sent_at = Column(DateTime, default=datetime.utcnow)
@@ -100,4 +166,85 @@ class DeferredMessageSimple(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     client_telegram_id = Column(BigInteger, nullable=True)
     employee_id = Column(Integer, ForeignKey("employees.id"), nullable=True)
-    chat_id = Column(BigInteger, nullable=True)
\ No newline at end of file
+    chat_id = Column(BigInteger, nullable=True)
+
+
+class ScheduledNotification(Base):
+    __tablename__ = "scheduled_notifications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    message_id = Column(Integer, ForeignKey("message_assignments.id"), nullable=False, index=True)
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    notification_type = Column(String, nullable=False)  # 'warning_15', 'warning_30', 'warning_60'
+    delay_minutes = Column(Integer, nullable=False)
+    due_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Аренда обработки: запись забрана таймером и удаляется после отправки
+    claimed_until = Column(DateTime, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class DailyEmployeeStats(Base):
+    """Суточная сводка по сотруднику в чате (дата - по received_at сообщения, UTC)"""
+    __tablename__ = "daily_employee_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(Date, nullable=False)
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    total_messages = Column(Integer, nullable=False, default=0)
+    responded_messages = Column(Integer, nullable=False, default=0)
+    deleted_messages = Column(Integer, nullable=False, default=0)
+    answered_by_others = Column(Integer, nullable=False, default=0)
+    response_time_sum = Column(Float, nullable=False, default=0)
+    response_time_count = Column(Integer, nullable=False, default=0)
+    exceeded_15_min = Column(Integer, nullable=False, default=0)
+    exceeded_30_min = Column(Integer, nullable=False, default=0)
+    exceeded_60_min = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("date", "employee_id", "chat_id", name="uq_daily_employee_stats"),
+        Index("ix_daily_employee_stats_employee_date", "employee_id", "date"),
+    )
+
+
+class DailyEmployeeClient(Base):
+    """Клиенты сотрудника за сутки - для точного подсчета уникальных клиентов за период"""
+    __tablename__ = "daily_employee_clients"
+
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(Date, nullable=False)
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
+    client_telegram_id = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("date", "employee_id", "client_telegram_id", name="uq_daily_employee_clients"),
+        Index("ix_daily_employee_clients_employee_date", "employee_id", "date"),
+    )
+
+
+class CacheVersion(Base):
+    """Версия данных, закэшированных в памяти процессов (сотрудники, настройки).
+
+    Процесс, изменивший данные, увеличивает версию в той же транзакции;
+    остальные процессы периодически сравнивают версию и перечитывают данные.
+    """
+    __tablename__ = "cache_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Chat(Base):
+    """Метаданные групповых чатов для ссылок в уведомлениях (кэш ответов Bot API)"""
+    __tablename__ = "chats"
+
+    chat_id = Column(BigInteger, primary_key=True)
+    title = Column(String, nullable=True)
+    username = Column(String, nullable=True)
+    chat_type = Column(String, nullable=True)
+    invite_link = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
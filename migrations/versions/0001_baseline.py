@@ -0,0 +1,161 @@
+"""Базовая схема
+
+Создает отсутствующие таблицы и доводит до текущего вида базы, созданные через
+create_all и ранее обновлявшиеся скриптами migrate_*.py / add_answered_by_migration.py
+(is_deferred и answered_by_employee_id в messages; nullable from_user_id и
+client_telegram_id / employee_id / chat_id в deferred_messages_simple).
+Повторный запуск ничего не меняет.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_baseline'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _tables() -> set:
+    if context.is_offline_mode():
+        # alembic upgrade --sql: схема считается пустой
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _columns(table: str) -> dict:
+    return {column["name"]: column for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    tables = _tables()
+
+    if "employees" not in tables:
+        op.create_table(
+            "employees",
+            sa.Column("id", sa.Integer(), primary_key=True, index=True),
+            sa.Column("telegram_id", sa.Integer(), unique=True, index=True, nullable=False),
+            sa.Column("telegram_username", sa.String(), nullable=True),
+            sa.Column("full_name", sa.String(), nullable=False),
+            sa.Column("is_active", sa.Boolean(), nullable=True),
+            sa.Column("is_admin", sa.Boolean(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+        )
+
+    if "messages" not in tables:
+        op.create_table(
+            "messages",
+            sa.Column("id", sa.Integer(), primary_key=True, index=True),
+            sa.Column("employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=True),
+            sa.Column("chat_id", sa.Integer(), nullable=False),
+            sa.Column("message_id", sa.Integer(), nullable=False),
+            sa.Column("client_telegram_id", sa.Integer(), nullable=True),
+            sa.Column("client_username", sa.String(), nullable=True),
+            sa.Column("client_name", sa.String(), nullable=True),
+            sa.Column("message_text", sa.Text(), nullable=True),
+            sa.Column("message_type", sa.String(), nullable=True),
+            sa.Column("addressed_to_employee_id", sa.Integer(), nullable=True),
+            sa.Column("is_addressed_to_specific", sa.Boolean(), nullable=True),
+            sa.Column("received_at", sa.DateTime(), nullable=True),
+            sa.Column("responded_at", sa.DateTime(), nullable=True),
+            sa.Column("response_time_minutes", sa.Float(), nullable=True),
+            sa.Column("answered_by_employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=True),
+            sa.Column("is_missed", sa.Boolean(), nullable=True),
+            sa.Column("is_deleted", sa.Boolean(), nullable=True),
+            sa.Column("deleted_at", sa.DateTime(), nullable=True),
+            sa.Column("is_deferred", sa.Boolean(), nullable=True),
+        )
+    else:
+        columns = _columns("messages")
+        if "answered_by_employee_id" not in columns:
+            with op.batch_alter_table("messages") as batch_op:
+                batch_op.add_column(sa.Column("answered_by_employee_id", sa.Integer(), nullable=True))
+                batch_op.create_foreign_key(
+                    "fk_messages_answered_by_employee", "employees", ["answered_by_employee_id"], ["id"]
+                )
+        if "is_deferred" not in columns:
+            op.add_column("messages", sa.Column("is_deferred", sa.Boolean(), server_default=sa.false(), nullable=True))
+
+    if "notifications" not in tables:
+        op.create_table(
+            "notifications",
+            sa.Column("id", sa.Integer(), primary_key=True, index=True),
+            sa.Column("message_id", sa.Integer(), sa.ForeignKey("messages.id"), nullable=True),
+            sa.Column("employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=True),
+            sa.Column("notification_type", sa.String(), nullable=False),
+            sa.Column("sent_at", sa.DateTime(), nullable=True),
+        )
+
+    if "system_settings" not in tables:
+        op.create_table(
+            "system_settings",
+            sa.Column("id", sa.Integer(), primary_key=True, index=True),
+            sa.Column("key", sa.String(), unique=True, nullable=False),
+            sa.Column("value", sa.String(), nullable=True),
+            sa.Column("description", sa.String(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+        )
+
+    if "chat_employees" not in tables:
+        op.create_table(
+            "chat_employees",
+            sa.Column("id", sa.Integer(), primary_key=True, index=True),
+            sa.Column("chat_id", sa.Integer(), nullable=False),
+            sa.Column("employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=True),
+            sa.Column("is_active_in_chat", sa.Boolean(), nullable=True),
+            sa.Column("last_seen_at", sa.DateTime(), nullable=True),
+            sa.Column("assigned_at", sa.DateTime(), nullable=True),
+        )
+
+    if "deferred_messages_simple" not in tables:
+        op.create_table(
+            "deferred_messages_simple",
+            sa.Column("id", sa.Integer(), primary_key=True, index=True),
+            sa.Column("from_user_id", sa.BigInteger(), nullable=True),
+            sa.Column("from_username", sa.String(), nullable=True),
+            sa.Column("text", sa.Text(), nullable=True),
+            sa.Column("date", sa.DateTime(), nullable=False),
+            sa.Column("is_active", sa.Boolean(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("client_telegram_id", sa.BigInteger(), nullable=True),
+            sa.Column("employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=True),
+            sa.Column("chat_id", sa.BigInteger(), nullable=True),
+        )
+    else:
+        columns = _columns("deferred_messages_simple")
+        with op.batch_alter_table("deferred_messages_simple") as batch_op:
+            if not columns["from_user_id"]["nullable"]:
+                batch_op.alter_column("from_user_id", existing_type=sa.BigInteger(), nullable=True)
+            if "client_telegram_id" not in columns:
+                batch_op.add_column(sa.Column("client_telegram_id", sa.BigInteger(), nullable=True))
+            if "employee_id" not in columns:
+                batch_op.add_column(sa.Column("employee_id", sa.Integer(), nullable=True))
+            if "chat_id" not in columns:
+                batch_op.add_column(sa.Column("chat_id", sa.BigInteger(), nullable=True))
+
+    if "scheduled_notifications" not in tables:
+        op.create_table(
+            "scheduled_notifications",
+            sa.Column("id", sa.Integer(), primary_key=True, index=True),
+            sa.Column("message_id", sa.Integer(), sa.ForeignKey("messages.id"), nullable=False, index=True),
+            sa.Column("employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=False),
+            sa.Column("chat_id", sa.BigInteger(), nullable=False),
+            sa.Column("notification_type", sa.String(), nullable=False),
+            sa.Column("delay_minutes", sa.Integer(), nullable=False),
+            sa.Column("due_at", sa.DateTime(), nullable=False, index=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    # Базовая схема не откатывается: данные бота хранятся только в этих таблицах
+    pass
@@ -0,0 +1,61 @@
+"""Индексы messages под частые запросы
+
+Частичный индекс открытых сообщений (responded_at IS NULL AND NOT is_deleted)
+поддерживают и SQLite, и PostgreSQL. Уже существующие индексы пропускаются.
+
+Revision ID: 0002_message_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18 12:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_message_indexes'
+down_revision: Union[str, None] = '0001_baseline'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Условие совпадает с Message.__table_args__, чтобы DDL был таким же, как у create_all
+OPEN_MESSAGES = sa.and_(
+    sa.column("responded_at", sa.DateTime()).is_(None),
+    sa.column("is_deleted", sa.Boolean()) == False
+)
+
+INDEXES = [
+    ("ix_messages_open_chat_client", ["chat_id", "client_telegram_id"], OPEN_MESSAGES),
+    ("ix_messages_chat_message", ["chat_id", "message_id"], None),
+    ("ix_messages_employee_received", ["employee_id", "received_at"], None),
+    ("ix_messages_answered_by_received", ["answered_by_employee_id", "received_at"], None),
+    ("ix_messages_received_at", ["received_at"], None),
+]
+
+
+def _existing_indexes() -> set:
+    if context.is_offline_mode():
+        # alembic upgrade --sql: схема считается пустой
+        return set()
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("messages")}
+
+
+def upgrade() -> None:
+    existing = _existing_indexes()
+    for name, columns, where in INDEXES:
+        if name in existing:
+            continue
+        if where is not None:
+            op.create_index(name, "messages", columns, sqlite_where=where, postgresql_where=where)
+        else:
+            op.create_index(name, "messages", columns)
+
+
+def downgrade() -> None:
+    existing = _existing_indexes()
+    for name, _, _ in reversed(INDEXES):
+        if name in existing:
+            op.drop_index(name, table_name="messages")
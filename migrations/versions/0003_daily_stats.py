@@ -0,0 +1,69 @@
+"""Суточная сводка статистики
+
+Таблицы daily_employee_stats и daily_employee_clients. После применения
+заполните сводку: python rebuild_daily_stats.py
+
+Revision ID: 0003_daily_stats
+Revises: 0002_message_indexes
+Create Date: 2026-10-18 13:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_daily_stats'
+down_revision: Union[str, None] = '0002_message_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _tables() -> set:
+    if context.is_offline_mode():
+        # alembic upgrade --sql: схема считается пустой
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    tables = _tables()
+
+    if "daily_employee_stats" not in tables:
+        op.create_table(
+            "daily_employee_stats",
+            sa.Column("id", sa.Integer(), primary_key=True, index=True),
+            sa.Column("date", sa.Date(), nullable=False),
+            sa.Column("employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=False),
+            sa.Column("chat_id", sa.BigInteger(), nullable=False),
+            sa.Column("total_messages", sa.Integer(), nullable=False),
+            sa.Column("responded_messages", sa.Integer(), nullable=False),
+            sa.Column("deleted_messages", sa.Integer(), nullable=False),
+            sa.Column("answered_by_others", sa.Integer(), nullable=False),
+            sa.Column("response_time_sum", sa.Float(), nullable=False),
+            sa.Column("response_time_count", sa.Integer(), nullable=False),
+            sa.Column("exceeded_15_min", sa.Integer(), nullable=False),
+            sa.Column("exceeded_30_min", sa.Integer(), nullable=False),
+            sa.Column("exceeded_60_min", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.UniqueConstraint("date", "employee_id", "chat_id", name="uq_daily_employee_stats"),
+            sa.Index("ix_daily_employee_stats_employee_date", "employee_id", "date"),
+        )
+
+    if "daily_employee_clients" not in tables:
+        op.create_table(
+            "daily_employee_clients",
+            sa.Column("id", sa.Integer(), primary_key=True, index=True),
+            sa.Column("date", sa.Date(), nullable=False),
+            sa.Column("employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=False),
+            sa.Column("client_telegram_id", sa.BigInteger(), nullable=False),
+            sa.UniqueConstraint("date", "employee_id", "client_telegram_id", name="uq_daily_employee_clients"),
+            sa.Index("ix_daily_employee_clients_employee_date", "employee_id", "date"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("daily_employee_clients")
+    op.drop_table("daily_employee_stats")
@@ -0,0 +1,42 @@
+"""Версии кэшей в памяти процессов
+
+Таблица cache_versions: веб увеличивает версию при изменении сотрудников,
+бот по ней понимает, что справочник сотрудников нужно перечитать.
+
+Revision ID: 0004_cache_versions
+Revises: 0003_daily_stats
+Create Date: 2026-10-18 14:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_cache_versions'
+down_revision: Union[str, None] = '0003_daily_stats'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _tables() -> set:
+    if context.is_offline_mode():
+        # alembic upgrade --sql: схема считается пустой
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    if "cache_versions" not in _tables():
+        op.create_table(
+            "cache_versions",
+            sa.Column("name", sa.String(), primary_key=True),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("cache_versions")
@@ -0,0 +1,45 @@
+"""Метаданные групповых чатов
+
+Таблица chats: название, username и invite-ссылка чата, чтобы уведомления
+не запрашивали их у Telegram при каждой отправке.
+
+Revision ID: 0005_chats
+Revises: 0004_cache_versions
+Create Date: 2026-10-18 16:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_chats'
+down_revision: Union[str, None] = '0004_cache_versions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _tables() -> set:
+    if context.is_offline_mode():
+        # alembic upgrade --sql: схема считается пустой
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    if "chats" not in _tables():
+        op.create_table(
+            "chats",
+            sa.Column("chat_id", sa.BigInteger(), primary_key=True),
+            sa.Column("title", sa.String(), nullable=True),
+            sa.Column("username", sa.String(), nullable=True),
+            sa.Column("chat_type", sa.String(), nullable=True),
+            sa.Column("invite_link", sa.String(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("chats")
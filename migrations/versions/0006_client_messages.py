@@ -0,0 +1,266 @@
+"""Сообщения клиентов отдельно от копий сотрудников
+
+Таблица messages хранила полную копию сообщения (текст, имя клиента и т.д.)
+для каждого сотрудника. Сообщение теперь хранится один раз в client_messages,
+копии - узкие строки message_assignments (состояние ответа сотрудника).
+
+Данные переносятся из messages: id сообщения клиента - id его первой копии,
+id назначений совпадают с id прежних копий, поэтому ссылки notifications и
+scheduled_notifications остаются верными (внешние ключи переводятся на
+message_assignments). received_at берется у первой копии (у копий одного
+сообщения оно совпадает) и остается и в назначениях: статистика сотрудника
+за период и поиск его открытых сессий идут по индексу (employee_id,
+received_at) без JOIN. Вместо таблицы создается представление messages
+с прежними колонками.
+
+Перед миграцией остановите бота: если новая версия уже успела записать
+сообщения в новые таблицы (их создает init_db), а в messages есть данные,
+миграция прерывается.
+
+Revision ID: 0006_client_messages
+Revises: 0005_chats
+Create Date: 2026-10-18 19:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_client_messages'
+down_revision: Union[str, None] = '0005_chats'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+CLIENT_COLUMNS = [
+    "chat_id", "message_id", "client_telegram_id", "client_username", "client_name",
+    "message_text", "message_type", "received_at"
+]
+ASSIGNMENT_COLUMNS = [
+    "employee_id", "addressed_to_employee_id", "is_addressed_to_specific", "responded_at",
+    "response_time_minutes", "answered_by_employee_id", "is_missed", "is_deleted", "deleted_at", "is_deferred",
+    "received_at"
+]
+
+# Прежние колонки messages: копия = назначение + сообщение клиента
+MESSAGES_VIEW = """
+CREATE VIEW messages AS
+SELECT
+    a.id, a.employee_id, c.chat_id, c.message_id, c.client_telegram_id, c.client_username,
+    c.client_name, c.message_text, c.message_type, a.addressed_to_employee_id,
+    a.is_addressed_to_specific, a.received_at, a.responded_at, a.response_time_minutes,
+    a.answered_by_employee_id, a.is_missed, a.is_deleted, a.deleted_at, a.is_deferred
+FROM message_assignments a
+JOIN client_messages c ON c.id = a.client_message_id
+"""
+
+# Условие совпадает с MessageAssignment.__table_args__, чтобы DDL был таким же, как у create_all
+OPEN_ASSIGNMENTS = sa.and_(
+    sa.column("responded_at", sa.DateTime()).is_(None),
+    sa.column("is_deleted", sa.Boolean()) == False
+)
+
+CLIENT_INDEXES = [
+    ("ix_client_messages_id", ["id"]),
+    ("ix_client_messages_chat_client", ["chat_id", "client_telegram_id"]),
+    ("ix_client_messages_received", ["received_at", "id"]),
+]
+ASSIGNMENT_INDEXES = [
+    ("ix_message_assignments_id", ["id"], None),
+    ("ix_message_assignments_client_message", ["client_message_id", "employee_id"], None),
+    ("ix_message_assignments_open", ["client_message_id"], OPEN_ASSIGNMENTS),
+    ("ix_message_assignments_employee_open", ["employee_id", "received_at"], OPEN_ASSIGNMENTS),
+    ("ix_message_assignments_employee", ["employee_id", "received_at"], None),
+    ("ix_message_assignments_answered_by", ["answered_by_employee_id", "received_at"], None),
+    ("ix_message_assignments_received_at", ["received_at"], None),
+]
+# Индексы прежней таблицы messages (0002_message_indexes) - для downgrade
+MESSAGE_INDEXES = [
+    ("ix_messages_open_chat_client", ["chat_id", "client_telegram_id"]),
+    ("ix_messages_chat_message", ["chat_id", "message_id"]),
+    ("ix_messages_employee_received", ["employee_id", "received_at"]),
+    ("ix_messages_answered_by_received", ["answered_by_employee_id", "received_at"]),
+    ("ix_messages_received_at", ["received_at"]),
+]
+# Таблицы со ссылкой message_id на копию сообщения
+REFERENCING_TABLES = ["notifications", "scheduled_notifications"]
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _tables() -> set:
+    if context.is_offline_mode():
+        # alembic upgrade --sql: схема считается той, что была до миграции
+        return {"messages", *REFERENCING_TABLES}
+    return set(_inspector().get_table_names())
+
+
+def _is_postgresql() -> bool:
+    return op.get_context().dialect.name == "postgresql"
+
+
+def _create_new_tables(tables: set):
+    if "client_messages" not in tables:
+        op.create_table(
+            "client_messages",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("chat_id", sa.Integer(), nullable=False),
+            sa.Column("message_id", sa.Integer(), nullable=False),
+            sa.Column("client_telegram_id", sa.Integer(), nullable=True),
+            sa.Column("client_username", sa.String(), nullable=True),
+            sa.Column("client_name", sa.String(), nullable=True),
+            sa.Column("message_text", sa.Text(), nullable=True),
+            sa.Column("message_type", sa.String(), nullable=True),
+            sa.Column("received_at", sa.DateTime(), nullable=True),
+            sa.UniqueConstraint("chat_id", "message_id", name="uq_client_messages_chat_message"),
+        )
+        for name, columns in CLIENT_INDEXES:
+            op.create_index(name, "client_messages", columns)
+
+    if "message_assignments" not in tables:
+        op.create_table(
+            "message_assignments",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("client_message_id", sa.Integer(), sa.ForeignKey("client_messages.id"), nullable=False),
+            sa.Column("employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=True),
+            sa.Column("addressed_to_employee_id", sa.Integer(), nullable=True),
+            sa.Column("is_addressed_to_specific", sa.Boolean(), nullable=True),
+            sa.Column("responded_at", sa.DateTime(), nullable=True),
+            sa.Column("response_time_minutes", sa.Float(), nullable=True),
+            sa.Column("answered_by_employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=True),
+            sa.Column("is_missed", sa.Boolean(), nullable=True),
+            sa.Column("is_deleted", sa.Boolean(), nullable=True),
+            sa.Column("deleted_at", sa.DateTime(), nullable=True),
+            sa.Column("is_deferred", sa.Boolean(), nullable=True),
+            sa.Column("received_at", sa.DateTime(), nullable=True),
+        )
+        for name, columns, where in ASSIGNMENT_INDEXES:
+            if where is not None:
+                op.create_index(name, "message_assignments", columns, sqlite_where=where, postgresql_where=where)
+            else:
+                op.create_index(name, "message_assignments", columns)
+
+
+def _copy_messages():
+    """messages -> client_messages + message_assignments (id сохраняются)"""
+    if not context.is_offline_mode():
+        bind = op.get_bind()
+        new_rows = bind.execute(sa.text("SELECT COUNT(*) FROM message_assignments")).scalar()
+        old_rows = bind.execute(sa.text("SELECT COUNT(*) FROM messages")).scalar()
+        if new_rows and old_rows:
+            raise RuntimeError(
+                "В message_assignments уже есть строки: новая версия бота запускалась до миграции "
+                "(таблицы создал init_db). Остановите бота и перенесите эти сообщения вручную."
+            )
+
+    client_columns = ", ".join(CLIENT_COLUMNS)
+    first_copies = "SELECT chat_id, message_id, MIN(id) AS first_id FROM messages GROUP BY chat_id, message_id"
+    op.execute(
+        f"INSERT INTO client_messages (id, {client_columns}) "
+        f"SELECT id, {client_columns} FROM messages WHERE id IN (SELECT first_id FROM ({first_copies}) AS first_copies)"
+    )
+    op.execute(
+        f"INSERT INTO message_assignments (id, client_message_id, {', '.join(ASSIGNMENT_COLUMNS)}) "
+        f"SELECT m.id, f.first_id, {', '.join(f'm.{column}' for column in ASSIGNMENT_COLUMNS)} "
+        f"FROM messages m JOIN ({first_copies}) AS f ON f.chat_id = m.chat_id AND f.message_id = m.message_id"
+    )
+    if _is_postgresql():
+        # Строки вставлены с явными id - сдвигаем последовательности
+        for table in ("client_messages", "message_assignments"):
+            op.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+            )
+
+
+def _move_foreign_keys(tables: set, from_table: str, to_table: str):
+    """Перевести ссылки message_id в REFERENCING_TABLES с from_table на to_table"""
+    # У SQLite внешние ключи без имен: batch-режим находит их по этому шаблону
+    naming_convention = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+    for table in REFERENCING_TABLES:
+        if table not in tables:
+            continue
+        if context.is_offline_mode():
+            names = [f"{table}_message_id_fkey"]
+        else:
+            names = [
+                foreign_key["name"] or f"fk_{table}_message_id_{from_table}"
+                for foreign_key in _inspector().get_foreign_keys(table)
+                if foreign_key["referred_table"] == from_table
+            ]
+        with op.batch_alter_table(table, naming_convention=naming_convention) as batch_op:
+            for name in names:
+                batch_op.drop_constraint(name, type_="foreignkey")
+            batch_op.create_foreign_key(f"fk_{table}_message_id_{to_table}", to_table, ["message_id"], ["id"])
+
+
+def upgrade() -> None:
+    tables = _tables()
+    if "messages" not in tables:
+        # messages уже представление
+        _create_new_tables(tables)
+        if context.is_offline_mode() or "messages" not in _inspector().get_view_names():
+            op.execute(MESSAGES_VIEW)
+        return
+
+    _create_new_tables(tables)
+    _copy_messages()
+    _move_foreign_keys(tables, "messages", "message_assignments")
+    op.drop_table("messages")
+    op.execute(MESSAGES_VIEW)
+
+
+def downgrade() -> None:
+    tables = _tables()
+    op.execute("DROP VIEW IF EXISTS messages")
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.Integer(), primary_key=True, index=True),
+        sa.Column("employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=True),
+        sa.Column("chat_id", sa.Integer(), nullable=False),
+        sa.Column("message_id", sa.Integer(), nullable=False),
+        sa.Column("client_telegram_id", sa.Integer(), nullable=True),
+        sa.Column("client_username", sa.String(), nullable=True),
+        sa.Column("client_name", sa.String(), nullable=True),
+        sa.Column("message_text", sa.Text(), nullable=True),
+        sa.Column("message_type", sa.String(), nullable=True),
+        sa.Column("addressed_to_employee_id", sa.Integer(), nullable=True),
+        sa.Column("is_addressed_to_specific", sa.Boolean(), nullable=True),
+        sa.Column("received_at", sa.DateTime(), nullable=True),
+        sa.Column("responded_at", sa.DateTime(), nullable=True),
+        sa.Column("response_time_minutes", sa.Float(), nullable=True),
+        sa.Column("answered_by_employee_id", sa.Integer(), sa.ForeignKey("employees.id"), nullable=True),
+        sa.Column("is_missed", sa.Boolean(), nullable=True),
+        sa.Column("is_deleted", sa.Boolean(), nullable=True),
+        sa.Column("deleted_at", sa.DateTime(), nullable=True),
+        sa.Column("is_deferred", sa.Boolean(), nullable=True),
+    )
+    open_messages = sa.and_(
+        sa.column("responded_at", sa.DateTime()).is_(None),
+        sa.column("is_deleted", sa.Boolean()) == False
+    )
+    for name, columns in MESSAGE_INDEXES:
+        if name == "ix_messages_open_chat_client":
+            op.create_index(name, "messages", columns, sqlite_where=open_messages, postgresql_where=open_messages)
+        else:
+            op.create_index(name, "messages", columns)
+
+    # received_at есть в обеих таблицах - берем у сообщения клиента
+    columns = [
+        "employee_id", *CLIENT_COLUMNS,
+        *[column for column in ASSIGNMENT_COLUMNS if column != "employee_id" and column not in CLIENT_COLUMNS]
+    ]
+    op.execute(
+        f"INSERT INTO messages (id, {', '.join(columns)}) "
+        f"SELECT a.id, {', '.join(('c.' if column in CLIENT_COLUMNS else 'a.') + column for column in columns)} "
+        f"FROM message_assignments a JOIN client_messages c ON c.id = a.client_message_id"
+    )
+    if _is_postgresql():
+        op.execute("SELECT setval(pg_get_serial_sequence('messages', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM messages")
+    _move_foreign_keys(tables, "message_assignments", "messages")
+    op.drop_table("message_assignments")
+    op.drop_table("client_messages")
@@ -0,0 +1,35 @@
+"""Аренда записей очереди уведомлений
+
+Колонки scheduled_notifications: claimed_until - до какого времени запись
+забрана таймером на отправку (запись удаляется только после отправки, при
+сбое аренда истекает и запись возвращается в очередь), attempts - число
+неудачных попыток отправки.
+
+Revision ID: 0007_notification_leases
+Revises: 0006_client_messages
+Create Date: 2026-10-19 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_notification_leases'
+down_revision: Union[str, None] = '0006_client_messages'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("scheduled_notifications") as batch_op:
+        batch_op.add_column(sa.Column("claimed_until", sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("scheduled_notifications") as batch_op:
+        batch_op.drop_column("attempts")
+        batch_op.drop_column("claimed_until")
@@ -0,0 +1 @@
+# Метрики Prometheus для бота и веб-панели
@@ -0,0 +1,145 @@
+"""Метрики Prometheus, общие для бота и веб-панели.
+
+Оба процесса регистрируют метрики в реестре prometheus_client по умолчанию:
+веб-панель отдает их на /metrics, бот - на отдельном порту (BOT_METRICS_PORT).
+Модуль не зависит от aiogram и FastAPI; middleware и хуки подключаются на их стороне.
+"""
+
+import functools
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Iterable
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Границы для быстрых операций (обработчики, запросы к БД и API), секунды
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Опоздание уведомлений относительно due_at, секунды
+DELAY_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время обработки события ботом", ["handler"], buckets=FAST_BUCKETS
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках бота", ["handler"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "web_request_seconds", "Время обработки HTTP-запроса веб-панелью", ["method", "route", "status"], buckets=FAST_BUCKETS
+)
+DB_QUERIES = Counter(
+    "db_queries_total", "Запросы к БД", ["operation"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Время выполнения запроса к БД", ["operation"], buckets=FAST_BUCKETS
+)
+NOTIFICATION_DELAY_SECONDS = Histogram(
+    "notification_delay_seconds",
+    "Опоздание уведомления относительно запланированного времени (fired - забрано таймером, sent - отправлено)",
+    ["stage"],
+    buckets=DELAY_BUCKETS
+)
+BOT_API_SECONDS = Histogram(
+    "bot_api_request_seconds", "Время запроса к Telegram Bot API (без ожидания в очереди исходящих)", ["method"], buckets=FAST_BUCKETS
+)
+BOT_API_ERRORS = Counter(
+    "bot_api_errors_total", "Ошибки запросов к Telegram Bot API", ["method", "error"]
+)
+
+
+def timed(handler: str):
+    """Декоратор корутины: время выполнения в bot_handler_seconds{handler}"""
+    histogram = HANDLER_SECONDS.labels(handler)
+    errors = HANDLER_ERRORS.labels(handler)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def observe_notification_delay(due_at: Iterable[datetime], stage: str):
+    """Опоздание уведомлений (due_at в UTC) на этапе stage"""
+    histogram = NOTIFICATION_DELAY_SECONDS.labels(stage)
+    now = datetime.utcnow()
+    for value in due_at:
+        histogram.observe(max(0.0, (now - value).total_seconds()))
+
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Считать запросы движка и их время (события SQLAlchemy before/after_cursor_execute)"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = _operation(statement)
+        DB_QUERIES.labels(operation).inc()
+        DB_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        # Запрос с ошибкой не дошел до after_cursor_execute
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class OutboundCollector:
+    """Глубина очереди исходящих и счетчики отправок (из OutboundLimiter.stats())"""
+
+    def __init__(self, stats: Callable[[], dict]):
+        self._stats = stats
+
+    def collect(self):
+        stats = self._stats()
+        depth = GaugeMetricFamily("outbound_queue_depth", "Отправки в очереди исходящих", labels=["priority"])
+        sent = CounterMetricFamily("outbound_sent", "Отправлено через очередь исходящих", labels=["priority"])
+        failed = CounterMetricFamily("outbound_failed", "Ошибки отправки через очередь исходящих", labels=["priority"])
+        for priority, value in stats["queue_depth"].items():
+            depth.add_metric([priority], value)
+        for priority, value in stats["sent"].items():
+            sent.add_metric([priority], value)
+        for priority, value in stats["failed"].items():
+            failed.add_metric([priority], value)
+        retry_after = CounterMetricFamily("outbound_retry_after", "Ответы 429 от Telegram")
+        retry_after.add_metric([], stats["retry_after"])
+        yield from (depth, sent, failed, retry_after)
+
+
+def register_gauge(name: str, description: str, value: Callable[[], float]) -> Gauge:
+    """Gauge, значение которого читается функцией value при каждом сборе метрик"""
+    gauge = Gauge(name, description)
+    gauge.set_function(value)
+    return gauge
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Отдавать метрики процесса по HTTP в отдельном потоке (порт 0 - не отдавать)"""
+    if not port:
+        return
+    start_http_server(port, addr=host)
+    logger.info(f"[METRICS] Метрики доступны на http://{host}:{port}/metrics")
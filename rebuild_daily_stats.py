@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Пересборка суточной сводки статистики (daily_employee_stats) из истории сообщений.
+
+Использование:
+    python rebuild_daily_stats.py                     # вся история по сегодняшний день
+    python rebuild_daily_stats.py --from 2024-01-01   # с указанной даты по сегодняшний день
+"""
+
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta
+from database.database import AsyncSessionLocal, init_db
+from database.daily_stats import rebuild_daily_stats, get_covered_from, set_covered_from, get_first_message_date
+
+# Пересобираем по месяцам, чтобы не держать одну длинную транзакцию на всю историю
+CHUNK_DAYS = 31
+
+async def rebuild(start_date: date = None):
+    """Пересборка сводки с start_date по сегодняшний день"""
+    await init_db()
+    today = datetime.utcnow().date()
+    async with AsyncSessionLocal() as session:
+        if start_date is None:
+            start_date = await get_first_message_date(session)
+            if start_date is None:
+                print("❌ Сообщений в базе нет, пересобирать нечего")
+                return
+        if start_date > today:
+            print(f"❌ Дата начала {start_date} позже сегодняшней")
+            return
+
+        print(f"🔄 Пересборка сводки за {start_date} - {today}")
+        total_rows = 0
+        chunk_start = start_date
+        while chunk_start <= today:
+            chunk_end = min(chunk_start + timedelta(days=CHUNK_DAYS - 1), today)
+            rows = await rebuild_daily_stats(session, chunk_start, chunk_end)
+            await session.commit()
+            total_rows += rows
+            print(f"   {chunk_start} - {chunk_end}: {rows} строк")
+            chunk_start = chunk_end + timedelta(days=1)
+
+        # Сводка полная с начала пересобранного периода (или с более ранней даты, если она уже была)
+        covered_from = await get_covered_from(session)
+        if covered_from is None or start_date < covered_from:
+            await set_covered_from(session, start_date)
+            await session.commit()
+            covered_from = start_date
+        print(f"✅ Готово: {total_rows} строк, статистика читается из сводки начиная с {covered_from}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересборка суточной сводки статистики")
+    parser.add_argument("--from", dest="start_date", type=date.fromisoformat, default=None,
+                        help="Дата начала (YYYY-MM-DD), по умолчанию - дата первого сообщения")
+    args = parser.parse_args()
+    asyncio.run(rebuild(args.start_date))
@@ -84,17 +84,13 @@ if [ ! -f "data/bot.db" ]; then
     fi
 fi
 
-# Миграция: добавление поля is_deferred
-log "Проверка и миграция поля is_deferred в messages..."
-PYTHONPATH=$PYTHONPATH:$(pwd) python migrate_add_is_deferred.py
-
-# Миграция: nullable для from_user_id в deferred_messages_simple
-log "Проверка и миграция nullable для from_user_id в deferred_messages_simple..."
-PYTHONPATH=$PYTHONPATH:$(pwd) python migrate_deferred_nullable.py
-
-# Миграция: добавление client_telegram_id, employee_id, chat_id в deferred_messages_simple
-log "Проверка и миграция новых полей в deferred_messages_simple..."
-PYTHONPATH=$PYTHONPATH:$(pwd) python migrate_add_client_fields_to_deferred.py
+# Миграции схемы БД (колонки и индексы)
+log "Применение миграций базы данных..."
+PYTHONPATH=$PYTHONPATH:$(pwd) alembic upgrade head
+if [ $? -ne 0 ]; then
+    error "Не удалось применить миграции базы данных."
+    exit 1
+fi
 
 # Добавление админа из FIRST_ADMIN_ID
 if [ -n "$FIRST_ADMIN_ID" ]; then
@@ -59,6 +59,8 @@ async def create_default_settings():
             ("notification_delay_2", "30"),  # Второе уведомление через 30 минут  
             ("notification_delay_3", "60"),  # Третье уведомление через 60 минут
             ("notifications_enabled", "true"),  # Уведомления включены
+            ("notification_digest_enabled", "false"),  # Уведомления по одному, без дайджеста
+            ("notification_digest_window", "60"),  # Окно дайджеста, секунд
             ("daily_reports_enabled", "true"),  # Ежедневные отчеты включены
             ("daily_reports_time", "18:00"),  # Время отправки ежедневных отчетов
         ]
@@ -0,0 +1,46 @@
+"""Общие фикстуры тестов: отдельная база SQLite на каждый тест.
+
+Настройки читаются при импорте config.config, поэтому переменные окружения
+задаются до импорта модулей приложения.
+"""
+
+import os
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp(prefix="activity-tracker-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_DIR}/test.db"
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+
+import pytest
+
+from database.database import AsyncSessionLocal, engine
+from database.models import Base, Employee
+
+
+@pytest.fixture(autouse=True)
+async def database():
+    """Пустые таблицы перед тестом; соединения закрываются в цикле событий теста"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    await engine.dispose()
+
+
+@pytest.fixture
+async def session():
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+async def employees(session):
+    """Три сотрудника, первый - администратор"""
+    items = [
+        Employee(telegram_id=1000 + index, full_name=f"Сотрудник {index}", is_admin=(index == 0))
+        for index in range(3)
+    ]
+    session.add_all(items)
+    await session.commit()
+    return items
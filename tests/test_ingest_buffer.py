@@ -0,0 +1,66 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from bot.ingest_buffer import ClientMessageEvent, IngestBuffer
+from bot.open_conversations import OpenConversationIndex
+from database.database import AsyncSessionLocal
+from database.models import Message
+
+POISON = 3
+
+
+class Notifications:
+    def __init__(self):
+        self.scheduled = []
+
+    async def schedule_warnings_for_messages(self, items):
+        self.scheduled.extend(items)
+
+    async def cancel_notifications_bulk(self, message_ids):
+        pass
+
+
+def make_events(employees, count: int = 6) -> list:
+    start = datetime(2026, 1, 10, 12, 0)
+    return [
+        ClientMessageEvent(
+            chat_id=-100, message_id=index, client_telegram_id=500 + index,
+            client_username=None, client_name="Клиент", message_text=f"секрет {index}",
+            received_at=start + timedelta(seconds=index), employee_ids=[employees[0].id]
+        )
+        for index in range(count)
+    ]
+
+
+def make_buffer(monkeypatch) -> IngestBuffer:
+    buffer = IngestBuffer(Notifications(), OpenConversationIndex(ttl_seconds=600, max_entries=100), max_retries=1)
+    flush = buffer._flush
+
+    async def flush_or_fail(batch):
+        if any(event.message_id == POISON for event in batch):
+            raise ValueError("битое событие")
+        return await flush(batch)
+
+    monkeypatch.setattr(buffer, "_flush", flush_or_fail)
+    return buffer
+
+
+async def test_failed_batch_drops_only_the_poison_event(monkeypatch, employees, caplog):
+    buffer = make_buffer(monkeypatch)
+    events = make_events(employees)
+
+    with caplog.at_level(logging.INFO, logger="bot.ingest_buffer"):
+        await buffer._flush_with_retries(events)
+
+    async with AsyncSessionLocal() as session:
+        saved = (await session.execute(select(Message.message_id).order_by(Message.message_id))).scalars().all()
+    assert saved == [0, 1, 2, 4, 5]
+    assert len(buffer.notifications.scheduled) == 5
+
+    summary = [record for record in caplog.records if "отброшено" in record.getMessage()]
+    assert len(summary) == 1
+    assert summary[0].fields == {"events": [f"message:-100:{POISON}"]}
+    # Текст сообщений клиентов в лог не попадает
+    assert not any("секрет" in record.getMessage() for record in caplog.records)
@@ -0,0 +1,45 @@
+import csv
+import io
+from datetime import datetime
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from bot.message_store import insert_client_messages
+from web.auth import get_current_user
+from web.query_profiler import profile_queries
+from web.routers import statistics
+
+URL = "/api/statistics/export/messages"
+
+
+@pytest.fixture
+async def client():
+    app = FastAPI()
+    app.middleware("http")(profile_queries)
+    app.include_router(statistics.router, prefix="/api/statistics")
+    app.dependency_overrides[get_current_user] = lambda: {"is_admin": True}
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        yield client
+
+
+async def test_unknown_period_is_rejected(client):
+    response = await client.get(URL, params={"period": "year"})
+    assert response.status_code == 422
+
+
+async def test_streamed_export_is_not_profiled(client, session, employees):
+    await insert_client_messages(session, [{
+        "employee_ids": [employees[0].id], "chat_id": -100, "message_id": 1, "client_telegram_id": 500,
+        "message_text": "Вопрос", "received_at": datetime(2026, 1, 10, 12, 0)
+    }])
+    await session.commit()
+
+    response = await client.get(URL, params={"start_date": "2026-01-10", "end_date": "2026-01-10"})
+
+    assert response.status_code == 200
+    # SQL выгрузки выполняется после отправки заголовков - заголовок с нулем запросов не отдается
+    assert "Server-Timing" not in response.headers
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row["message_id"], row["message_text"]) for row in rows] == [("1", "Вопрос")]
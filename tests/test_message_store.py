@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from bot.message_store import close_messages, delete_client_messages, insert_client_messages
+from database.models import ClientMessage, Message, MessageAssignment, Notification, ScheduledNotification
+
+
+async def test_assignments_copy_received_at_of_the_client_message(session, employees):
+    first, second, _ = employees
+    received_at = datetime(2026, 1, 10, 12, 0)
+    item = {"chat_id": -100, "message_id": 1, "client_telegram_id": 500, "received_at": received_at}
+    await insert_client_messages(session, [{**item, "employee_ids": [first.id]}])
+    # Повторная запись того же сообщения добавляет назначение с прежним received_at
+    await insert_client_messages(session, [
+        {**item, "employee_ids": [second.id], "received_at": received_at + timedelta(minutes=3)}
+    ])
+    await session.commit()
+
+    rows = (await session.execute(select(MessageAssignment.employee_id, MessageAssignment.received_at))).all()
+    assert sorted(rows) == [(first.id, received_at), (second.id, received_at)]
+
+
+async def test_period_filter_and_response_time_use_assignment_received_at(session, employees):
+    employee = employees[0]
+    received_at = datetime(2026, 1, 10, 12, 0)
+    await insert_client_messages(session, [
+        {"employee_ids": [employee.id], "chat_id": -100, "message_id": 1, "client_telegram_id": 500,
+         "received_at": received_at}
+    ])
+    assert "message_assignments.received_at" in str(select(Message.id).where(Message.received_at >= received_at))
+
+    closed = await close_messages(
+        session, [Message.chat_id == -100], employee.id, received_at + timedelta(minutes=20)
+    )
+    assert [round(copy.response_time_minutes, 3) for copy in closed] == [20]
+
+
+async def test_delete_removes_notifications_before_assignments(session, employees):
+    employee = employees[0]
+    received_at = datetime(2026, 1, 10, 12, 0)
+    copies = await insert_client_messages(session, [
+        {"employee_ids": [employee.id], "chat_id": -100, "message_id": 1, "client_telegram_id": 500,
+         "received_at": received_at}
+    ])
+    copy_id = copies[0].id
+    await session.execute(insert(ScheduledNotification).values(
+        message_id=copy_id, employee_id=employee.id, chat_id=-100, notification_type="warning_15",
+        delay_minutes=15, due_at=received_at + timedelta(minutes=15)
+    ))
+    await session.execute(insert(Notification).values(
+        message_id=copy_id, employee_id=employee.id, notification_type="15min"
+    ))
+    await session.commit()
+
+    client_message_id = (await session.execute(select(Message.client_message_id))).scalar_one()
+    await delete_client_messages(session, [client_message_id])
+    await session.commit()
+
+    for model in (ScheduledNotification, Notification, MessageAssignment, ClientMessage):
+        assert (await session.execute(select(model))).scalars().all() == []
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+from fastapi import Response
+
+from bot.message_store import insert_client_messages
+from database.database import engine
+from web.routers.statistics import _messages_page, get_messages, get_messages_count
+
+ADMIN = {"is_admin": True}
+
+
+async def seed_messages(session, employees, count: int = 7):
+    """count сообщений клиентов, у каждого копии всех сотрудников; два сообщения с одним received_at"""
+    start = datetime(2026, 1, 10, 12, 0)
+    employee_ids = [employee.id for employee in employees]
+    await insert_client_messages(session, [
+        {
+            "employee_ids": employee_ids,
+            "chat_id": -100,
+            "message_id": index,
+            "client_telegram_id": 500 + index % 2,
+            "client_name": f"Клиент {index}",
+            "message_text": f"Сообщение {index}",
+            "received_at": start + timedelta(minutes=min(index, count - 2))
+        }
+        for index in range(count)
+    ])
+    await session.commit()
+
+
+async def fetch_page(session, limit: int, cursor=None, offset: int = 0, employee_id=None):
+    response = Response()
+    messages = await get_messages(
+        response=response, employee_id=employee_id, is_missed=None, start_date=None, end_date=None,
+        limit=limit, offset=offset, cursor=cursor, current_user=ADMIN, db=session
+    )
+    return messages, response.headers.get("X-Next-Cursor")
+
+
+async def test_cursor_pages_cover_every_message_once(session, employees):
+    await seed_messages(session, employees)
+    everything, _ = await fetch_page(session, limit=100)
+    assert len(everything) == 7
+
+    for limit in (1, 2, 3):
+        seen, cursor = [], None
+        while True:
+            page, cursor = await fetch_page(session, limit=limit, cursor=cursor)
+            seen.extend(page)
+            if not cursor:
+                break
+        assert [message["id"] for message in seen] == [message["id"] for message in everything]
+
+
+async def test_cursor_pages_for_one_employee(session, employees):
+    await seed_messages(session, employees)
+    employee_id = employees[1].id
+    first, cursor = await fetch_page(session, limit=4, employee_id=employee_id)
+    rest, last_cursor = await fetch_page(session, limit=4, cursor=cursor, employee_id=employee_id)
+
+    assert last_cursor is None
+    assert len(first) + len(rest) == 7
+    assert {message["employee_id"] for message in first + rest} == {employee_id}
+
+
+async def test_offset_still_supported(session, employees):
+    await seed_messages(session, employees)
+    everything, _ = await fetch_page(session, limit=100)
+    page, _ = await fetch_page(session, limit=3, offset=3)
+    assert [message["id"] for message in page] == [message["id"] for message in everything[3:6]]
+
+
+async def test_count_matches_list_for_same_message_id_in_two_chats(session, employees):
+    # Один и тот же message_id и клиент в двух чатах - два разных сообщения
+    await insert_client_messages(session, [
+        {
+            "employee_ids": [employees[0].id], "chat_id": chat_id, "message_id": 1,
+            "client_telegram_id": 500, "received_at": datetime(2026, 1, 10, 12, 0)
+        }
+        for chat_id in (-100, -200)
+    ])
+    await session.commit()
+
+    messages, _ = await fetch_page(session, limit=100)
+    count = await get_messages_count(
+        employee_id=None, is_missed=None, start_date=None, end_date=None, current_user=ADMIN, db=session
+    )
+    assert count == {"count": len(messages)} == {"count": 2}
+
+
+async def test_deep_page_walks_client_messages_index(employees):
+    """Страница за курсором читает client_messages по индексу с LIMIT, без сортировки всех копий"""
+    query = _messages_page(employees[0].id, False, None, None, (datetime(2026, 1, 10), 50), limit=100)
+    sql = query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    async with engine.connect() as conn:
+        plan = [row[-1] for row in (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")).all()]
+
+    assert any(line.startswith("SEARCH client_messages USING COVERING INDEX ix_client_messages_received") for line in plan)
+    assert not any(line.startswith("SCAN message_assignments") for line in plan)
+    assert all(
+        "(client_message_id=? AND employee_id=?)" in line or "rowid=?" in line
+        for line in plan if line.startswith("SEARCH message_assignments")
+    )
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from bot import notifications as module
+from bot.notifications import NotificationService
+from database.database import AsyncSessionLocal
+from database.models import Notification
+from tests.test_notification_scheduler import add_rows, load_rows
+
+WINDOW = 3600
+
+
+@pytest.fixture
+def service(monkeypatch):
+    async def enabled():
+        return True
+
+    async def window():
+        return WINDOW
+
+    monkeypatch.setattr(module.settings_manager, "notification_digest_enabled", enabled)
+    monkeypatch.setattr(module.settings_manager, "get_notification_digest_window", window)
+    service = NotificationService(bot=None)
+    employee = SimpleNamespace(id=1, telegram_id=11, is_active=True)
+
+    async def load_pending(due):
+        # Каждая запись - отдельное сообщение клиента, чтобы уходил именно дайджест
+        return [(entry, employee, SimpleNamespace(id=entry.message_id)) for entry in due]
+
+    monkeypatch.setattr(service, "_load_pending", load_pending)
+    service.sent = []
+    yield service
+    for task in service._digest_tasks.values():
+        task.cancel()
+
+
+def send_digest(service, ok: bool):
+    async def send(to_send):
+        service.sent.append([entry.id for entry, _, _ in to_send])
+        return ok
+    return send
+
+
+async def fire_into_digest(service) -> list:
+    ids = await add_rows(2, datetime.utcnow() - timedelta(seconds=1))
+    await service.scheduler._fire(ids)
+    return ids
+
+
+async def test_digest_entries_stay_queued_until_sent(service):
+    ids = await fire_into_digest(service)
+
+    rows = await load_rows()
+    assert set(rows) == set(ids)
+    assert all(row.claimed_until > datetime.utcnow() + timedelta(seconds=WINDOW) for row in rows.values())
+    assert service.digest_pending == 2
+
+
+async def test_sent_digest_completes_entries(service, monkeypatch):
+    ids = await fire_into_digest(service)
+    monkeypatch.setattr(service, "_send_digest", send_digest(service, ok=True))
+
+    await service._flush_digest(1)
+
+    assert service.sent == [ids]
+    assert await load_rows() == {}
+    async with AsyncSessionLocal() as session:
+        recorded = (await session.execute(select(Notification.message_id))).scalars().all()
+    assert sorted(recorded) == [1, 2]
+
+
+async def test_failed_digest_returns_entries_to_queue(service, monkeypatch):
+    ids = await fire_into_digest(service)
+    monkeypatch.setattr(service, "_send_digest", send_digest(service, ok=False))
+
+    await service._flush_digest(1)
+
+    rows = await load_rows()
+    assert set(rows) == set(ids)
+    for row in rows.values():
+        assert row.claimed_until is None
+        assert row.attempts == 1
@@ -0,0 +1,145 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+from bot.notification_scheduler import NotificationScheduler
+from database.database import AsyncSessionLocal
+from database.models import ScheduledNotification
+
+
+async def add_rows(count: int, due_at: datetime, **values) -> list:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            insert(ScheduledNotification)
+            .values([
+                {
+                    "message_id": index + 1, "employee_id": 1, "chat_id": -1,
+                    "notification_type": "warning_15", "delay_minutes": 15, "due_at": due_at, **values
+                }
+                for index in range(count)
+            ])
+            .returning(ScheduledNotification.id)
+        )
+        ids = list(result.scalars().all())
+        await session.commit()
+    return ids
+
+
+async def load_rows() -> dict:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(ScheduledNotification))
+        return {row.id: row for row in result.scalars().all()}
+
+
+class Handler:
+    def __init__(self, action=None):
+        self.calls = []
+        self.action = action
+
+    async def __call__(self, due):
+        self.calls.append([entry.id for entry in due])
+        if self.action:
+            await self.action(due)
+
+
+async def test_rows_deleted_only_after_handler_returns():
+    ids = await add_rows(2, datetime.utcnow() - timedelta(seconds=1))
+    seen_during_handler = {}
+
+    async def check(due):
+        seen_during_handler.update(await load_rows())
+
+    scheduler = NotificationScheduler(Handler(check))
+    await scheduler._fire(ids)
+
+    assert set(seen_during_handler) == set(ids)
+    assert all(row.claimed_until is not None for row in seen_during_handler.values())
+    assert await load_rows() == {}
+
+
+async def test_handler_failure_keeps_rows_for_retry():
+    ids = await add_rows(2, datetime.utcnow() - timedelta(seconds=1))
+
+    async def fail(due):
+        raise RuntimeError("Telegram недоступен")
+
+    scheduler = NotificationScheduler(Handler(fail), retry_delay_seconds=30)
+    await scheduler._fire(ids)
+
+    rows = await load_rows()
+    assert set(rows) == set(ids)
+    for row in rows.values():
+        assert row.claimed_until is None
+        assert row.attempts == 1
+        assert row.due_at > datetime.utcnow() + timedelta(seconds=20)
+
+
+async def test_retried_and_held_rows_survive_successful_handler():
+    ids = await add_rows(3, datetime.utcnow() - timedelta(seconds=1))
+    hold_until = datetime.utcnow() + timedelta(minutes=20)
+    scheduler = None
+
+    async def settle(due):
+        await scheduler.retry([due[0].id])
+        await scheduler.hold([due[1].id], hold_until)
+
+    scheduler = NotificationScheduler(Handler(settle))
+    await scheduler._fire(ids)
+
+    rows = await load_rows()
+    assert set(rows) == {ids[0], ids[1]}
+    assert rows[ids[0]].claimed_until is None and rows[ids[0]].attempts == 1
+    assert rows[ids[1]].claimed_until == hold_until
+
+
+async def test_claimed_rows_are_not_fired_twice():
+    ids = await add_rows(1, datetime.utcnow() - timedelta(seconds=1))
+    handler = Handler()
+    scheduler = NotificationScheduler(handler)
+    await scheduler.hold(ids, datetime.utcnow() + timedelta(minutes=5))
+
+    await scheduler._fire(ids)
+
+    assert handler.calls == []
+    assert set(await load_rows()) == set(ids)
+
+
+async def test_retry_gives_up_after_max_attempts():
+    ids = await add_rows(1, datetime.utcnow() - timedelta(seconds=1), attempts=2)
+    scheduler = NotificationScheduler(Handler(), max_attempts=3)
+
+    await scheduler.retry(ids)
+
+    assert await load_rows() == {}
+
+
+async def test_refill_reclaims_expired_leases():
+    now = datetime.utcnow()
+    stale = await add_rows(1, now - timedelta(minutes=30), claimed_until=now - timedelta(minutes=1))
+    active = await add_rows(1, now - timedelta(minutes=30), claimed_until=now + timedelta(minutes=5))
+    scheduler = NotificationScheduler(Handler())
+
+    await scheduler._refill(now)
+
+    assert [entry[1] for entry in scheduler._heap] == stale
+    rows = await load_rows()
+    assert rows[stale[0]].claimed_until is None
+    assert rows[active[0]].claimed_until is not None
+
+
+async def test_schedule_during_refill_is_not_lost():
+    now = datetime.utcnow()
+    scheduler = NotificationScheduler(Handler(), lookahead_minutes=5)
+    scheduler._horizon = now + timedelta(minutes=5)
+
+    refill = asyncio.create_task(scheduler._refill(now))
+    await asyncio.sleep(0)  # загрузка окна началась и ждет БД
+    await scheduler.schedule([{
+        "message_id": 1, "employee_id": 1, "chat_id": -1, "notification_type": "warning_15",
+        "delay_minutes": 1, "due_at": now + timedelta(minutes=1)
+    }])
+    await refill
+
+    assert [entry[1] for entry in scheduler._heap] == list(await load_rows())
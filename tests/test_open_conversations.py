@@ -0,0 +1,55 @@
+import asyncio
+
+from bot import open_conversations as module
+from bot.open_conversations import OpenConversationIndex
+from database.cache_versions import OPEN_CONVERSATIONS, bump_version
+from database.database import AsyncSessionLocal
+
+KEY = (-100, 500)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+async def test_ttl_counts_from_write_not_from_lookup(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(module.time, "monotonic", clock)
+    index = OpenConversationIndex(ttl_seconds=60, max_entries=100)
+    index.apply({KEY: {1}}, since_generation=index.generation)
+
+    for _ in range(3):
+        clock.now += 20
+        assert index.lookup([KEY]) == ({KEY: {1}}, [])
+    # Частые обращения не продлевают запись: через ttl после записи она читается из БД
+    clock.now += 20
+    assert index.lookup([KEY]) == ({}, [KEY])
+
+
+async def test_web_version_bump_marks_index_stale():
+    index = OpenConversationIndex(ttl_seconds=600, max_entries=100, poll_seconds=0.01)
+    await index.start()
+    try:
+        index.apply({KEY: {1}}, since_generation=index.generation)
+        assert index.lookup([KEY]) == ({KEY: {1}}, [])
+
+        async with AsyncSessionLocal() as session:
+            await bump_version(session, OPEN_CONVERSATIONS)
+            await session.commit()
+        for _ in range(100):
+            if index.needs_rebuild:
+                break
+            await asyncio.sleep(0.01)
+
+        assert index.needs_rebuild
+        assert index.lookup([KEY]) == ({}, [KEY])
+
+        await index.rebuild()
+        assert not index.needs_rebuild
+        assert index.lookup([KEY]) == ({KEY: set()}, [])
+    finally:
+        await index.stop()
@@ -0,0 +1,81 @@
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from sqlalchemy import select
+
+from config.config import settings
+from database.database import AsyncSessionLocal, engine
+from database.models import Employee
+from web import query_profiler
+from web.query_profiler import normalize_sql, profile_engine, profile_queries, query_budget, recent_profiles
+
+
+@pytest.fixture(scope="module")
+def app():
+    profile_engine(engine)
+    app = FastAPI()
+    app.middleware("http")(profile_queries)
+
+    @app.get("/budget", dependencies=[Depends(query_budget(2))])
+    async def budget(queries: int = 1):
+        async with AsyncSessionLocal() as session:
+            for _ in range(queries):
+                await session.execute(select(Employee.id))
+        return {"ok": True}
+
+    @app.get("/loop")
+    async def loop():
+        async with AsyncSessionLocal() as session:
+            ids = (await session.execute(select(Employee.id))).scalars().all()
+            for employee_id in ids:
+                await session.execute(select(Employee).where(Employee.id == employee_id))
+        return {"ok": True}
+
+    return app
+
+
+@pytest.fixture
+async def client(app):
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        yield client
+
+
+async def test_within_budget(client, monkeypatch):
+    monkeypatch.setattr(settings, "query_budget_strict", True)
+    response = await client.get("/budget", params={"queries": 2})
+    assert response.status_code == 200
+    assert 'desc="SQL: 2"' in response.headers["Server-Timing"]
+    assert recent_profiles[-1]["over_budget"] is False
+
+
+async def test_over_budget_is_logged_in_normal_mode(client, monkeypatch):
+    monkeypatch.setattr(settings, "query_budget_strict", False)
+    response = await client.get("/budget", params={"queries": 3})
+    assert response.status_code == 200
+    assert 'budget;desc="3/2"' in response.headers["Server-Timing"]
+    assert recent_profiles[-1]["over_budget"] is True
+
+
+async def test_over_budget_fails_in_strict_mode(client, monkeypatch):
+    monkeypatch.setattr(settings, "query_budget_strict", True)
+    response = await client.get("/budget", params={"queries": 3})
+    assert response.status_code == 500
+    assert response.json()["statements"][0]["count"] == 3
+
+
+async def test_n_plus_one_threshold(client, session, employees, monkeypatch):
+    monkeypatch.setattr(settings, "query_profiler_n1_threshold", len(employees))
+    response = await client.get("/loop")
+    assert 'n1;desc="N+1: 1"' in response.headers["Server-Timing"]
+    assert recent_profiles[-1]["n_plus_one"][0]["count"] == len(employees)
+
+    monkeypatch.setattr(settings, "query_profiler_n1_threshold", len(employees) + 1)
+    response = await client.get("/loop")
+    assert "n1;" not in response.headers["Server-Timing"]
+    assert recent_profiles[-1]["n_plus_one"] == []
+
+
+def test_normalize_sql_collapses_values():
+    assert normalize_sql("SELECT a FROM t WHERE id IN (?, ?, ?) AND x = 'a''b' AND y = 12") == \
+        "SELECT a FROM t WHERE id IN (?...) AND x = ? AND y = ?"
+    assert normalize_sql("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)") == "INSERT INTO t (a, b) VALUES (?...), ..."
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from bot.message_store import insert_client_messages
+from database.cache_versions import OPEN_CONVERSATIONS, get_version
+from database.models import DailyEmployeeStats, Message, ScheduledNotification
+from web.routers.statistics import UndeferMessageRequest, undefer_message
+
+
+async def test_undefer_closes_copies_updates_rollup_and_cancels_warnings(session, employees):
+    admin, colleague, _ = employees
+    received_at = datetime(2026, 1, 10, 12, 0)
+    copies = await insert_client_messages(session, [{
+        "employee_ids": [admin.id, colleague.id],
+        "chat_id": -100,
+        "message_id": 1,
+        "client_telegram_id": 500,
+        "message_text": "Вопрос",
+        "received_at": received_at,
+        "is_deferred": True
+    }])
+    await session.execute(insert(ScheduledNotification).values([
+        {
+            "message_id": copy.id, "employee_id": copy.employee_id, "chat_id": -100,
+            "notification_type": "warning_15", "delay_minutes": 15,
+            "due_at": received_at + timedelta(minutes=15)
+        }
+        for copy in copies
+    ]))
+    await session.commit()
+    version = await get_version(session, OPEN_CONVERSATIONS)
+
+    await undefer_message(
+        UndeferMessageRequest(message_id=copies[0].id),
+        current_user={"is_admin": True, "employee_id": admin.id},
+        db=session
+    )
+
+    messages = (await session.execute(select(Message).execution_options(populate_existing=True))).scalars().all()
+    assert all(not message.is_deferred for message in messages)
+    assert all(message.responded_at is not None for message in messages)
+    assert {message.answered_by_employee_id for message in messages} == {admin.id}
+
+    stats = {
+        row.employee_id: row
+        for row in (await session.execute(select(DailyEmployeeStats))).scalars().all()
+    }
+    assert stats[admin.id].date == received_at.date()
+    assert stats[admin.id].responded_messages == 1
+    assert stats[colleague.id].answered_by_others == 1
+
+    assert (await session.execute(select(ScheduledNotification))).scalars().all() == []
+    assert await get_version(session, OPEN_CONVERSATIONS) != version
+
+
+async def test_undefer_does_not_count_answered_copy_again(session, employees):
+    admin, colleague, _ = employees
+    copies = await insert_client_messages(session, [{
+        "employee_ids": [colleague.id],
+        "chat_id": -100,
+        "message_id": 2,
+        "client_telegram_id": 500,
+        "received_at": datetime(2026, 1, 10, 12, 0),
+        "responded_at": datetime(2026, 1, 10, 12, 5),
+        "answered_by_employee_id": colleague.id,
+        "is_deferred": True
+    }])
+    await session.commit()
+
+    await undefer_message(
+        UndeferMessageRequest(message_id=copies[0].id),
+        current_user={"is_admin": True, "employee_id": admin.id},
+        db=session
+    )
+
+    message = (await session.execute(select(Message).execution_options(populate_existing=True))).scalar_one()
+    assert not message.is_deferred
+    assert message.answered_by_employee_id == colleague.id
+    stats = (await session.execute(select(DailyEmployeeStats))).scalar_one()
+    assert (stats.responded_messages, stats.answered_by_others) == (0, 0)
@@ -2,25 +2,34 @@ from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.exceptions import HTTPException
 from pydantic import BaseModel
 import uvicorn
-import aiohttp
 import random
 from datetime import datetime, timedelta
 import logging
+import time
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 from config.config import settings
-from database.database import init_db, get_db
+from config.log_setup import setup_logging
+from monitoring.metrics import REGISTRY, HTTP_REQUEST_SECONDS
+from database.database import init_db, get_db, engine
 from database.models import Employee, Message
+from database.cache_versions import bump_version, EMPLOYEES
+from bot.outbound import get_shared_bot, close_shared_bots, send_priority, Priority
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, text
 from .routers import auth, employees, statistics, dashboard
 from .routes import settings as settings_router
 from .auth import get_current_user, create_access_token
+from . import query_profiler
 from web.templates import templates
 
+setup_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Трекер активности", version="1.0.0")
 
 # CORS настройки
@@ -32,6 +41,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """Время обработки запроса по шаблону маршрута (/employees/{employee_id}, а не id)"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method,
+            getattr(route, "path", "unmatched"),
+            str(status)
+        ).observe(time.perf_counter() - started)
+
+
+if settings.query_profiler_enabled:
+    # SQL-запросы каждого HTTP-запроса: Server-Timing, поиск N+1, бюджеты, /admin/queries
+    query_profiler.profile_engine(engine)
+    app.middleware("http")(query_profiler.profile_queries)
+
 # Подключение статических файлов
 app.mount("/static", StaticFiles(directory="web/static"), name="static")
 
@@ -107,25 +140,21 @@ async def send_verification_code(
 
 <i>Если вы не запрашивали код - проигнорируйте это сообщение</i>"""
         
-        async with aiohttp.ClientSession() as session:
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-            data = {
-                "chat_id": request.telegram_id,
-                "text": message,
-                "parse_mode": "HTML"
-            }
-            async with session.post(url, data=data) as response:
-                if response.status == 200:
-                    return JSONResponse(content={
-                        "success": True, 
-                        "message": "Код отправлен в ваш Telegram",
-                        "expires_in": 300
-                    })
-                else:
-                    return JSONResponse(
-                        status_code=400,
-                        content={"success": False, "error": "Ошибка отправки сообщения"}
-                    )
+        # Коды входа идут вне очереди уведомлений и отчетов
+        try:
+            with send_priority(Priority.LOGIN):
+                await get_shared_bot(bot_token).send_message(request.telegram_id, message, parse_mode="HTML")
+        except Exception as e:
+            logger.error(f"Ошибка отправки кода входа в Telegram пользователю {request.telegram_id}: {e}")
+            return JSONResponse(
+                status_code=400,
+                content={"success": False, "error": "Ошибка отправки сообщения"}
+            )
+        return JSONResponse(content={
+            "success": True, 
+            "message": "Код отправлен в ваш Telegram",
+            "expires_in": 300
+        })
                     
     except Exception as e:
         return JSONResponse(
@@ -340,13 +369,14 @@ app.include_router(employees.router, prefix="/api/employees", tags=["employees"]
 app.include_router(statistics.router, prefix="/api/statistics", tags=["statistics"])
 app.include_router(dashboard.router, prefix="/api/dashboard", tags=["dashboard"])
 app.include_router(settings_router.router)  # Настройки системы
+app.include_router(query_profiler.router, tags=["admin"])  # Профиль SQL-запросов
 
 # Обработчик ошибок авторизации
 @app.exception_handler(HTTPException)
 async def auth_exception_handler(request: Request, exc: HTTPException):
     """Обработчик ошибок авторизации - перенаправление на логин только для HTML страниц"""
-    # Для API запросов (начинающихся с /api/) возвращаем JSON ошибку
-    if request.url.path.startswith("/api/"):
+    # Для API запросов (начинающихся с /api/) и служебных /admin/* возвращаем JSON ошибку
+    if request.url.path.startswith(("/api/", "/admin/")):
         return JSONResponse(
             status_code=exc.status_code,
             content={"detail": exc.detail}
@@ -385,12 +415,19 @@ async def startup_event():
                     is_admin=True
                 )
                 db.add(new_admin)
+                await bump_version(db, EMPLOYEES)
                 await db.commit()
                 print(f"Создан первый админ с ID: {settings.first_admin_id}")
     except Exception as e:
         print(f"Ошибка при создании первого админа: {str(e)}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Закрытие HTTP-сессии бота, через который отправляются коды входа"""
+    await close_shared_bots()
+
+
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """Главная страница - перенаправление на логин"""
@@ -465,11 +502,22 @@ async def admin_page(request: Request, current_user: dict = Depends(get_current_
 
 
 @app.get("/health")
-async def health_check():
-    """Проверка состояния приложения"""
+async def health_check(db: AsyncSession = Depends(get_db)):
+    """Проверка состояния приложения (включая доступность БД)"""
+    try:
+        await db.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.error(f"Проверка состояния: БД недоступна: {e}")
+        return JSONResponse(status_code=503, content={"status": "error", "message": "База данных недоступна"})
     return {"status": "ok", "message": "Трекер активности is running"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Метрики Prometheus процесса веб-панели"""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/test-auth")
 async def test_auth(current_user: dict = Depends(get_current_user)):
     """Тестовый endpoint для проверки аутентификации"""
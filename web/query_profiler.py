@@ -0,0 +1,249 @@
+"""Профилирование SQL-запросов веб-панели по HTTP-запросам.
+
+Для каждого запроса к веб-панели собираются выполненные SQL-запросы
+(нормализованный текст, время, число строк). Повторы одного и того же запроса
+(N+1: запрос в цикле по строкам) отмечаются и пишутся в лог. Итог отдается в
+заголовке Server-Timing (видно во вкладке Network браузера), последние запросы
+хранятся в кольцевом буфере и доступны администраторам на /admin/queries.
+
+Эндпоинт может объявить бюджет запросов: dependencies=[Depends(query_budget(5))].
+Превышение пишется в лог, а в строгом режиме (QUERY_BUDGET_STRICT=true - для
+тестов и проверки перед выкладкой) запрос завершается ошибкой 500.
+"""
+
+import logging
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config.config import settings
+from config.log_setup import fields
+from web.auth import get_current_admin
+
+logger = logging.getLogger(__name__)
+
+# Не профилируются: статика, метрики, сам просмотр буфера и потоковые выгрузки
+# (их SQL выполняется уже после отправки заголовков, Server-Timing показал бы 0 запросов)
+SKIP_PREFIXES = ("/static", "/metrics", "/admin/queries", "/api/statistics/export/messages")
+# Сколько разных запросов хранить на один HTTP-запрос в буфере
+MAX_STATEMENTS = 50
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<!:):\w+|\?")
+_PARAMETER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_ROW_LIST = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+|\(\?\)(?:\s*,\s*\(\?\))+")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """Текст запроса без значений: литералы и параметры - ?, списки IN (?, ?, ...) - (?...)"""
+    text = _STRING.sub("?", statement)
+    text = _NUMBER.sub("?", text)
+    text = _PARAMETER.sub("?", text)
+    text = _PARAMETER_LIST.sub("?...", text)
+    text = _ROW_LIST.sub("(?...), ...", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+@dataclass
+class StatementStats:
+    """Один нормализованный запрос в рамках HTTP-запроса"""
+    sql: str
+    count: int = 0
+    seconds: float = 0.0
+    rows: Optional[int] = None  # None - драйвер не сообщил число строк (SELECT)
+
+    def add(self, seconds: float, rows: int):
+        self.count += 1
+        self.seconds += seconds
+        if rows >= 0:
+            self.rows = (self.rows or 0) + rows
+
+
+@dataclass
+class RequestProfile:
+    """SQL-запросы одного HTTP-запроса"""
+    method: str
+    path: str
+    started_at: datetime = field(default_factory=datetime.utcnow)
+    statements: Dict[str, StatementStats] = field(default_factory=dict)
+    queries: int = 0
+    db_seconds: float = 0.0
+    budget: Optional[int] = None
+
+    def record(self, statement: str, seconds: float, rows: int):
+        sql = normalize_sql(statement)
+        stats = self.statements.get(sql)
+        if stats is None:
+            stats = self.statements[sql] = StatementStats(sql)
+        stats.add(seconds, rows)
+        self.queries += 1
+        self.db_seconds += seconds
+
+    def repeated(self, threshold: int) -> List[StatementStats]:
+        """Запросы, выполненные не меньше threshold раз (подозрение на N+1)"""
+        return sorted(
+            (stats for stats in self.statements.values() if stats.count >= threshold),
+            key=lambda stats: stats.count,
+            reverse=True
+        )
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.queries > self.budget
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("query_profile", default=None)
+
+# Последние HTTP-запросы для /admin/queries
+recent_profiles: deque = deque(maxlen=settings.query_profiler_buffer_size)
+
+
+def query_budget(limit: int):
+    """Зависимость FastAPI: эндпоинт обещает не больше limit SQL-запросов.
+
+        @router.get("/deferred-messages", dependencies=[Depends(query_budget(3))])
+    """
+    async def declare_budget():
+        profile = _current.get()
+        if profile is not None:
+            profile.budget = limit
+    return declare_budget
+
+
+def profile_engine(engine: AsyncEngine):
+    """Записывать запросы движка в профиль текущего HTTP-запроса"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        started = conn.info.get("profiler_started")
+        if profile is None or not started:
+            return
+        profile.record(statement, time.perf_counter() - started.pop(), cursor.rowcount)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("profiler_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def server_timing(profile: RequestProfile, total_seconds: float, repeated: List[StatementStats]) -> str:
+    """Значение заголовка Server-Timing"""
+    metrics = [
+        f'db;dur={profile.db_seconds * 1000:.1f};desc="SQL: {profile.queries}"',
+        f"app;dur={total_seconds * 1000:.1f}"
+    ]
+    if repeated:
+        metrics.append(f'n1;desc="N+1: {len(repeated)}"')
+    if profile.over_budget:
+        metrics.append(f'budget;desc="{profile.queries}/{profile.budget}"')
+    return ", ".join(metrics)
+
+
+def _summary(profile: RequestProfile, status: int, total_seconds: float, repeated: List[StatementStats]) -> dict:
+    statements = sorted(profile.statements.values(), key=lambda stats: stats.seconds, reverse=True)
+    return {
+        "started_at": profile.started_at.isoformat(),
+        "method": profile.method,
+        "path": profile.path,
+        "status": status,
+        "duration_ms": round(total_seconds * 1000, 1),
+        "queries": profile.queries,
+        "db_ms": round(profile.db_seconds * 1000, 1),
+        "budget": profile.budget,
+        "over_budget": profile.over_budget,
+        "n_plus_one": [{"sql": stats.sql, "count": stats.count} for stats in repeated],
+        "statements": [
+            {"sql": stats.sql, "count": stats.count, "ms": round(stats.seconds * 1000, 2), "rows": stats.rows}
+            for stats in statements[:MAX_STATEMENTS]
+        ]
+    }
+
+
+async def profile_queries(request: Request, call_next):
+    """HTTP-middleware: собрать SQL-запросы обработчика, проверить повторы и бюджет"""
+    if request.url.path.startswith(SKIP_PREFIXES):
+        return await call_next(request)
+
+    profile = RequestProfile(request.method, request.url.path)
+    token = _current.set(profile)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+    total_seconds = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    profile.path = getattr(route, "path", profile.path)
+    repeated = profile.repeated(settings.query_profiler_n1_threshold)
+    if repeated:
+        logger.warning(
+            "[QUERIES] Повторяющиеся SQL-запросы (N+1)",
+            extra=fields(
+                method=profile.method, path=profile.path, queries=profile.queries,
+                repeated=[f"{stats.count}x {stats.sql[:120]}" for stats in repeated]
+            )
+        )
+    if profile.over_budget:
+        logger.warning(
+            "[QUERIES] Превышен бюджет SQL-запросов",
+            extra=fields(method=profile.method, path=profile.path, queries=profile.queries, budget=profile.budget)
+        )
+
+    recent_profiles.append(_summary(profile, response.status_code, total_seconds, repeated))
+
+    if profile.over_budget and settings.query_budget_strict:
+        response = JSONResponse(
+            status_code=500,
+            content={
+                "detail": f"Превышен бюджет SQL-запросов: {profile.queries} из {profile.budget}",
+                "statements": [
+                    {"sql": stats.sql, "count": stats.count}
+                    for stats in sorted(profile.statements.values(), key=lambda stats: stats.count, reverse=True)
+                ]
+            }
+        )
+    response.headers["Server-Timing"] = server_timing(profile, total_seconds, repeated)
+    return response
+
+
+router = APIRouter()
+
+
+@router.get("/admin/queries")
+async def get_recent_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    problems_only: bool = Query(False, description="только запросы с N+1 или превышением бюджета"),
+    current_user: dict = Depends(get_current_admin)
+):
+    """Последние HTTP-запросы веб-панели и выполненные ими SQL-запросы (новые первыми)"""
+    profiles = [
+        profile for profile in reversed(recent_profiles)
+        if not problems_only or profile["n_plus_one"] or profile["over_budget"]
+    ]
+    return {
+        "enabled": settings.query_profiler_enabled,
+        "n_plus_one_threshold": settings.query_profiler_n1_threshold,
+        "requests": profiles[:limit]
+    }
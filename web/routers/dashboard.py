@@ -8,6 +8,7 @@ from pydantic import BaseModel
 from database.database import get_db
 from database.models import Employee, Message, SystemSettings
 from web.auth import get_current_user, get_current_admin
+from web.query_profiler import query_budget
 from web.services.statistics_service import StatisticsService
 from web.services.google_sheets import GoogleSheetsService
 from config.config import settings
@@ -19,7 +20,7 @@ class DashboardSettings(BaseModel):
     google_sheets_enabled: bool
     
     
-@router.get("/overview")
+@router.get("/overview", dependencies=[Depends(query_budget(6))])
 async def get_dashboard_overview(
     period: str = Query("today", regex="^(today|week|month)$"),
     current_user: dict = Depends(get_current_user),
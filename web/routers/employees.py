@@ -7,6 +7,7 @@ from pydantic import BaseModel
 
 from database.database import get_db
 from database.models import Employee, Message
+from database.cache_versions import bump_version, EMPLOYEES
 from web.auth import get_current_user, get_current_admin
 
 router = APIRouter()
@@ -113,6 +114,8 @@ async def create_employee(
     )
     
     db.add(employee)
+    # Бот перечитает справочник сотрудников
+    await bump_version(db, EMPLOYEES)
     await db.commit()
     await db.refresh(employee)
     
@@ -138,6 +141,7 @@ async def update_employee(
     for field, value in update_data.items():
         setattr(employee, field, value)
     
+    await bump_version(db, EMPLOYEES)
     await db.commit()
     await db.refresh(employee)
     
@@ -165,6 +169,7 @@ async def delete_employee(
         )
     
     await db.delete(employee)
+    await bump_version(db, EMPLOYEES)
     await db.commit()
     
     return {"message": "Сотрудник успешно удален"}
@@ -234,6 +239,7 @@ async def toggle_employee_active(
     
     # Переключаем статус
     employee.is_active = not employee.is_active
+    await bump_version(db, EMPLOYEES)
     await db.commit()
     await db.refresh(employee)
     
@@ -1,19 +1,27 @@
 from typing import List, Dict, Optional
 from datetime import datetime, date, timedelta
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, desc, delete
+from sqlalchemy import select, func, and_, desc, delete, distinct, exists, update, tuple_
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.requests import Request
 from fastapi.templating import Jinja2Templates
 import json
-from sqlalchemy.orm import selectinload
+import base64
+from sqlalchemy.orm import selectinload, aliased
 
+from bot.message_store import close_messages
+from bot.notification_scheduler import cancel_scheduled
+from config.config import settings
+
+from database.cache_versions import bump_version, OPEN_CONVERSATIONS
 from database.database import get_db
-from database.models import Employee, Message, SystemSettings, DeferredMessageSimple
+from database.models import Employee, Message, ClientMessage, MessageAssignment, SystemSettings, DeferredMessageSimple
 from web.auth import get_current_user, get_current_admin
-from web.services.statistics_service import StatisticsService, EmployeeStats
+from web.query_profiler import query_budget
+from web.services.statistics_service import StatisticsService, EmployeeStats, get_period_dates
+from web.services import message_export
 from web.services.google_sheets import GoogleSheetsService
 
 router = APIRouter()
@@ -223,55 +231,127 @@ async def get_statistics_summary(
         }
 
 
+def _message_filters(
+    employee_id: Optional[int],
+    is_missed: Optional[bool],
+    start_date: Optional[date],
+    end_date: Optional[date]
+) -> list:
+    """Фильтры списка сообщений"""
+    filters = []
+    if employee_id:
+        filters.append(Message.employee_id == employee_id)
+    if is_missed is not None:
+        filters.append(Message.is_missed == is_missed)
+    if start_date:
+        filters.append(Message.received_at >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        filters.append(Message.received_at <= datetime.combine(end_date, datetime.max.time()))
+    return filters
+
+
+def _messages_page(
+    employee_id: Optional[int],
+    is_missed: Optional[bool],
+    start_date: Optional[date],
+    end_date: Optional[date],
+    before: Optional[tuple],
+    limit: int,
+    offset: int = 0
+):
+    """Страница списка: самая свежая подходящая копия каждого сообщения клиента.
+
+    Страница берется из client_messages по индексу (received_at, id) с LIMIT,
+    фильтры по копиям проверяются через EXISTS, свежая копия выбирается
+    коррелированным подзапросом. Страница читает limit (+ offset) сообщений,
+    сколько бы копий ни было старше курсора. Возвращает запрос объектов Message.
+    """
+    copy_filters = [MessageAssignment.client_message_id == ClientMessage.id]
+    if employee_id:
+        copy_filters.append(MessageAssignment.employee_id == employee_id)
+    if is_missed is not None:
+        copy_filters.append(MessageAssignment.is_missed == is_missed)
+
+    message_filters = [exists().where(*copy_filters).correlate(ClientMessage)]
+    if start_date:
+        message_filters.append(ClientMessage.received_at >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        message_filters.append(ClientMessage.received_at <= datetime.combine(end_date, datetime.max.time()))
+    if before:
+        message_filters.append(tuple_(ClientMessage.received_at, ClientMessage.id) < tuple_(*before))
+
+    latest_copy = (
+        select(MessageAssignment.id)
+        .where(*copy_filters)
+        .order_by(MessageAssignment.id.desc())
+        .limit(1)
+        .correlate(ClientMessage)
+        .scalar_subquery()
+    )
+    page = (
+        select(latest_copy.label("copy_id"))
+        .select_from(ClientMessage)
+        .where(*message_filters)
+        .order_by(ClientMessage.received_at.desc(), ClientMessage.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .subquery()
+    )
+    return (
+        select(Message)
+        .join(page, Message.id == page.c.copy_id)
+        .order_by(Message.received_at.desc(), Message.client_message_id.desc())
+    )
+
+
+def _encode_cursor(message: Message) -> str:
+    payload = json.dumps({"received_at": message.received_at.isoformat(), "client_message_id": message.client_message_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(payload["received_at"]), int(payload["client_message_id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор пагинации")
+
+
 @router.get("/messages", response_model=List[MessageResponse])
 async def get_messages(
+    response: Response,
     employee_id: Optional[int] = None,
     is_missed: Optional[bool] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     limit: int = Query(100, le=1000),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Получить список сообщений (уникальные по паре client_telegram_id, message_id) с корректной пагинацией"""
+    """Получить список сообщений (по одной копии на сообщение клиента) с корректной пагинацией.
+
+    Для постраничного обхода используйте cursor: курсор следующей страницы
+    возвращается в заголовке X-Next-Cursor (пагинация по (received_at, client_message_id)).
+    offset оставлен для совместимости.
+    """
     if not current_user.get('is_admin'):
         employee_id = current_user.get('employee_id')
 
-    # Получаем все сообщения с фильтрами
-    query = select(Message)
-    if employee_id:
-        query = query.where(Message.employee_id == employee_id)
-    if is_missed is not None:
-        query = query.where(Message.is_missed == is_missed)
-    if start_date:
-        query = query.where(Message.received_at >= datetime.combine(start_date, datetime.min.time()))
-    if end_date:
-        query = query.where(Message.received_at <= datetime.combine(end_date, datetime.max.time()))
-    query = query.order_by(Message.received_at.desc())
+    # Курсор - (received_at, client_message_id) последнего сообщения предыдущей страницы
+    before = _decode_cursor(cursor) if cursor else None
+    query = _messages_page(
+        employee_id, is_missed, start_date, end_date, before, limit, offset if not cursor else 0
+    )
     result = await db.execute(query)
-    all_messages = result.scalars().all()
-
-    # Собираем уникальные ключи (client_telegram_id, message_id) в порядке убывания времени
-    unique_keys = []
-    seen = set()
-    for msg in all_messages:
-        key = (msg.client_telegram_id, msg.message_id)
-        if key not in seen:
-            seen.add(key)
-            unique_keys.append(key)
-    # Пагинируем по уникальным ключам
-    page_keys = unique_keys[offset:offset+limit]
-    # Для каждого ключа ищем самое свежее сообщение
-    key_to_msg = {}
-    for msg in all_messages:
-        key = (msg.client_telegram_id, msg.message_id)
-        if key in page_keys and key not in key_to_msg:
-            key_to_msg[key] = msg
-    response = []
-    for key in page_keys:
-        msg = key_to_msg[key]
-        response.append({
+    messages = result.scalars().all()
+
+    if len(messages) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(messages[-1])
+
+    return [
+        {
             "id": msg.id,
             "employee_id": msg.employee_id,
             "message_type": msg.message_type,
@@ -282,8 +362,9 @@ async def get_messages(
             "client_name": msg.client_name,
             "client_username": msg.client_username,
             "message_text": msg.message_text
-        })
-    return response
+        }
+        for msg in messages
+    ]
 
 
 @router.get("/messages/count")
@@ -299,22 +380,12 @@ async def get_messages_count(
     if not current_user.get('is_admin'):
         employee_id = current_user.get('employee_id')
     
-    query = select(Message)
-    if employee_id:
-        query = query.where(Message.employee_id == employee_id)
-    if is_missed is not None:
-        query = query.where(Message.is_missed == is_missed)
-    if start_date:
-        query = query.where(Message.received_at >= datetime.combine(start_date, datetime.min.time()))
-    if end_date:
-        query = query.where(Message.received_at <= datetime.combine(end_date, datetime.max.time()))
-    result = await db.execute(query)
-    messages = result.scalars().all()
-    unique = set()
-    for msg in messages:
-        key = (msg.client_telegram_id, msg.message_id)
-        unique.add(key)
-    return {"count": len(unique)}
+    # Тот же ключ уникальности, что и у списка /messages
+    count = await db.scalar(
+        select(func.count(distinct(Message.client_message_id)))
+        .where(*_message_filters(employee_id, is_missed, start_date, end_date))
+    )
+    return {"count": count}
 
 
 @router.get("/employee/{employee_id}")
@@ -361,7 +432,7 @@ async def get_employee_statistics(
         raise HTTPException(status_code=404, detail=str(e))
 
 
-@router.get("/charts/response-time")
+@router.get("/charts/response-time", dependencies=[Depends(query_budget(3))])
 async def get_response_time_chart(
     period: str = Query("week", regex="^(week|month)$"),
     employee_id: Optional[int] = None,
@@ -386,47 +457,32 @@ async def get_response_time_chart(
     else:  # month
         days_count = 30
     
-    # Получаем данные по дням
-    chart_data = []
+    # Получаем данные по дням одним запросом
     today = datetime.utcnow().date()
+    series = await stats_service.get_timeseries(
+        start_date=today - timedelta(days=days_count - 1),
+        end_date=today,
+        bucket="day",
+        employee_id=employee_id
+    )
     
-    for i in range(days_count):
-        day = today - timedelta(days=days_count - 1 - i)
-        
-        if employee_id:
-            # Статистика конкретного сотрудника
-            stats = await stats_service.get_employee_stats(
-                employee_id, 
-                start_date=day, 
-                end_date=day
-            )
-            chart_data.append({
-                "date": day.isoformat(),
-                "avg_response_time": stats.avg_response_time or 0,
-                "total_messages": stats.total_messages,
-                "employee_name": stats.employee_name
-            })
-        else:
-            # Общая статистика всех сотрудников (только для админов)
-            all_stats = await stats_service.get_all_employees_stats(
-                start_date=day,
-                end_date=day
-            )
-            
-            if all_stats:
-                avg_times = [s.avg_response_time for s in all_stats if s.avg_response_time is not None]
-                avg_response_time = sum(avg_times) / len(avg_times) if avg_times else 0
-                total_messages = sum(s.total_messages for s in all_stats)
-            else:
-                avg_response_time = 0
-                total_messages = 0
-            
-            chart_data.append({
-                "date": day.isoformat(),
-                "avg_response_time": avg_response_time,
-                "total_messages": total_messages,
-                "employee_name": "Все сотрудники"
-            })
+    if employee_id:
+        employee = await db.get(Employee, employee_id)
+        if not employee:
+            raise HTTPException(status_code=404, detail="Сотрудник не найден")
+        employee_name = employee.full_name
+    else:
+        employee_name = "Все сотрудники"
+    
+    chart_data = [
+        {
+            "date": point["date"].isoformat(),
+            "avg_response_time": point["avg_response_time"] or 0,
+            "total_messages": point["total_messages"],
+            "employee_name": employee_name
+        }
+        for point in series
+    ]
     
     return {
         "period": period,
@@ -766,6 +822,41 @@ async def export_statistics_to_file(
         raise HTTPException(status_code=500, detail=f"Ошибка экспорта: {str(e)}")
 
 
+@router.get("/export/messages")
+async def export_messages(
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$"),
+    period: str = Query("today", pattern="^(today|week|month)$"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    employee_id: Optional[int] = None,
+    chat_id: Optional[int] = None,
+    gzip: bool = Query(False, description="сжать CSV/NDJSON gzip (Parquet сжат внутри файла)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Потоковая выгрузка сообщений клиентов за период (CSV, NDJSON или Parquet).
+
+    Строки отдаются по мере чтения из БД, без сборки всего файла в памяти.
+    Не администратор выгружает только свои сообщения.
+    """
+    if not current_user.get("is_admin"):
+        own_employee_id = current_user.get("employee_id")
+        if own_employee_id is None or (employee_id and employee_id != own_employee_id):
+            raise HTTPException(status_code=403, detail="Недостаточно прав")
+        employee_id = own_employee_id
+    if format == "parquet" and not message_export.parquet_available():
+        raise HTTPException(status_code=501, detail="Выгрузка в Parquet недоступна: не установлен pyarrow")
+
+    period_start, period_end = get_period_dates(period, start_date, end_date)
+    filters = message_export.ExportFilters(period_start, period_end, employee_id, chat_id)
+    compress = gzip and format != "parquet"
+    filename = message_export.export_filename(format, filters, compress)
+    return StreamingResponse(
+        message_export.stream_messages(format, filters, settings.export_chunk_size, compress),
+        media_type="application/gzip" if compress else message_export.FORMATS[format][0],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @router.post("/import-from-file")
 async def import_statistics_from_file(
     file: UploadFile = File(...),
@@ -819,17 +910,17 @@ async def get_active_employees_delta(db: AsyncSession = Depends(get_db)):
     week_ago = today - timedelta(days=7)
 
     # Считаем активных сотрудников сегодня
-    result_today = await db.execute(select(Employee).where(Employee.is_active == True))
-    active_today = len(result_today.scalars().all())
+    active_today = await db.scalar(select(func.count(Employee.id)).where(Employee.is_active == True))
 
     # Считаем активных сотрудников неделю назад (по дате создания)
-    result_week = await db.execute(select(Employee).where(Employee.is_active == True, Employee.created_at <= week_ago))
-    active_week = len(result_week.scalars().all())
+    active_week = await db.scalar(
+        select(func.count(Employee.id)).where(Employee.is_active == True, Employee.created_at <= week_ago)
+    )
 
     return {"active_today": active_today, "active_week": active_week}
 
 
-@router.get("/deferred-messages", response_model=List[DeferredMessageResponse])
+@router.get("/deferred-messages", response_model=List[DeferredMessageResponse], dependencies=[Depends(query_budget(2))])
 async def get_deferred_messages(
     current_user: dict = Depends(get_current_admin),
     db: AsyncSession = Depends(get_db)
@@ -951,18 +1042,21 @@ async def undefer_message(
     msg = result.scalar_one_or_none()
     if not msg:
         raise HTTPException(status_code=404, detail="Сообщение не найдено")
-    # Снимаем флаг у всех копий (по chat_id и message_id)
-    result_all = await db.execute(
-        select(Message).where(
-            Message.chat_id == msg.chat_id,
-            Message.message_id == msg.message_id
-        )
+    copies = [Message.chat_id == msg.chat_id, Message.message_id == msg.message_id]
+    # Открытые копии закрываем тем же путем, что и бот: суточная сводка обновляется вместе с ними
+    closed = await close_messages(
+        db, copies, current_user.get('employee_id'), datetime.utcnow(), with_response_time=False
+    )
+    # Флаг снимаем у всех копий (по chat_id и message_id), в том числе уже отвеченных
+    await db.execute(
+        update(MessageAssignment)
+        .where(MessageAssignment.client_message_id == msg.client_message_id)
+        .values(is_deferred=False)
     )
-    msgs_all = result_all.scalars().all()
-    for m in msgs_all:
-        m.is_deferred = False
-        m.responded_at = datetime.utcnow()
-        m.answered_by_employee_id = current_user.get('employee_id')
+    # Уведомления о просрочке по закрытым копиям больше не нужны
+    await cancel_scheduled(db, [copy.id for copy in closed])
+    # Диалог клиента закрыт в обход бота - индекс открытых диалогов бота нужно перечитать
+    await bump_version(db, OPEN_CONVERSATIONS)
     await db.commit()
     return {"success": True, "message": "Сообщение снято с отложенных у всех копий и отмечено как успешно отвеченное"}
 
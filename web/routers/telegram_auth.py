@@ -14,11 +14,11 @@ from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-import aiohttp
 
 from database.database import get_db
 from database.models import Employee
 from web.auth import create_access_token, get_current_user
+from bot.outbound import get_shared_bot, send_priority, Priority
 import logging
 
 logger = logging.getLogger(__name__)
@@ -45,16 +45,9 @@ class VerifyCodeRequest(BaseModel):
 async def send_telegram_message(telegram_id: int, message: str) -> bool:
     """Отправляет сообщение пользователю через Telegram Bot API"""
     try:
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json={
-                "chat_id": telegram_id,
-                "text": message,
-                "parse_mode": "HTML"
-            }) as response:
-                result = await response.json()
-                return result.get("ok", False)
+        with send_priority(Priority.LOGIN):
+            await get_shared_bot(BOT_TOKEN).send_message(telegram_id, message, parse_mode="HTML")
+        return True
     except Exception as e:
         logger.error(f"Ошибка отправки сообщения {telegram_id}: {e}")
         return False
@@ -6,6 +6,7 @@ from pydantic import BaseModel
 
 from database.database import get_db
 from database.models import SystemSettings
+from database.cache_versions import bump_version, SETTINGS
 from web.auth import get_current_admin
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
@@ -16,6 +17,8 @@ class SettingsUpdate(BaseModel):
     notification_delay_2: int  
     notification_delay_3: int
     notifications_enabled: bool
+    notification_digest_enabled: bool = False
+    notification_digest_window: int = 60
     daily_reports_enabled: bool
     daily_reports_time: str
 
@@ -38,6 +41,8 @@ async def get_settings(
         "notification_delay_2": "30", 
         "notification_delay_3": "60",
         "notifications_enabled": "true",
+        "notification_digest_enabled": "false",
+        "notification_digest_window": "60",
         "daily_reports_enabled": "true",
         "daily_reports_time": "18:00"
     }
@@ -53,6 +58,8 @@ async def get_settings(
         "notification_delay_2": int(settings_dict["notification_delay_2"]),
         "notification_delay_3": int(settings_dict["notification_delay_3"]),
         "notifications_enabled": settings_dict["notifications_enabled"].lower() == "true",
+        "notification_digest_enabled": settings_dict["notification_digest_enabled"].lower() == "true",
+        "notification_digest_window": int(settings_dict["notification_digest_window"]),
         "daily_reports_enabled": settings_dict["daily_reports_enabled"].lower() == "true",
         "daily_reports_time": settings_dict["daily_reports_time"]
     }
@@ -76,6 +83,9 @@ async def update_settings(
     if settings_data.notification_delay_3 <= settings_data.notification_delay_2 or settings_data.notification_delay_3 > 300:
         raise HTTPException(status_code=400, detail="Третье уведомление должно быть больше второго и не более 300 минут")
     
+    if settings_data.notification_digest_window < 10 or settings_data.notification_digest_window > 600:
+        raise HTTPException(status_code=400, detail="Окно дайджеста должно быть от 10 до 600 секунд")
+    
     # Проверяем, изменилось ли время отчетов
     result = await db.execute(
         select(SystemSettings).where(SystemSettings.key == "daily_reports_time")
@@ -90,6 +100,8 @@ async def update_settings(
         "notification_delay_2": str(settings_data.notification_delay_2),
         "notification_delay_3": str(settings_data.notification_delay_3),
         "notifications_enabled": str(settings_data.notifications_enabled).lower(),
+        "notification_digest_enabled": str(settings_data.notification_digest_enabled).lower(),
+        "notification_digest_window": str(settings_data.notification_digest_window),
         "daily_reports_enabled": str(settings_data.daily_reports_enabled).lower(),
         "daily_reports_time": settings_data.daily_reports_time
     }
@@ -107,6 +119,8 @@ async def update_settings(
             setting = SystemSettings(key=key, value=value)
             db.add(setting)
     
+    # Бот перечитает настройки по новой версии в течение нескольких секунд
+    await bump_version(db, SETTINGS)
     await db.commit()
     
     # Очищаем кеш настроек для немедленного применения изменений
@@ -141,6 +155,8 @@ async def reset_settings(
         "notification_delay_2": "30",
         "notification_delay_3": "60", 
         "notifications_enabled": "true",
+        "notification_digest_enabled": "false",
+        "notification_digest_window": "60",
         "daily_reports_enabled": "true",
         "daily_reports_time": "18:00"
     }
@@ -157,6 +173,8 @@ async def reset_settings(
             setting = SystemSettings(key=key, value=value)
             db.add(setting)
     
+    # Бот перечитает настройки по новой версии в течение нескольких секунд
+    await bump_version(db, SETTINGS)
     await db.commit()
     
     # Очищаем кеш настроек для немедленного применения изменений
@@ -193,6 +211,7 @@ async def send_daily_reports_endpoint(
         # Поскольку у нас нет прямого доступа к message_tracker из веб-части,
         # мы создадим временный для этой операции
         from bot.notifications import NotificationService
+        from bot.outbound import attach_outbound
         from aiogram import Bot
         from config.config import settings as bot_settings
         
@@ -200,7 +219,7 @@ async def send_daily_reports_endpoint(
         class TempMessageTracker:
             def __init__(self):
                 # self.analytics = AnalyticsService() # Больше не используется в send_daily_reports
-                self.notifications = NotificationService(Bot(token=bot_settings.bot_token))
+                self.notifications = NotificationService(attach_outbound(Bot(token=bot_settings.bot_token)))
         
         temp_tracker = TempMessageTracker()
         
@@ -0,0 +1,257 @@
+"""Потоковая выгрузка сообщений клиентов в CSV, NDJSON и Parquet.
+
+Строки читаются курсором на стороне сервера (AsyncSession.stream с yield_per)
+пачками по EXPORT_CHUNK_SIZE. Каждая пачка сразу превращается в байты и
+отдается клиенту, поэтому в памяти лежит только одна пачка, сколько бы
+сообщений ни было за период. CSV и NDJSON можно сжимать gzip на лету.
+Parquet сжимается внутри файла, и каждая пачка пишется в нем отдельной
+группой строк.
+"""
+
+import csv
+import io
+import json
+import logging
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Optional, Sequence
+
+from sqlalchemy import Select, select
+
+from config.log_setup import fields
+from database.database import AsyncSessionLocal
+from database.models import Employee, Message
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet недоступен, CSV и NDJSON работают
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Формат: (Content-Type, расширение файла)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Колонки выгрузки: (имя, колонка, тип Arrow для Parquet)
+COLUMNS = (
+    ("id", Message.id, "int64"),
+    ("chat_id", Message.chat_id, "int64"),
+    ("message_id", Message.message_id, "int64"),
+    ("employee_id", Message.employee_id, "int64"),
+    ("employee_name", Employee.full_name, "string"),
+    ("client_telegram_id", Message.client_telegram_id, "int64"),
+    ("client_username", Message.client_username, "string"),
+    ("client_name", Message.client_name, "string"),
+    ("message_text", Message.message_text, "string"),
+    ("received_at", Message.received_at, "timestamp"),
+    ("responded_at", Message.responded_at, "timestamp"),
+    ("response_time_minutes", Message.response_time_minutes, "float64"),
+    ("answered_by_employee_id", Message.answered_by_employee_id, "int64"),
+    ("is_addressed_to_specific", Message.is_addressed_to_specific, "bool"),
+    ("is_missed", Message.is_missed, "bool"),
+    ("is_deferred", Message.is_deferred, "bool"),
+    ("is_deleted", Message.is_deleted, "bool"),
+)
+COLUMN_NAMES = [name for name, _, _ in COLUMNS]
+
+
+@dataclass
+class ExportFilters:
+    """Отбор сообщений для выгрузки"""
+    period_start: datetime
+    period_end: datetime
+    employee_id: Optional[int] = None
+    chat_id: Optional[int] = None
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def export_query(filters: ExportFilters) -> Select:
+    """Сообщения клиентов за период в порядке получения"""
+    query = (
+        select(*(column for _, column, _ in COLUMNS))
+        .select_from(Message)
+        .outerjoin(Employee, Employee.id == Message.employee_id)
+        .where(
+            Message.message_type == "client",
+            Message.received_at >= filters.period_start,
+            Message.received_at <= filters.period_end
+        )
+    )
+    if filters.employee_id is not None:
+        query = query.where(Message.employee_id == filters.employee_id)
+    if filters.chat_id is not None:
+        query = query.where(Message.chat_id == filters.chat_id)
+    return query.order_by(Message.received_at, Message.id)
+
+
+def export_filename(export_format: str, filters: ExportFilters, compress: bool) -> str:
+    scope = f"employee_{filters.employee_id}" if filters.employee_id is not None else "all"
+    if filters.chat_id is not None:
+        scope += f"_chat_{filters.chat_id}"
+    extension = FORMATS[export_format][1]
+    name = (
+        f"messages_{scope}_{filters.period_start:%Y%m%d}-{filters.period_end:%Y%m%d}"
+        f"_{datetime.now():%Y%m%d_%H%M%S}.{extension}"
+    )
+    # Parquet сжат внутри файла, gzip поверх него не нужен
+    return name + ".gz" if compress and export_format != "parquet" else name
+
+
+async def _row_chunks(filters: ExportFilters, chunk_size: int, counter: list) -> AsyncIterator[Sequence]:
+    """Пачки строк из курсора на стороне сервера.
+
+    Сессия открывается здесь, а не берется из зависимости get_db: FastAPI закрывает
+    ее до начала отдачи тела ответа.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(export_query(filters).execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            counter[0] += len(rows)
+            yield rows
+
+
+def _drain(buffer: io.StringIO) -> str:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+async def _csv_chunks(chunks: AsyncIterator[Sequence]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMN_NAMES)
+    yield _drain(buffer).encode("utf-8")
+    async for rows in chunks:
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            for row in rows
+        )
+        yield _drain(buffer).encode("utf-8")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+async def _ndjson_chunks(chunks: AsyncIterator[Sequence]) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(COLUMN_NAMES, row)), ensure_ascii=False, default=_json_default) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файл для ParquetWriter: накопленные байты забираются после каждой пачки"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _parquet_schema():
+    types = {
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+        "string": pa.string(),
+        "timestamp": pa.timestamp("us"),
+    }
+    return pa.schema([(name, types[arrow_type]) for name, _, arrow_type in COLUMNS])
+
+
+async def _parquet_chunks(chunks: AsyncIterator[Sequence]) -> AsyncIterator[bytes]:
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        async for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=column_type) for values, column_type in zip(columns, schema.types)],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        # Футер с метаданными пишется при закрытии
+        writer.close()
+    yield sink.drain()
+
+
+async def _gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 - формат gzip
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def stream_messages(
+    export_format: str,
+    filters: ExportFilters,
+    chunk_size: int,
+    compress: bool = False
+) -> AsyncIterator[bytes]:
+    """Тело ответа с выгрузкой сообщений по пачкам"""
+    counter = [0]
+    started = time.perf_counter()
+    rows = _row_chunks(filters, chunk_size, counter)
+    if export_format == "csv":
+        body = _csv_chunks(rows)
+    elif export_format == "ndjson":
+        body = _ndjson_chunks(rows)
+    else:
+        body = _parquet_chunks(rows)
+    if compress and export_format != "parquet":
+        body = _gzip_chunks(body)
+
+    try:
+        async for chunk in body:
+            if chunk:
+                yield chunk
+    except Exception:
+        # Заголовки уже отправлены: клиент получит оборванный файл
+        logger.exception(
+            "[EXPORT] Ошибка потоковой выгрузки сообщений",
+            extra=fields(format=export_format, rows=counter[0])
+        )
+        raise
+    logger.info(
+        "[EXPORT] Выгрузка сообщений завершена",
+        extra=fields(
+            format=export_format, rows=counter[0], gzip=compress,
+            employee_id=filters.employee_id, chat_id=filters.chat_id,
+            seconds=round(time.perf_counter() - started, 2)
+        )
+    )
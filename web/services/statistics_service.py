@@ -1,17 +1,69 @@
 #!/usr/bin/env python3
 """Единый сервис для вычисления статистики"""
 
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Sequence, Tuple
 from datetime import datetime, date, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select, and_, or_, func, literal, union, case, distinct
 from dataclasses import dataclass
+from types import SimpleNamespace
 import logging
 
-from database.models import Employee, Message, DeferredMessageSimple
+from database.models import Employee, Message, DeferredMessageSimple, DailyEmployeeStats, DailyEmployeeClient
+from database.daily_stats import COUNTERS, message_stats_aggregates, get_covered_from
+from database.dialect import date_bucket, to_date, bucket_start, next_bucket, minutes_between
+from config.log_setup import fields
 
 logger = logging.getLogger(__name__)
 
+
+def get_period_dates(
+    period: str, 
+    start_date: Optional[date] = None, 
+    end_date: Optional[date] = None
+) -> tuple[datetime, datetime]:
+    """Даты начала и конца периода (today, week, month или явные start_date/end_date)"""
+
+    if start_date and end_date:
+        return (
+            datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date, datetime.max.time())
+        )
+
+    now = datetime.utcnow()
+    today = now.date()
+
+    if period == "today":
+        # Используем текущее время как конец периода
+        return (
+            datetime.combine(today, datetime.min.time()),
+            now  # Текущее время
+        )
+    elif period == "week":
+        start = today - timedelta(days=today.weekday())  # Понедельник
+        end = start + timedelta(days=6)  # Воскресенье
+        return (
+            datetime.combine(start, datetime.min.time()),
+            datetime.combine(end, datetime.max.time())
+        )
+    elif period == "month":
+        start = today.replace(day=1)  # Первое число месяца
+        if today.month == 12:
+            end = date(today.year + 1, 1, 1) - timedelta(days=1)
+        else:
+            end = date(today.year, today.month + 1, 1) - timedelta(days=1)
+        return (
+            datetime.combine(start, datetime.min.time()),
+            datetime.combine(end, datetime.max.time())
+        )
+    else:
+        # По умолчанию - сегодня
+        return (
+            datetime.combine(today, datetime.min.time()),
+            now  # Текущее время
+        )
+
+
 @dataclass
 class EmployeeStats:
     """Статистика сотрудника"""
@@ -76,36 +128,44 @@ class StatisticsService:
         # Определяем период
         period_start, period_end = self._get_period_dates(period, start_date, end_date)
         
-        # Получаем сообщения за период
-        messages = await self._get_messages_for_period(employee_id, period_start, period_end)
-        
-        # Вычисляем статистику
-        stats = self._calculate_stats(messages)
+        # Вычисляем статистику агрегатами (суточная сводка + сообщения за дни вне ее)
+        stats_by_employee = await self._collect_stats(period_start, period_end, [employee_id], include_addressed=True)
+        stats = stats_by_employee.get(employee_id) or self._empty_stats()
         
         # Считаем отложенные сообщения для сотрудника за период по новой таблице
-        result = await self.db.execute(
-            select(DeferredMessageSimple).where(
-                DeferredMessageSimple.is_active == True,
-                DeferredMessageSimple.from_user_id == employee_id,
-                DeferredMessageSimple.created_at >= period_start,
-                DeferredMessageSimple.created_at <= period_end
-            )
-        )
-        deferred_count = len(result.scalars().all())
+        deferred_counts = await self._get_deferred_counts([employee_id], period_start, period_end)
+        deferred_count = deferred_counts.get(employee_id, 0)
         
-        return EmployeeStats(
-            employee_id=employee.id,
-            employee_name=employee.full_name,
-            telegram_id=employee.telegram_id,
-            telegram_username=employee.telegram_username,
-            is_admin=employee.is_admin,
-            is_active=employee.is_active,
-            period_start=period_start,
-            period_end=period_end,
-            period_name=period,
-            deferred_messages=deferred_count,
-            **stats
-        )
+        return self._make_employee_stats(employee, period, period_start, period_end, stats, deferred_count)
+
+    async def get_employee_stats_multi(
+        self,
+        employee_id: int,
+        periods: Sequence[str] = ("today", "week", "month")
+    ) -> Dict[str, EmployeeStats]:
+        """Статистика сотрудника сразу за несколько периодов: {период: EmployeeStats}.
+
+        Результат для каждого периода совпадает с get_employee_stats, но все периоды
+        считаются вместе: один запрос по messages с условной агрегацией по диапазону
+        каждого периода, один по суточной сводке, один по уникальным клиентам и
+        один по отложенным сообщениям - вместо полного набора запросов на период.
+        """
+        if employee_id is None:
+            raise ValueError("employee_id не может быть None")
+        employee = await self.db.scalar(select(Employee).where(Employee.id == employee_id))
+        if not employee:
+            raise ValueError(f"Сотрудник с ID {employee_id} не найден в базе данных")
+
+        ranges = {period: self._get_period_dates(period) for period in dict.fromkeys(periods)}
+        stats_by_period = await self._collect_stats_multi(employee_id, ranges)
+        deferred_counts = await self._get_deferred_counts_multi(employee_id, ranges)
+        return {
+            period: self._make_employee_stats(
+                employee, period, period_start, period_end,
+                stats_by_period[period], deferred_counts.get(period, 0)
+            )
+            for period, (period_start, period_end) in ranges.items()
+        }
     
     async def get_all_employees_stats(
         self,
@@ -114,7 +174,7 @@ class StatisticsService:
         end_date: Optional[date] = None,
         employee_id: Optional[int] = None
     ) -> List[EmployeeStats]:
-        """Получить статистику всех сотрудников (оптимизировано: все сообщения одним запросом)"""
+        """Получить статистику всех сотрудников (оптимизировано: агрегаты одним запросом)"""
         # Получаем список сотрудников
         employee_query = select(Employee)
         if employee_id:
@@ -126,140 +186,160 @@ class StatisticsService:
             return []
         # Определяем период
         period_start, period_end = self._get_period_dates(period, start_date, end_date)
-        # Получаем все сообщения за период одним запросом
-        result = await self.db.execute(
-            select(Message).where(
-                Message.employee_id.in_(employees_by_id.keys()),
-                Message.received_at >= period_start,
-                Message.received_at <= period_end
-            )
-        )
-        all_messages = result.scalars().all()
-        # Группируем сообщения по сотрудникам
-        from collections import defaultdict
-        messages_by_employee = defaultdict(list)
-        for msg in all_messages:
-            messages_by_employee[msg.employee_id].append(msg)
-        # Считаем статистику для каждого сотрудника
+        # Считаем статистику всех сотрудников агрегатами с GROUP BY employee_id
+        stats_by_employee = await self._collect_stats(period_start, period_end, list(employees_by_id.keys()))
+        # Отложенные сообщения по deferred_messages_simple для всех сотрудников одним запросом
+        deferred_counts = await self._get_deferred_counts(list(employees_by_id.keys()), period_start, period_end)
+        # Собираем статистику для каждого сотрудника
         all_stats = []
         for employee in employees:
-            messages = messages_by_employee.get(employee.id, [])
-            stats = self._calculate_stats(messages)
-            # Новый подсчёт deferred_count по deferred_messages_simple
-            result = await self.db.execute(
-                select(DeferredMessageSimple).where(
-                    DeferredMessageSimple.is_active == True,
-                    DeferredMessageSimple.from_user_id == employee.id,
-                    DeferredMessageSimple.created_at >= period_start,
-                    DeferredMessageSimple.created_at <= period_end
+            stats = stats_by_employee.get(employee.id) or self._empty_stats()
+            deferred_count = deferred_counts.get(employee.id, 0)
+            all_stats.append(self._make_employee_stats(employee, period, period_start, period_end, stats, deferred_count))
+        return all_stats
+
+    @staticmethod
+    def _make_employee_stats(
+        employee: Employee,
+        period: str,
+        period_start: datetime,
+        period_end: datetime,
+        stats: Dict[str, Any],
+        deferred_count: int
+    ) -> EmployeeStats:
+        return EmployeeStats(
+            employee_id=employee.id,
+            employee_name=employee.full_name,
+            telegram_id=employee.telegram_id,
+            telegram_username=employee.telegram_username,
+            is_admin=employee.is_admin,
+            is_active=employee.is_active,
+            period_start=period_start,
+            period_end=period_end,
+            period_name=period,
+            deferred_messages=deferred_count,
+            **stats
+        )
+
+    async def get_timeseries(
+        self,
+        start_date: date,
+        end_date: date,
+        bucket: str = "day",
+        employee_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Статистика по интервалам (день/неделя/месяц) одним запросом.
+
+        Для сотрудника - как get_employee_stats за каждый интервал, для всех - как
+        get_all_employees_stats: сумма сообщений и среднее по средним временам ответа
+        сотрудников. Интервалы без сообщений заполняются нулями.
+        """
+        period_start, period_end = self._get_period_dates("custom", start_date, end_date)
+        period_bucket = date_bucket(Message.received_at, bucket).label("bucket")
+
+        if employee_id:
+            query = (
+                select(period_bucket, *message_stats_aggregates(employee_id))
+                .where(
+                    or_(
+                        Message.employee_id == employee_id,
+                        Message.addressed_to_employee_id == employee_id
+                    ),
+                    Message.received_at >= period_start,
+                    Message.received_at <= period_end
                 )
+                .group_by(period_bucket)
             )
-            deferred_count = len(result.scalars().all())
-            all_stats.append(EmployeeStats(
-                employee_id=employee.id,
-                employee_name=employee.full_name,
-                telegram_id=employee.telegram_id,
-                telegram_username=employee.telegram_username,
-                is_admin=employee.is_admin,
-                is_active=employee.is_active,
-                period_start=period_start,
-                period_end=period_end,
-                period_name=period,
-                deferred_messages=deferred_count,
-                **stats
-            ))
-        return all_stats
-    
+        else:
+            query = (
+                select(period_bucket, Message.employee_id, *message_stats_aggregates(Message.employee_id))
+                .where(
+                    Message.received_at >= period_start,
+                    Message.received_at <= period_end
+                )
+                .group_by(period_bucket, Message.employee_id)
+            )
+        result = await self.db.execute(query)
+
+        # {начало интервала: [статистика сотрудника, ...]}
+        stats_by_bucket: Dict[date, List[Dict[str, Any]]] = {}
+        for row in result.all():
+            stats_by_bucket.setdefault(to_date(row.bucket), []).append(self._build_stats(row))
+
+        series = []
+        current = bucket_start(start_date, bucket)
+        while current <= end_date:
+            bucket_stats = stats_by_bucket.get(current, [])
+            avg_times = [s["avg_response_time"] for s in bucket_stats if s["avg_response_time"] is not None]
+            series.append({
+                "date": current,
+                "total_messages": sum(s["total_messages"] for s in bucket_stats),
+                "responded_messages": sum(s["responded_messages"] for s in bucket_stats),
+                "avg_response_time": sum(avg_times) / len(avg_times) if avg_times else None
+            })
+            current = next_bucket(current, bucket)
+        return series
+
     async def get_dashboard_overview(self, user_id: int, is_admin: bool, period: str = "today") -> Dict[str, Any]:
         """Получить данные для дашборда"""
         
         period_start, period_end = self._get_period_dates(period) # Определяем период один раз
-        logger.info(f"[STAT_DEBUG|get_dashboard_overview] Period: {period}, Start: {period_start}, End: {period_end}, Called for user_id: {user_id}, is_admin: {is_admin}")
+        logger.debug(
+            "[STAT_DEBUG|get_dashboard_overview]",
+            extra=fields(period=period, start=period_start, end=period_end, user_id=user_id, is_admin=is_admin)
+        )
         
         if is_admin:
-            # Админ видит общую статистику, посчитанную по УНИКАЛЬНЫМ сообщениям
-            
-            # 1. Получаем ВСЕ записи Message за период (от всех клиентов, для всех сотрудников)
-            all_db_messages_result = await self.db.execute(
-                select(Message).where(
+            # Админ видит общую статистику, посчитанную по УНИКАЛЬНЫМ сообщениям.
+            # У каждого сотрудника своя копия сообщения клиента; копии одного сообщения
+            # имеют одинаковые (chat_id, message_id) - message_id здесь telegram id сообщения.
+            # Сначала копии сворачиваются в одно сообщение (самый ранний ответ любого
+            # сотрудника), затем сообщения - в итоги; в Python приходит одна строка.
+            unique_client_messages = (
+                select(
+                    func.min(Message.received_at).label("received_at"),
+                    func.min(
+                        case((Message.answered_by_employee_id.isnot(None), Message.responded_at))
+                    ).label("first_answered_at"),
+                    func.min(Message.client_telegram_id).label("client_telegram_id")
+                )
+                .where(
                     and_(
                         Message.received_at >= period_start,
                         Message.received_at <= period_end
                     )
                 )
+                .group_by(Message.chat_id, Message.message_id)
+                .subquery()
             )
-            all_db_messages_in_period = all_db_messages_result.scalars().all()
-            logger.info(f"[STAT_DEBUG|get_dashboard_overview|Admin] Found {len(all_db_messages_in_period)} DBMessage records in period before grouping.")
-            # Логирование деталей каждого сообщения
-            for i, msg_debug in enumerate(all_db_messages_in_period):
-               logger.info(f"[STAT_DEBUG|get_dashboard_overview|Admin] Msg {i}: id(DB)={msg_debug.id}, chat_id={msg_debug.chat_id}, client_msg_id={msg_debug.message_id}, client_tg_id={msg_debug.client_telegram_id}, emp_id={msg_debug.employee_id}, received={msg_debug.received_at}, answered_by={msg_debug.answered_by_employee_id}")
-
-            # 2. Группируем сообщения по уникальному идентификатору (chat_id, message_id)
-            #    message_id здесь это telegram message_id клиента, он одинаков для всех копий этого сообщения у сотрудников.
-            unique_client_messages = {}
-            for msg in all_db_messages_in_period:
-                key = (msg.chat_id, msg.message_id)
-                if key not in unique_client_messages:
-                    unique_client_messages[key] = []
-                unique_client_messages[key].append(msg) # Собираем все копии одного и того же сообщения клиента
-            
-            # 3. Считаем общие показатели по уникальным клиентским сообщениям
-            total_unique_client_messages_count = len(unique_client_messages)
-            responded_unique_client_messages_count = 0
-            missed_unique_client_messages_count = 0
-            deleted_unique_client_messages_count = 0 # Если понадобится
-            
-            client_ids_for_unique_count = set()
-            response_times_for_avg = []
-
-            for client_msg_key, db_message_copies in unique_client_messages.items():
-                # db_message_copies - это список всех DBMessage (для разных сотрудников) для одного и того же сообщения клиента
-                
-                # Добавляем ID клиента для подсчета уникальных клиентов
-                if db_message_copies: # Берем из первой копии, они все от одного клиента
-                    client_ids_for_unique_count.add(db_message_copies[0].client_telegram_id)
-
-                is_responded_by_anyone = False
-                is_deleted_by_anyone = False # Если понадобится трекать удаленные на этом уровне
-                
-                # Ищем самый ранний ответ на это сообщение среди всех сотрудников
-                # и был ли ответ вообще
-                earliest_response_time_for_this_message = None
-                first_answered_at = None
-                first_received_at = db_message_copies[0].received_at # Все копии имеют одно время получения
-
-                for copy in db_message_copies:
-                    if copy.answered_by_employee_id is not None and copy.responded_at is not None:
-                        is_responded_by_anyone = True
-                        if first_answered_at is None or copy.responded_at < first_answered_at:
-                            first_answered_at = copy.responded_at
-                    if copy.is_deleted:
-                        is_deleted_by_anyone = True # Если хотя бы одна копия удалена
-                
-                if is_responded_by_anyone and first_answered_at is not None:
-                    responded_unique_client_messages_count += 1
-                    # Рассчитываем время ответа для этого УНИКАЛЬНОГО сообщения
-                    # Время ответа должно считаться от received_at до первого responded_at по этому сообщению
-                    response_duration_seconds = (first_answered_at - first_received_at).total_seconds()
-                    response_times_for_avg.append(response_duration_seconds / 60)
-
-                elif is_deleted_by_anyone: # Если не отвечено, но удалено
-                    deleted_unique_client_messages_count += 1 # Считаем отдельно, если нужно
-                    # Для общей статистики, если сообщение удалено и не отвечено, оно считается пропущенным.
-                    # Это чтобы "В обработке" на диаграмме было 0, если нет реально ожидающих сообщений.
-                    missed_unique_client_messages_count +=1
-                else: # Не отвечено и не удалено
-                    missed_unique_client_messages_count +=1
-
-            # Общее количество уникальных клиентов
-            total_unique_clients = len(client_ids_for_unique_count)
-            
-            # Среднее время ответа (по уникальным отвеченным сообщениям)
-            avg_response_time = sum(response_times_for_avg) / len(response_times_for_avg) if response_times_for_avg else 0
+            totals = (await self.db.execute(
+                select(
+                    func.count().label("total"),
+                    func.count(unique_client_messages.c.first_answered_at).label("responded"),
+                    func.count(distinct(unique_client_messages.c.client_telegram_id)).label("unique_clients"),
+                    func.avg(
+                        minutes_between(unique_client_messages.c.received_at, unique_client_messages.c.first_answered_at)
+                    ).label("avg_response_time")
+                ).select_from(unique_client_messages)
+            )).one()
+            logger.debug(
+                "[STAT_DEBUG|get_dashboard_overview|Admin] Уникальные сообщения за период",
+                extra=fields(total=totals.total, responded=totals.responded, unique_clients=totals.unique_clients)
+            )
+
+            total_unique_client_messages_count = totals.total
+            # Отвеченное - если хотя бы одна копия получила ответ; остальные (в том числе
+            # удаленные без ответа) считаются пропущенными, чтобы "В обработке" было 0
+            responded_unique_client_messages_count = totals.responded
+            missed_unique_client_messages_count = totals.total - totals.responded
+            total_unique_clients = totals.unique_clients
+            # Время ответа - от получения до первого ответа, по отвеченным уникальным сообщениям
+            avg_response_time = float(totals.avg_response_time or 0)
             
             # Количество активных сотрудников (можно взять из старой логики, если она корректна)
-            active_employees_result = await self.db.execute(select(Employee).where(Employee.is_active == True))
-            active_employees_count = len(active_employees_result.scalars().all())
+            active_employees_count = await self.db.scalar(
+                select(func.count(Employee.id)).where(Employee.is_active == True)
+            )
             
             # Срочные сообщения (без ответа более 30 минут) - всегда актуальные (можно использовать старую, если она не зависит от суммирования)
             urgent_messages = await self._get_urgent_messages_count() # Эта функция, вероятно, смотрит на текущие неотвеченные
@@ -312,45 +392,7 @@ class StatisticsService:
         end_date: Optional[date] = None
     ) -> tuple[datetime, datetime]:
         """Получить даты начала и конца периода"""
-        
-        if start_date and end_date:
-            return (
-                datetime.combine(start_date, datetime.min.time()),
-                datetime.combine(end_date, datetime.max.time())
-            )
-        
-        now = datetime.utcnow()
-        today = now.date()
-        
-        if period == "today":
-            # Используем текущее время как конец периода
-            return (
-                datetime.combine(today, datetime.min.time()),
-                now  # Текущее время
-            )
-        elif period == "week":
-            start = today - timedelta(days=today.weekday())  # Понедельник
-            end = start + timedelta(days=6)  # Воскресенье
-            return (
-                datetime.combine(start, datetime.min.time()),
-                datetime.combine(end, datetime.max.time())
-            )
-        elif period == "month":
-            start = today.replace(day=1)  # Первое число месяца
-            if today.month == 12:
-                end = date(today.year + 1, 1, 1) - timedelta(days=1)
-            else:
-                end = date(today.year, today.month + 1, 1) - timedelta(days=1)
-            return (
-                datetime.combine(start, datetime.min.time()),
-                datetime.combine(end, datetime.max.time())
-            )
-        else:
-            # По умолчанию - сегодня
-            return (
-                datetime.combine(today, datetime.min.time()),
-                now  # Текущее время
-            )
+        return get_period_dates(period, start_date, end_date)
     
     async def _get_messages_for_period(
         self, 
@@ -372,23 +414,256 @@ class StatisticsService:
         messages = result.scalars().all()
         return messages
     
+    async def _collect_stats(
+        self,
+        period_start: datetime,
+        period_end: datetime,
+        employee_ids: List[int],
+        include_addressed: bool = False
+    ) -> Dict[int, Dict[str, Any]]:
+        """Статистика сотрудников за период: {employee_id: словарь как у _calculate_stats}.
+
+        Полные прошедшие дни, покрытые суточной сводкой, читаются из daily_employee_stats,
+        остальное (сегодня и дни до начала сводки) - из messages.
+        include_addressed - один сотрудник, учитываются и адресованные ему сообщения.
+        """
+        if not employee_ids:
+            return {}
+        rollup_days = await self._get_rollup_days(period_start, period_end)
+
+        raw_filters = [Message.received_at >= period_start, Message.received_at <= period_end]
+        if rollup_days:
+            first_day, last_day = rollup_days
+            raw_filters.append(or_(
+                Message.received_at < datetime.combine(first_day, datetime.min.time()),
+                Message.received_at >= datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+            ))
+        if include_addressed:
+            employee_id = employee_ids[0]
+            raw_employee = literal(employee_id).label("employee_id")
+            raw_filters.append(or_(
+                Message.employee_id == employee_id,
+                Message.addressed_to_employee_id == employee_id
+            ))
+            raw_query = select(raw_employee, *message_stats_aggregates(employee_id)).where(*raw_filters)
+        else:
+            raw_employee = Message.employee_id
+            raw_filters.append(Message.employee_id.in_(employee_ids))
+            raw_query = (
+                select(Message.employee_id, *message_stats_aggregates(Message.employee_id))
+                .where(*raw_filters)
+                .group_by(Message.employee_id)
+            )
+        raw_rows = [row for row in (await self.db.execute(raw_query)).all() if row.total_messages]
+        if not rollup_days:
+            return {row.employee_id: self._build_stats(row) for row in raw_rows}
+
+        # Суммируем счетчики сводки и сообщений вне ее
+        counters: Dict[int, Dict[str, Any]] = {}
+        rollup_result = await self.db.execute(
+            select(
+                DailyEmployeeStats.employee_id,
+                *(func.sum(getattr(DailyEmployeeStats, name)).label(name) for name in COUNTERS)
+            )
+            .where(
+                DailyEmployeeStats.employee_id.in_(employee_ids),
+                DailyEmployeeStats.date.between(first_day, last_day)
+            )
+            .group_by(DailyEmployeeStats.employee_id)
+        )
+        for row in [*raw_rows, *rollup_result.all()]:
+            employee_counters = counters.setdefault(row.employee_id, dict.fromkeys(COUNTERS, 0))
+            for name in COUNTERS:
+                employee_counters[name] += getattr(row, name) or 0
+
+        # Уникальные клиенты - объединение множеств клиентов из сводки и из сообщений
+        clients = union(
+            select(raw_employee, Message.client_telegram_id.label("client_telegram_id"))
+            .where(*raw_filters, Message.client_telegram_id.isnot(None)),
+            select(DailyEmployeeClient.employee_id, DailyEmployeeClient.client_telegram_id)
+            .where(
+                DailyEmployeeClient.employee_id.in_(employee_ids),
+                DailyEmployeeClient.date.between(first_day, last_day)
+            )
+        ).subquery()
+        clients_result = await self.db.execute(
+            select(clients.c.employee_id, func.count()).group_by(clients.c.employee_id)
+        )
+        unique_clients = dict(clients_result.all())
+
+        return {
+            employee_id: self._build_stats(SimpleNamespace(
+                **employee_counters,
+                unique_clients=unique_clients.get(employee_id, 0)
+            ))
+            for employee_id, employee_counters in counters.items()
+        }
+
+    async def _collect_stats_multi(
+        self,
+        employee_id: int,
+        ranges: Dict[str, Tuple[datetime, datetime]]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Статистика одного сотрудника за несколько периодов (как _collect_stats с include_addressed).
+
+        Агрегаты каждого периода отличаются префиксом p<номер>_ и считаются только по
+        строкам, попавшим в часть периода вне суточной сводки.
+        """
+        covered_from = await get_covered_from(self.db)
+        prefixes = {period: f"p{index}_" for index, period in enumerate(ranges)}
+        rollups = {period: self._rollup_days(*bounds, covered_from) for period, bounds in ranges.items()}
+
+        raw_conditions = {}
+        for period, (period_start, period_end) in ranges.items():
+            conditions = [Message.received_at >= period_start, Message.received_at <= period_end]
+            if rollups[period]:
+                first_day, last_day = rollups[period]
+                conditions.append(or_(
+                    Message.received_at < datetime.combine(first_day, datetime.min.time()),
+                    Message.received_at >= datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+                ))
+            raw_conditions[period] = and_(*conditions)
+        raw_filters = [
+            or_(Message.employee_id == employee_id, Message.addressed_to_employee_id == employee_id),
+            Message.received_at >= min(start for start, _ in ranges.values()),
+            Message.received_at <= max(end for _, end in ranges.values()),
+            or_(*raw_conditions.values())
+        ]
+        aggregates = [
+            aggregate
+            for period, condition in raw_conditions.items()
+            for aggregate in message_stats_aggregates(employee_id, condition, prefixes[period])
+        ]
+        raw_row = (await self.db.execute(select(*aggregates).where(*raw_filters))).one()._mapping
+
+        def part(row, prefix: str) -> Dict[str, Any]:
+            return {name[len(prefix):]: value for name, value in row.items() if name.startswith(prefix)}
+
+        rollup_periods = {period: days for period, days in rollups.items() if days}
+        if not rollup_periods:
+            return {period: self._build_stats(SimpleNamespace(**part(raw_row, prefix))) for period, prefix in prefixes.items()}
+
+        # Счетчики суточной сводки за дни каждого периода
+        rollup_span = (
+            min(first for first, _ in rollup_periods.values()),
+            max(last for _, last in rollup_periods.values())
+        )
+        rollup_row = (await self.db.execute(
+            select(*(
+                func.sum(case((DailyEmployeeStats.date.between(first_day, last_day), getattr(DailyEmployeeStats, name))))
+                .label(f"{prefixes[period]}{name}")
+                for period, (first_day, last_day) in rollup_periods.items()
+                for name in COUNTERS
+            ))
+            .where(DailyEmployeeStats.employee_id == employee_id, DailyEmployeeStats.date.between(*rollup_span))
+        )).one()._mapping
+
+        # Уникальные клиенты - объединение клиентов из сообщений и из сводки с признаками периодов
+        def rollup_flag(period: str):
+            if period not in rollup_periods:
+                return literal(0)
+            return case((DailyEmployeeClient.date.between(*rollup_periods[period]), 1), else_=0)
+
+        clients = union(
+            select(
+                Message.client_telegram_id.label("client_telegram_id"),
+                *(case((condition, 1), else_=0).label(prefixes[period]) for period, condition in raw_conditions.items())
+            ).where(*raw_filters, Message.client_telegram_id.isnot(None)),
+            select(
+                DailyEmployeeClient.client_telegram_id,
+                *(rollup_flag(period).label(prefixes[period]) for period in ranges)
+            ).where(DailyEmployeeClient.employee_id == employee_id, DailyEmployeeClient.date.between(*rollup_span))
+        ).subquery()
+        clients_row = (await self.db.execute(
+            select(*(
+                func.count(distinct(case((clients.c[prefix] == 1, clients.c.client_telegram_id)))).label(prefix)
+                for prefix in prefixes.values()
+            ))
+        )).one()._mapping
+
+        stats_by_period = {}
+        for period, prefix in prefixes.items():
+            raw = part(raw_row, prefix)
+            rollup = part(rollup_row, prefix)
+            counters = {name: (raw.get(name) or 0) + (rollup.get(name) or 0) for name in COUNTERS}
+            stats_by_period[period] = self._build_stats(SimpleNamespace(**counters, unique_clients=clients_row[prefix]))
+        return stats_by_period
+
+    async def _get_rollup_days(self, period_start: datetime, period_end: datetime) -> Optional[tuple]:
+        """Полные дни периода, которые можно взять из суточной сводки: (первый, последний) или None"""
+        return self._rollup_days(period_start, period_end, await get_covered_from(self.db))
+
+    @staticmethod
+    def _rollup_days(period_start: datetime, period_end: datetime, covered_from: Optional[date]) -> Optional[tuple]:
+        if not covered_from:
+            return None
+        first_day = period_start.date()
+        if period_start.time() != datetime.min.time():
+            first_day += timedelta(days=1)
+        last_day = period_end.date()
+        if period_end.time() != datetime.max.time():
+            last_day -= timedelta(days=1)
+        # Сегодняшний день всегда считается по сообщениям
+        first_day = max(first_day, covered_from)
+        last_day = min(last_day, datetime.utcnow().date() - timedelta(days=1))
+        return (first_day, last_day) if first_day <= last_day else None
+
+    def _build_stats(self, row) -> Dict[str, Any]:
+        """Собрать словарь статистики из строки агрегатов message_stats_aggregates"""
+        total_messages = row.total_messages or 0
+        if not total_messages:
+            return self._empty_stats()
+        
+        responded_messages = row.responded_messages or 0
+        deleted_messages = row.deleted_messages or 0
+        answered_by_others = row.answered_by_others or 0
+        
+        # Пропущенные = всего - отвечено мной - удалено - отвечено другими
+        missed_messages = max(0, total_messages - responded_messages - deleted_messages - answered_by_others)
+        
+        response_time_count = row.response_time_count or 0
+        avg_response_time = row.response_time_sum / response_time_count if response_time_count else None
+        
+        # Эффективность = (отвечено мной + удалено + отвечено другими) / всего * 100
+        processed_messages = responded_messages + deleted_messages + answered_by_others
+        response_rate = processed_messages / total_messages * 100
+        
+        return {
+            "total_messages": total_messages,
+            "responded_messages": responded_messages,
+            "missed_messages": missed_messages,
+            "deleted_messages": deleted_messages,
+            "unique_clients": row.unique_clients or 0,
+            "avg_response_time": avg_response_time,
+            "exceeded_15_min": row.exceeded_15_min or 0,
+            "exceeded_30_min": row.exceeded_30_min or 0,
+            "exceeded_60_min": row.exceeded_60_min or 0,
+            "response_rate": response_rate,
+            "efficiency_percent": response_rate
+        }
+    
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            "total_messages": 0,
+            "responded_messages": 0,
+            "missed_messages": 0,
+            "deleted_messages": 0,
+            "unique_clients": 0,
+            "avg_response_time": None,
+            "exceeded_15_min": 0,
+            "exceeded_30_min": 0,
+            "exceeded_60_min": 0,
+            "response_rate": 0,
+            "efficiency_percent": 0
+        }
+    
     def _calculate_stats(self, messages: List[Message]) -> Dict[str, Any]:
-        """Вычислить статистику по списку сообщений с учетом answered_by_employee_id"""
+        """Вычислить статистику по списку сообщений с учетом answered_by_employee_id.
+        Эталонная реализация на Python для сверки с message_stats_aggregates (см. check_statistics.py)."""
         
         if not messages:
-            return {
-                "total_messages": 0,
-                "responded_messages": 0,
-                "missed_messages": 0,
-                "deleted_messages": 0,
-                "unique_clients": 0,
-                "avg_response_time": None,
-                "exceeded_15_min": 0,
-                "exceeded_30_min": 0,
-                "exceeded_60_min": 0,
-                "response_rate": 0,
-                "efficiency_percent": 0
-            }
+            return self._empty_stats()
         
         # Получаем employee_id первого сообщения (все сообщения одного сотрудника)
         employee_id = messages[0].employee_id
@@ -454,8 +729,8 @@ class StatisticsService:
         
         threshold_time = datetime.utcnow() - timedelta(minutes=30)
         
-        result = await self.db.execute(
-            select(Message).where(
+        return await self.db.scalar(
+            select(func.count(Message.id)).where(
                 and_(
                     Message.answered_by_employee_id.is_(None),  # Никто еще не ответил
                     Message.is_deleted == False,  # Исключаем удаленные сообщения
@@ -464,25 +739,23 @@ class StatisticsService:
                 )
             )
         )
-        return len(result.scalars().all())
     
     async def _get_deferred_messages_count(self) -> int:
         """Получить количество отложенных сообщений из новой таблицы deferred_messages_simple (is_active=1)"""
-        result = await self.db.execute(
-            select(DeferredMessageSimple).where(DeferredMessageSimple.is_active == True)
+        count = await self.db.scalar(
+            select(func.count(DeferredMessageSimple.id)).where(DeferredMessageSimple.is_active == True)
         )
-        messages = result.scalars().all()
-        logger.info(f"[DEFERRED-DEBUG] deferred_messages_simple: найдено {len(messages)} активных записей")
-        return len(messages)
+        logger.debug("[DEFERRED-DEBUG] Активные записи deferred_messages_simple", extra=fields(count=count))
+        return count
     
     async def _get_unanswered_messages_count(self, employee_id: int) -> int:
         """Получить количество неотвеченных сообщений сотрудника (исключая удаленные и отвеченные другими)"""
         
-        result = await self.db.execute(
-            select(Message).where(
+        return await self.db.scalar(
+            select(func.count(Message.id)).where(
                 and_(
                     or_(
-                    Message.employee_id == employee_id,
+                        Message.employee_id == employee_id,
                         Message.addressed_to_employee_id == employee_id
                     ),
                     Message.answered_by_employee_id.is_(None),  # Никто еще не ответил
@@ -491,17 +764,56 @@ class StatisticsService:
                 )
             )
         )
-        return len(result.scalars().all())
     
     async def get_deferred_simple_count(self, employee_id: int, period: str = "today") -> int:
         """Получить количество активных отложенных сообщений из новой таблицы для сотрудника за период"""
         period_start, period_end = self._get_period_dates(period)
+        return await self.db.scalar(
+            select(func.count(DeferredMessageSimple.id)).where(
+                DeferredMessageSimple.is_active == True,
+                DeferredMessageSimple.created_at >= period_start,
+                DeferredMessageSimple.created_at <= period_end
+            )
+        )
+    
+    async def _get_deferred_counts(
+        self,
+        employee_ids: List[int],
+        period_start: datetime,
+        period_end: datetime
+    ) -> Dict[int, int]:
+        """Количество активных отложенных сообщений за период по сотрудникам (один GROUP BY запрос)"""
+        if not employee_ids:
+            return {}
         result = await self.db.execute(
-            select(DeferredMessageSimple).where(
+            select(DeferredMessageSimple.from_user_id, func.count(DeferredMessageSimple.id))
+            .where(
                 DeferredMessageSimple.is_active == True,
+                DeferredMessageSimple.from_user_id.in_(employee_ids),
                 DeferredMessageSimple.created_at >= period_start,
                 DeferredMessageSimple.created_at <= period_end
             )
+            .group_by(DeferredMessageSimple.from_user_id)
         )
-        messages = result.scalars().all()
-        return len(messages)
\ No newline at end of file
+        return {from_user_id: count for from_user_id, count in result.all()}
+
+    async def _get_deferred_counts_multi(
+        self,
+        employee_id: int,
+        ranges: Dict[str, Tuple[datetime, datetime]]
+    ) -> Dict[str, int]:
+        """Количество активных отложенных сообщений сотрудника по периодам (один запрос)"""
+        created_at = DeferredMessageSimple.created_at
+        row = (await self.db.execute(
+            select(*(
+                func.sum(case((and_(created_at >= period_start, created_at <= period_end), 1), else_=0)).label(f"p{index}")
+                for index, (period_start, period_end) in enumerate(ranges.values())
+            ))
+            .where(
+                DeferredMessageSimple.is_active == True,
+                DeferredMessageSimple.from_user_id == employee_id,
+                created_at >= min(start for start, _ in ranges.values()),
+                created_at <= max(end for _, end in ranges.values())
+            )
+        )).one()
+        return {period: count or 0 for period, count in zip(ranges, row)}
\ No newline at end of file